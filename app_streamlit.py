@@ -8,7 +8,8 @@ _os.environ["STREAMLIT_SERVER_FILE_WATCHER_TYPE"] = "none"
 _os.environ["STREAMLIT_SERVER_HEADLESS"] = "true"
 
 import os
-from typing import List, Tuple, Sequence, Dict
+import time
+from typing import List, Sequence, Dict
 import streamlit as st
 from dotenv import load_dotenv
 from collections import OrderedDict
@@ -16,15 +17,27 @@ from pathlib import Path
 import glob
 
 from src.settings import SETTINGS
-from src.rag import ingest_pdfs, retrieve_top_k
-from src.llm_router import EmbeddingsCloud, EmbeddingsLocal, LLMCloud, LiteLocal
-
-# exportar conversa (se existir)
-try:
-    from src.export_pdf import export_chat_pdf
-    _EXPORT_OK = True
-except Exception:
-    _EXPORT_OK = False
+from src.rag import collection_for, retrieve_top_k, embed_query
+from src.jobs import get_job_queue
+from src.answer_cache import AnswerKey, get_answer_cache, memory_tag
+from src.embed_cache import get_embedding_cache
+from src.tracing import TRACER, record, span
+from src.context_packer import pack_contexts
+from src.conversation import ASSISTANT, USER, get_conversation_store, rewrite_query, update_memory
+from src.llm_router import (
+    EmbeddingsCloud,
+    LiteLocal,
+    StreamTiming,
+    timed_stream,
+    get_embeddings_cloud,
+    get_embeddings_local,
+    get_llm_cloud,
+    warmup,
+)
+
+# exportar conversa (se existir); o reportlab só é importado ao exportar
+import importlib.util
+_EXPORT_OK = importlib.util.find_spec("reportlab") is not None
 
 
 # ---------- helpers visuais e de formatação ----------
@@ -58,21 +71,6 @@ def _try_show_logo():
     if not shown:
         st.write("**IDEMA/RN**")
 
-def collection_for(emb, base_name: str) -> str:
-    """Nomeia coleção conforme modo + dimensão dos embeddings (evita 3072×384)."""
-    try:
-        mode_tag = "cloud" if isinstance(emb, EmbeddingsCloud) else "local"
-    except Exception:
-        mode_tag = "cloud"
-    try:
-        v = emb.encode(["__probe__"])
-        if hasattr(v, "tolist"):
-            v = v.tolist()
-        dim = len(v[0])
-    except Exception:
-        dim = 0
-    return f"{base_name}_{mode_tag}_{dim}d"
-
 def format_citations(hits: Sequence[Dict]) -> str:
     """
     Agrupa por documento e lista páginas únicas, ordenadas.
@@ -103,9 +101,91 @@ def format_citations(hits: Sequence[Dict]) -> str:
     return "\n".join(lines)
 
 
+def _render_jobs(job_ids: Sequence[str]) -> None:
+    """Andamento das indexações desta sessão; atualiza sozinho enquanto houver job ativo."""
+    queue = get_job_queue()
+    polling = any(j.active for j in queue.list(job_ids, limit=5))
+
+    @st.fragment(run_every=2.0 if polling else None)
+    def _panel() -> None:
+        jobs = queue.list(job_ids, limit=5)
+        st.markdown('<div class="sb-title">Indexações</div>', unsafe_allow_html=True)
+        for job in jobs:
+            where = f"{job.files_total} arquivo(s) · {job.tipo_licenca}/{job.tipo_empreendimento}"
+            if job.status == "queued":
+                st.caption(f"⏳ Na fila — {where}")
+            elif job.status == "running":
+                st.progress(
+                    min(1.0, job.files_done / max(1, job.files_total)),
+                    text=f"{job.files_done}/{job.files_total} arquivo(s) · {job.chunks} trechos inseridos",
+                )
+            elif job.status == "done":
+                rep = job.report
+                st.success(
+                    f"✅ {job.chunks} trechos inseridos em **{job.collection}** ({job.elapsed:.0f} s) — "
+                    f"documentos: {rep.get('docs_added', 0)} novos, {rep.get('docs_replaced', 0)} atualizados, "
+                    f"{rep.get('docs_skipped', 0)} sem mudança; páginas: {rep.get('pages_added', 0)} novas, "
+                    f"{rep.get('pages_replaced', 0)} substituídas, {rep.get('pages_skipped', 0)} puladas."
+                )
+            else:
+                st.error(f"Falha na indexação ({where}): {job.error}")
+        if polling and not any(j.active for j in jobs):
+            st.rerun()  # terminou: execução completa para parar a atualização automática
+
+    _panel()
+
+
+def _render_metrics() -> None:
+    """Painel do admin: p50/p95 recentes por etapa, acertos dos caches e exportação."""
+    if not TRACER.enabled:
+        st.caption("Medição desligada (TRACING=0).")
+    snap = TRACER.snapshot()
+    if snap:
+        st.dataframe(
+            [
+                {"etapa": name, "n": s["count"], "p50 ms": s["p50_ms"], "p95 ms": s["p95_ms"], "erros": s["errors"]}
+                for name, s in snap.items()
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.caption("Nenhuma medição ainda.")
+
+    rates = []
+    ac = get_answer_cache()
+    if ac is not None:
+        s = ac.stats()
+        rates.append(f"respostas {s['hit_rate']:.0%} ({s['hits']}/{s['hits'] + s['misses']})")
+    ec = get_embedding_cache()
+    if ec is not None:
+        s = ec.stats()
+        rates.append(f"embeddings {s['hit_rate']:.0%} ({s['hits']}/{s['hits'] + s['misses']})")
+    if rates:
+        st.caption("Acertos de cache: " + " · ".join(rates))
+
+    c1, c2 = st.columns(2)
+    c1.download_button("JSON", TRACER.to_json(), file_name="metricas.json", mime="application/json")
+    c2.download_button("Prometheus", TRACER.to_prometheus(), file_name="metricas.prom", mime="text/plain")
+    if st.button("Zerar medições"):
+        TRACER.reset()
+        st.rerun()
+
+
+@st.cache_resource(show_spinner=False)
+def _warmup_pool() -> bool:
+    """Uma vez por processo: carrega encoders/clientes no pool compartilhado e retoma as indexações interrompidas."""
+    api_key = st.secrets.get("OPENAI_API_KEY", "") or None
+    warmup(api_key=api_key)
+    # sem isto, os jobs de um processo anterior só voltariam na primeira indexação da sessão
+    get_job_queue(app_key=api_key)
+    return True
+
+
 # ---------- bootstrap ----------
 load_dotenv()
 st.set_page_config(page_title="Pareceres Técnicos — NUPETR/IDEMA-RN", page_icon="🧰", layout="wide")
+_warmup_pool()
 
 # ---------- GATE por senha (APP_PASSCODE nos Secrets) ----------
 REQUIRED_CODE = st.secrets.get("APP_PASSCODE", "")
@@ -169,6 +249,22 @@ with st.sidebar:
     st.markdown('<div class="sb-title">Modo</div>', unsafe_allow_html=True)
     mode = st.radio(" ", ["OpenAI (com chave)", "Extrativa (sem LLM)"], index=0, label_visibility="collapsed")
 
+    # Busca (vetorial pura ou combinada com palavras-chave/BM25)
+    _SEARCH_MODES = {
+        "Híbrida (significado + termos exatos)": "hybrid",
+        "Só vetorial": "vector",
+        "Vetorial diversificada (sem trechos repetidos)": "mmr",
+    }
+    _modes = list(_SEARCH_MODES.values())
+    search_label = st.selectbox(
+        "Busca",
+        list(_SEARCH_MODES),
+        index=_modes.index(SETTINGS.retrieval_mode if SETTINGS.retrieval_mode in _modes else "vector"),
+        help="A híbrida também encontra códigos de licença, nomes de poços e números de processo exatos; "
+        "a diversificada evita trechos quase iguais e junta os vizinhos da mesma página.",
+    )
+    search_mode = _SEARCH_MODES[search_label]
+
     st.markdown('<div class="spacer"></div>', unsafe_allow_html=True)
 
     # Chave da OpenAI (opcional) — com explicação e quem paga
@@ -207,40 +303,69 @@ with st.sidebar:
         if not uploads:
             st.warning("Envie pelo menos um PDF.")
         else:
-            pairs = [(f.name, f.read()) for f in uploads]
-
             # Backend: embeddings para indexar
             if mode.startswith("OpenAI"):
                 if not SETTINGS.openai_api_key:
                     st.error("Forneça uma OPENAI_API_KEY ou selecione o modo 'Extrativa (sem LLM)'.")
                     emb = None
                 else:
-                    emb = EmbeddingsCloud()
+                    emb = get_embeddings_cloud(api_key=SETTINGS.openai_api_key)
             else:  # Extrativa
-                emb = EmbeddingsCloud() if SETTINGS.openai_api_key else EmbeddingsLocal()
+                emb = get_embeddings_cloud(api_key=SETTINGS.openai_api_key) if SETTINGS.openai_api_key else get_embeddings_local()
 
             if emb is not None:
                 try:
                     coll_name = collection_for(emb, SETTINGS.milvus_collection)
                     st.session_state["coll_name"] = coll_name
-
-                    with st.spinner(f"Processando e indexando em **{coll_name}**..."):
-                        n = ingest_pdfs(
-                            encoder=emb,  # type: ignore
-                            files=pairs,
-                            tipo_licenca=tipo_lic or "—",
-                            tipo_empreendimento=tipo_emp or "—",
-                            collection_name=coll_name,
-                        )
-                    st.success(f"✅ {n} trechos inseridos em **{coll_name}**.")
+                    # grava os uploads em disco e enfileira: a indexação roda fora desta execução do script
+                    job_id = get_job_queue().submit(
+                        ((f.name, f.getvalue()) for f in uploads),
+                        tipo_licenca=tipo_lic or "—",
+                        tipo_empreendimento=tipo_emp or "—",
+                        collection_name=coll_name,
+                        embeddings="cloud" if isinstance(emb, EmbeddingsCloud) else "local",
+                        model=emb.model if isinstance(emb, EmbeddingsCloud) else emb.model_name,
+                        api_key=SETTINGS.openai_api_key or None,
+                    )
+                    st.session_state.setdefault("jobs", []).append(job_id)
+                    st.toast(f"📥 {len(uploads)} PDF(s) na fila de indexação de **{coll_name}**.")
                 except Exception as e:
-                    st.error(f"Falha na indexação: {e}")
+                    st.error(f"Falha ao enfileirar a indexação: {e}")
                     st.exception(e)
 
+    if st.session_state.get("jobs"):
+        _render_jobs(st.session_state["jobs"])
+
     if st.button("🧹 Limpar histórico", use_container_width=True):
-        st.session_state.history = []
+        if "conv_id" in st.session_state:
+            get_conversation_store().clear(st.session_state.conv_id)
+            del st.session_state["conv_id"]
         st.success("Histórico limpo.")
 
+    _cache = get_answer_cache()
+    if _cache is not None:
+        with st.expander("📊 Cache de respostas"):
+            cs = _cache.stats()
+            st.caption(
+                f"{cs['entries']} respostas guardadas · acertos {cs['hits']}/{cs['hits'] + cs['misses']} "
+                f"({cs['hit_rate']:.0%}) · despejadas {cs['evictions']} · expiradas {cs['expired']}"
+            )
+
+    # Métricas por etapa (ADMIN_PASSCODE nos Secrets)
+    ADMIN_CODE = st.secrets.get("ADMIN_PASSCODE", "")
+    if ADMIN_CODE:
+        with st.expander("🛠️ Métricas (admin)"):
+            if st.session_state.get("admin_ok"):
+                _render_metrics()
+            else:
+                admin_code = st.text_input("Código de administrador", type="password", key="admin_code")
+                if admin_code:
+                    if admin_code == ADMIN_CODE:
+                        st.session_state.admin_ok = True
+                        st.rerun()
+                    else:
+                        st.error("Código incorreto.")
+
     # ---- Sobre o projeto (AGORA NO SIDEBAR) ----
     st.markdown('<div class="spacer"></div>', unsafe_allow_html=True)
     with st.expander("ℹ️ Sobre este projeto"):
@@ -268,13 +393,18 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ---------- Conversa (ordem corrigida) ----------
-if "history" not in st.session_state:
-    st.session_state.history: List[Tuple[str, str]] = []
+# a transcrição fica no SQLite (src/conversation.py); a sessão guarda só o id,
+# criado na primeira pergunta (sessão sem perguntas não grava nada)
+conversations = get_conversation_store()
+conv_id = st.session_state.get("conv_id")
 
 st.subheader("Conversa")
 
-# render histórico já existente
-for role, msg in st.session_state.history:
+# render só das mensagens mais recentes (o PDF exportado leva a conversa inteira)
+_n_messages = conversations.count(conv_id) if conv_id else 0
+if _n_messages > SETTINGS.conversation_window:
+    st.caption(f"… {_n_messages - SETTINGS.conversation_window} mensagens anteriores (incluídas no PDF exportado)")
+for role, msg in conversations.recent(conv_id, SETTINGS.conversation_window) if conv_id else []:
     with st.chat_message(role):
         st.markdown(msg)
 
@@ -282,8 +412,16 @@ for role, msg in st.session_state.history:
 question = st.chat_input("Digite sua pergunta aqui…")
 
 if question:
-    # 1) mostra a MENSAGEM DO USUÁRIO imediatamente
-    st.session_state.history.append(("user", question))
+    t_question = time.perf_counter()
+    timing = StreamTiming()
+    cached = None
+    packed = None
+
+    # 1) mostra a MENSAGEM DO USUÁRIO imediatamente (a memória é a de antes dela)
+    if not conv_id:
+        conv_id = st.session_state.conv_id = conversations.new_conversation()
+    memory = conversations.memory(conv_id)
+    question_seq = conversations.append(conv_id, USER, question)
     with st.chat_message("user"):
         st.markdown(question)
 
@@ -293,11 +431,15 @@ if question:
             with st.chat_message("assistant"):
                 st.markdown("Defina sua **OPENAI_API_KEY** na barra lateral ou mude para **Extrativa (sem LLM)**.")
             st.stop()
-        emb = EmbeddingsCloud()
-        answerer = LLMCloud()
+        emb = get_embeddings_cloud(api_key=SETTINGS.openai_api_key)
+        answerer = get_llm_cloud(api_key=SETTINGS.openai_api_key)
     else:
-        emb = EmbeddingsCloud() if SETTINGS.openai_api_key else EmbeddingsLocal()
-        answerer = LiteLocal()
+        emb = get_embeddings_cloud(api_key=SETTINGS.openai_api_key) if SETTINGS.openai_api_key else get_embeddings_local()
+        answerer = None
+    coll_name = st.session_state.get("coll_name") or collection_for(emb, SETTINGS.milvus_collection)
+    if answerer is None:
+        answerer = LiteLocal(collection=coll_name)  # frases e IDF do índice desta coleção
+    llm = answerer if hasattr(answerer, "complete") else None  # reescrita/resumo pelo LLM, se houver
 
     # 3) placeholder da resposta (mostra 'pensando...' enquanto busca)
     with st.chat_message("assistant"):
@@ -305,21 +447,57 @@ if question:
         placeholder.markdown("_pensando…_")
 
         try:
-            coll_name = st.session_state.get("coll_name")
-            if not coll_name:
-                coll_name = collection_for(emb, SETTINGS.milvus_collection)
-
-            hits = retrieve_top_k(
-                encoder=emb,  # type: ignore
-                query=question,
-                collection_name=coll_name,
-                top_k=5,
-                expr=f'tipo_licenca == "{tipo_lic or ""}" && tipo_empreendimento == "{tipo_emp or ""}"',
-            )
-            ctx = [h["text"] for h in hits]
-            answer_text = answerer.answer(question, ctx)  # type: ignore
-
-            refs_block = format_citations(hits)
+            # continuação ("e para a LO?") vira pergunta completa: busca, cache e resposta usam ela
+            query = rewrite_query(question, memory, llm)
+            if query != question:
+                conversations.set_query(conv_id, question_seq, query)
+                st.caption(f"🔎 Entendido como: “{query}”")
+
+            expr = f'tipo_licenca == "{tipo_lic or ""}" && tipo_empreendimento == "{tipo_emp or ""}"'
+            answer_tag = f"openai:{answerer.model}" if hasattr(answerer, "model") else "extrativa"
+            cache = get_answer_cache()
+            # o LLM recebe a memória da conversa (a extrativa a ignora): ela entra na chave
+            memory_block = "" if isinstance(answerer, LiteLocal) else memory.prompt_block()
+            cache_key = AnswerKey(coll_name, expr, f"{answer_tag}/{search_mode}", memory_tag(memory_block))
+            qvec = embed_query(emb, query)  # type: ignore
+            cached = cache.lookup(cache_key, qvec) if cache is not None else None
+
+            if cached is not None:
+                # pergunta equivalente já respondida: sem busca e sem LLM
+                hits, answer_text = cached.hits, cached.answer
+                st.caption(f"♻️ Resposta reaproveitada de uma pergunta semelhante: “{cached.question}”")
+            else:
+                generation = cache.generation(coll_name) if cache is not None else 0
+                hits = retrieve_top_k(
+                    encoder=emb,  # type: ignore
+                    query=query,
+                    collection_name=coll_name,
+                    top_k=5,
+                    mode=search_mode,
+                    expr=expr,
+                    qvec=qvec,
+                )
+                if isinstance(answerer, LiteLocal):
+                    ctx = [h["text"] for h in hits]
+                else:
+                    # prompt do LLM: trechos sem sobreposição, por escore, dentro do orçamento de tokens
+                    ctx = packed = pack_contexts(hits)
+                # resposta em fluxo: o placeholder mostra o texto parcial (no máx. ~20 atualizações/s)
+                parts: List[str] = []
+                last_draw = 0.0
+                stream = answerer.stream_answer(query, ctx, memory=memory_block)  # type: ignore
+                for piece in timed_stream(stream, timing, start=t_question):
+                    parts.append(piece)
+                    now = time.perf_counter()
+                    if now - last_draw >= 0.05:
+                        placeholder.markdown("".join(parts) + "▌")
+                        last_draw = now
+                answer_text = "".join(parts).strip()
+                if cache is not None:
+                    cache.put(cache_key, query, qvec, answer_text, hits, generation)
+
+            with span("app.citations"):
+                refs_block = format_citations(hits)
             if refs_block:
                 final = f"{answer_text}\n\n**Fontes consultadas:**\n{refs_block}"
             else:
@@ -328,19 +506,47 @@ if question:
             final = f"Falha ao buscar/gerar resposta: {e}"
             st.exception(e)
 
-        # 4) substitui o placeholder pela resposta final
+        # 4) substitui o placeholder pela resposta final (com as fontes)
         placeholder.markdown(final)
+        if timing.total is None:  # cache ou falha: só o tempo total
+            timing.total = time.perf_counter() - t_question
+        record("app.answer_total", timing.total, cached=int(cached is not None))
+        if timing.ttft is not None:
+            record("app.answer_ttft", timing.ttft)
+        timings = st.session_state.setdefault("timings", [])
+        timings.append(
+            {
+                "question": question,
+                "ttft_s": timing.ttft,
+                "total_s": timing.total,
+                "cached": cached is not None,
+                "context_tokens": packed.tokens if packed is not None else None,
+                "context_tokens_saved": packed.saved_tokens if packed is not None else None,
+            }
+        )
+        del timings[: -SETTINGS.conversation_window]
+        st.caption(
+            (f"1º trecho em {timing.ttft:.2f} s · " if timing.ttft is not None else "")
+            + f"total {timing.total:.2f} s"
+            + (f" · contexto {packed.tokens} tokens ({packed.saved_tokens:+d} economizados)" if packed is not None else "")
+        )
 
-    # 5) salva a resposta no histórico
-    st.session_state.history.append(("assistant", final))
+    # 5) salva a resposta e dobra no resumo o que saiu das mensagens recentes
+    conversations.append(conv_id, ASSISTANT, final)
+    try:
+        update_memory(conversations, conv_id, llm)
+    except Exception:
+        pass  # sem resumo novo nesta vez; a próxima pergunta tenta de novo
 
 # ---------- Exportar ----------
-if _EXPORT_OK:
+if _EXPORT_OK and conv_id:
     st.markdown('<div class="spacer"></div>', unsafe_allow_html=True)
     if st.button("🧾 Exportar conversa (PDF)"):
         try:
+            from src.export_pdf import export_chat_pdf
+
             out = "conversa_nupetr.pdf"
-            export_chat_pdf(out, st.session_state.history, logo_path=None)
+            export_chat_pdf(out, conversations.messages(conv_id), logo_path=None)
             with open(out, "rb") as f:
                 st.download_button("Baixar PDF", data=f.read(), file_name=out, mime="application/pdf")
         except Exception as e:
@@ -0,0 +1 @@
+"""Benchmarks offline (servidor OpenAI falso, encoder determinístico)."""
@@ -0,0 +1,138 @@
+# bench/batching.py
+"""
+N sessões simultâneas fazendo perguntas: cada pergunta sozinha × micro-lotes
+(src/batcher.py) de embeddings e buscas no armazenamento local.
+
+O encoder imita um SentenceTransformer na CPU: custo fixo por chamada + custo
+por texto, uma chamada de cada vez (o modelo ocupa todos os núcleos). Confere
+também que os hits com e sem lotes são os mesmos; sai com código != 0 se não forem.
+
+    python -m bench.batching --sessions 16 --queries 20 --docs 20000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+
+class CpuLikeEncoder:
+    model_name = "cpu-like"
+
+    def __init__(self, dim: int = 384, call_ms: float = 8.0, item_ms: float = 0.4):
+        self.dim = dim
+        self.call_s = call_ms / 1000.0
+        self.item_s = item_ms / 1000.0
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def encode(self, texts):
+        import numpy as np
+
+        with self._lock:
+            self.calls += 1
+            time.sleep(self.call_s + self.item_s * len(texts))
+        out = np.stack(
+            [np.random.default_rng(zlib.crc32(t.encode())).standard_normal(self.dim).astype(np.float32) for t in texts]
+        )
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+def _run(sessions: int, queries: int, filters: int, enc, name: str):
+    import numpy as np
+
+    from src.rag import retrieve_top_k
+
+    lat, results = [], {}
+    lock = threading.Lock()
+    start = threading.Barrier(sessions + 1)
+
+    def session(s: int) -> None:
+        expr = f'tipo_licenca == "T{s % filters}"' if filters > 1 else None
+        start.wait()
+        for j in range(queries):
+            q = f"sessão {s} pergunta {j} sobre condicionantes"
+            t0 = time.perf_counter()
+            hits = retrieve_top_k(enc, q, name, top_k=5, expr=expr, mode="vector")
+            dt = (time.perf_counter() - t0) * 1000
+            with lock:
+                lat.append(dt)
+                results[(s, j)] = [(h["fonte"], h["pagina"]) for h in hits]
+
+    threads = [threading.Thread(target=session, args=(s,)) for s in range(sessions)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    stats = {
+        "qps": round(len(lat) / wall, 1),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+    }
+    return stats, results
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=16)
+    ap.add_argument("--queries", type=int, default=20)
+    ap.add_argument("--docs", type=int, default=20_000)
+    ap.add_argument("--filters", type=int, default=2, help="filtros distintos entre as sessões")
+    ap.add_argument("--window-ms", type=float, default=5.0)
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_batching_")
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["EMBED_CACHE_MAX_ROWS"] = "0"
+
+    import numpy as np
+
+    from src import rag
+    from src.vectorstore import get_or_create_collection, insert_records
+
+    enc = CpuLikeEncoder()
+    name = "bench_batching"
+    col = get_or_create_collection(name, enc.dim)
+    rng = np.random.default_rng(0)
+    for s in range(0, args.docs, 5000):
+        n = min(5000, args.docs - s)
+        vecs = rng.standard_normal((n, enc.dim)).astype(np.float32)
+        ids = range(s, s + n)
+        insert_records(
+            col, vecs, [f"trecho {i}" for i in ids], [f"doc{i // 20}.pdf" for i in ids], [i % 20 + 1 for i in ids],
+            [f"T{i % max(1, args.filters)}" for i in ids], ["POÇO"] * n, flush=False,
+        )
+    col.flush()
+
+    report = {"sessions": args.sessions, "queries_per_session": args.queries, "docs": args.docs}
+    runs = {}
+    for label, window in (("single", 0.0), ("batched", args.window_ms)):
+        for b in (rag.QUERY_EMBEDDER, rag.QUERY_SEARCHER):
+            b.window_s = window / 1000.0
+            b.batches = b.items = b.largest = 0
+        enc.calls = 0
+        stats, runs[label] = _run(args.sessions, args.queries, args.filters, enc, name)
+        report[label] = {
+            **stats,
+            "encoder_calls": enc.calls,
+            "embed_batches": rag.QUERY_EMBEDDER.stats(),
+            "search_batches": rag.QUERY_SEARCHER.stats(),
+        }
+
+    report["same_hits"] = runs["single"] == runs["batched"]
+    report["speedup_qps"] = round(report["batched"]["qps"] / max(report["single"]["qps"], 1e-9), 2)
+    print(json.dumps(report, indent=2))
+    if not report["same_hits"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# bench/bm25.py
+"""
+Busca vetorial × BM25 × híbrida (RRF) em um acervo sintético de pareceres,
+com perguntas por códigos exatos (nº de licença, nome de poço) e por assunto.
+
+O encoder denso é um hash de trigramas de caracteres (sem rede nem modelo):
+capta o assunto, mas — como os embeddings reais — confunde códigos parecidos.
+
+    python -m bench.bm25 --docs 20000 --queries 300
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import zlib
+
+TOPICS = [
+    "condicionantes de monitoramento de efluentes e água produzida",
+    "plano de emergência para vazamento de óleo na locação",
+    "gerenciamento de resíduos sólidos e borra oleosa",
+    "recuperação de áreas degradadas após abandono do poço",
+    "emissões atmosféricas de tochas e queimadores",
+    "controle de ruído e vibração durante a perfuração",
+]
+FIELDS = ["Mossoró", "Canto do Amaro", "Estreito", "Alto do Rodrigues", "Macau", "Guamaré"]
+
+
+class TrigramEncoder:
+    model_name = "trigram-hash"
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def encode(self, texts):
+        import numpy as np
+
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            t = f"  {t.lower()} "
+            for j in range(len(t) - 2):
+                out[i, zlib.crc32(t[j : j + 3].encode()) % self.dim] += 1.0
+        out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-9
+        return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=20_000)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_bm25_")
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["EMBED_CACHE_MAX_ROWS"] = "0"
+
+    import numpy as np
+
+    from src.bm25 import get_bm25_index
+    from src.rag import retrieve_top_k
+    from src.vectorstore import get_or_create_collection, insert_records
+
+    rng = np.random.default_rng(0)
+    enc = TrigramEncoder()
+    texts, codes, wells, topics = [], [], [], []
+    for i in range(args.docs):
+        code = f"{2015 + i % 10}-{i:05d}"
+        well = f"{1 + i % 9}-{'MO CAM EST ARG MAC GUA'.split()[i % 6]}-{i % 9973:04d}-RN"
+        topic = int(rng.integers(len(TOPICS)))
+        texts.append(
+            f"Licença de Operação RLO nº {code}. Poço {well}, campo {FIELDS[i % len(FIELDS)]}. "
+            f"O empreendedor deve atender às {TOPICS[topic]}, conforme parecer técnico do NUPETR."
+        )
+        codes.append(code)
+        wells.append(well)
+        topics.append(topic)
+
+    name = "bench_bm25"
+    col = get_or_create_collection(name, enc.dim)
+    lexical = get_bm25_index(name)
+    t0 = time.perf_counter()
+    for s in range(0, args.docs, 2000):
+        part = texts[s : s + 2000]
+        n = len(part)
+        fontes = [f"doc{j}.pdf" for j in range(s, s + n)]
+        insert_records(col, enc.encode(part), part, fontes, [1] * n, ["RLO"] * n, ["POÇO"] * n, flush=False)
+        lexical.add(part, fontes, [1] * n, ["RLO"] * n, ["POÇO"] * n)
+    lexical.optimize(min_segments=2, full=True)  # carga inicial: um segmento por termo
+    build_s = time.perf_counter() - t0
+
+    targets = rng.choice(args.docs, size=args.queries, replace=False)
+    queries = []
+    for j, i in enumerate(targets):
+        if j % 3 == 0:
+            queries.append(("codigo", f"condicionantes da licença {codes[i]}", {f"doc{i}.pdf"}))
+        elif j % 3 == 1:
+            queries.append(("poco", f"situação do poço {wells[i]}", {f"doc{i}.pdf"}))
+        else:  # por assunto: qualquer trecho do mesmo tema é relevante
+            rel = {f"doc{d}.pdf" for d in range(args.docs) if topics[d] == topics[i]}
+            queries.append(("assunto", TOPICS[topics[i]], rel))
+
+    results = {}
+    for mode in ("vector", "lexical", "hybrid"):
+        lat, hit, rr = [], {}, {}
+        for kind, q, rel in queries:
+            t0 = time.perf_counter()
+            hits = retrieve_top_k(enc, q, name, top_k=args.k, mode=mode)
+            lat.append((time.perf_counter() - t0) * 1000)
+            ranks = [r for r, h in enumerate(hits, start=1) if h["fonte"] in rel]
+            hit.setdefault(kind, []).append(1.0 if ranks else 0.0)
+            rr.setdefault(kind, []).append(1.0 / ranks[0] if ranks else 0.0)
+        results[mode] = {
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+            **{f"hit@{args.k}_{kind}": round(float(np.mean(v)), 3) for kind, v in hit.items()},
+            **{f"mrr_{kind}": round(float(np.mean(v)), 3) for kind, v in rr.items()},
+        }
+
+    print(
+        json.dumps(
+            {"docs": args.docs, "queries": args.queries, "build_s": round(build_s, 2), "bm25": lexical.stats(), "results": results},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
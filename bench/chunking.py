@@ -0,0 +1,95 @@
+# bench/chunking.py
+"""
+Quebra antiga (1200 caracteres, 200 de sobreposição) × estrutural (parágrafos/
+frases até CHUNK_MAX_TOKENS, sem cabeçalho/rodapé repetido) no acervo sintético
+de bench/corpus.py: nº de trechos, tokens enviados ao encoder, trechos com texto
+de cabeçalho/rodapé, tempo de ingestão e tamanho do índice local.
+
+O encoder simula o custo de uma API de embeddings proporcional aos tokens
+(--us-per-token) sobre vetores determinísticos.
+
+    python -m bench.chunking --docs 20 --pages 12
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(path) for f in fs)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=12)
+    ap.add_argument("--max-tokens", type=int, default=400)
+    ap.add_argument("--us-per-token", type=float, default=20.0)
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_chunking_")
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["EMBED_CACHE_MAX_ROWS"] = "0"
+    os.environ["CHUNK_MAX_TOKENS"] = str(args.max_tokens)
+
+    from src.rag import ingest_pdfs
+    from src.settings import SETTINGS
+    from src.tokens import count_tokens
+
+    from .corpus import HEADER, make_corpus
+    from .fake_openai import fake_vector
+
+    class CostlyEncoder:
+        model_name = "fake-costly"
+
+        def __init__(self):
+            self.tokens = 0
+            self.texts = []
+
+        def encode(self, texts):
+            n = sum(count_tokens(t) for t in texts)
+            self.tokens += n
+            self.texts.extend(texts)
+            time.sleep(n * args.us_per_token / 1e6)
+            return [fake_vector(t, 128) for t in texts]
+
+    files = make_corpus(args.docs, args.pages)
+    results = {}
+    for chunker in ("chars", "structured"):
+        SETTINGS.chunker = chunker
+        enc = CostlyEncoder()
+        name = f"bench_chunking_{chunker}"
+        t0 = time.perf_counter()
+        rep = ingest_pdfs(enc, files, "RLO", "POÇO", name)
+        elapsed = time.perf_counter() - t0
+        texts = [t for t in enc.texts if t != "__probe__"]
+        results[chunker] = {
+            "chunks": rep.chunks,
+            "embedded_tokens": enc.tokens,
+            "chunks_with_header": sum(HEADER[1] in t for t in texts),
+            "ingest_s": round(elapsed, 2),
+            "index_bytes": _dir_size(os.path.join(SETTINGS.data_dir, "local_store", name)),
+        }
+
+    old, new = results["chars"], results["structured"]
+    print(
+        json.dumps(
+            {
+                "docs": args.docs,
+                "pages": args.docs * args.pages,
+                "results": results,
+                "chunk_reduction": round(1 - new["chunks"] / max(1, old["chunks"]), 3),
+                "token_reduction": round(1 - new["embedded_tokens"] / max(1, old["embedded_tokens"]), 3),
+                "time_reduction": round(1 - new["ingest_s"] / max(1e-9, old["ingest_s"]), 3),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
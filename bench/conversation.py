@@ -0,0 +1,94 @@
+# bench/conversation.py
+"""
+Custo por pergunta ao longo de uma conversa longa (memória de src/conversation.py):
+tokens do histórico no prompt, tempo de memória + reescrita + resumo e tempo
+de leitura da janela mostrada na tela, por faixa de turnos.
+
+Sem rede: reescrita e resumo extrativos (o caminho com LLM tem os mesmos tetos).
+Sai com código != 0 se o último trecho da conversa custar mais que
+--max-growth × o começo.
+
+    python -m bench.conversation --turns 1000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=1000)
+    ap.add_argument("--max-growth", type=float, default=1.5)
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_conv_")
+
+    import numpy as np
+
+    from src.conversation import ASSISTANT, USER, get_conversation_store, rewrite_query, update_memory
+    from src.settings import SETTINGS
+    from src.tokens import count_tokens
+
+    from .corpus import SENTENCES
+
+    store = get_conversation_store()
+    conv = store.new_conversation()
+    rows = []
+    for i in range(args.turns):
+        q = f"qual o prazo da condicionante {i} na RLO?" if i % 3 == 0 else ("e para a LO?" if i % 3 == 1 else "e isso vale para o poço?")
+        answer = "**Resposta extrativa (sem LLM):**\n\n" + "\n".join(f"• {s}" for s in SENTENCES[: 3 + i % 4])
+        answer += "\n\n**Fontes consultadas:**\n- parecer_0001.pdf p. 2"
+
+        t0 = time.perf_counter()
+        memory = store.memory(conv)
+        seq = store.append(conv, USER, q)
+        query = rewrite_query(q, memory)
+        if query != q:
+            store.set_query(conv, seq, query)
+        prompt_tokens = count_tokens(memory.prompt_block())
+        store.append(conv, ASSISTANT, answer)
+        update_memory(store, conv)
+        turn_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        store.recent(conv, SETTINGS.conversation_window)
+        render_ms = (time.perf_counter() - t0) * 1000
+        rows.append((prompt_tokens, turn_ms, render_ms, count_tokens(query)))
+
+    def band(lo: int, hi: int):
+        part = np.array(rows[lo:hi], dtype=np.float64)
+        return {
+            "history_tokens": round(float(part[:, 0].mean()), 1),
+            "memory_ms": round(float(np.median(part[:, 1])), 3),
+            "render_ms": round(float(np.median(part[:, 2])), 3),
+            "query_tokens": round(float(part[:, 3].mean()), 1),
+        }
+
+    step = max(10, args.turns // 10)
+    # o começo conta depois de a janela recente encher
+    first = band(SETTINGS.conversation_recent, SETTINGS.conversation_recent + step)
+    last = band(args.turns - step, args.turns)
+    report = {
+        "turns": args.turns,
+        "messages": store.count(conv),
+        "window": SETTINGS.conversation_window,
+        "recent": SETTINGS.conversation_recent,
+        "summary_tokens": count_tokens(store.memory(conv).summary),
+        "first_turns": first,
+        "last_turns": last,
+    }
+    print(json.dumps(report, indent=2))
+    grew = [k for k in ("history_tokens", "memory_ms", "render_ms", "query_tokens")
+            if last[k] > args.max_growth * max(first[k], 1e-3)]
+    if grew:
+        print("custo por pergunta cresceu com a conversa: " + ", ".join(grew), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench/corpus.py
+"""
+Acervo sintético de PDFs no formato dos documentos do IDEMA (reportlab):
+cabeçalho institucional e rodapé com paginação em toda página, parágrafos
+quebrados em linhas, itens numerados e uma pequena tabela por página.
+"""
+from __future__ import annotations
+
+import io
+import random
+from typing import List, Tuple
+
+HEADER = [
+    "GOVERNO DO ESTADO DO RIO GRANDE DO NORTE",
+    "INSTITUTO DE DESENVOLVIMENTO SUSTENTÁVEL E MEIO AMBIENTE — IDEMA",
+    "Núcleo de Atividades Petrolíferas — NUPETR",
+]
+FOOTER = "Av. Almirante Alexandrino de Alencar, 1468 — Natal/RN · Página {page} de {pages}"
+
+SENTENCES = [
+    "O empreendedor deverá apresentar relatório semestral de monitoramento da água produzida.",
+    "As amostras devem ser coletadas por laboratório acreditado pelo INMETRO.",
+    "O plano de emergência individual deve contemplar cenários de vazamento de óleo na locação.",
+    "Fica proibido o lançamento de efluentes oleosos em corpos hídricos ou no solo.",
+    "A borra oleosa deverá ser destinada a empresa licenciada, com manifesto de transporte de resíduos.",
+    "O abandono do poço seguirá as normas da ANP e o plano de recuperação de área degradada.",
+    "Os queimadores devem operar com chama estável e sem emissão visível de fumaça preta.",
+    "A licença perderá a validade caso as condicionantes não sejam cumpridas nos prazos fixados.",
+    "O responsável técnico deverá manter a anotação de responsabilidade técnica vigente.",
+    "Ruídos e vibrações da sonda de perfuração serão monitorados junto às residências próximas.",
+]
+
+
+def make_pdf(doc_id: int, pages: int, seed: int = 0) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed * 100_003 + doc_id)
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    width, height = A4
+    for page in range(1, pages + 1):
+        y = height - 40
+        c.setFont("Helvetica-Bold", 9)
+        for line in HEADER:
+            c.drawString(50, y, line)
+            y -= 12
+        c.setFont("Helvetica", 10)
+        y -= 14
+        for p in range(3):
+            words = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 6))).split()
+            line: List[str] = []
+            for w in words:  # quebra de linha como no PDF, no meio das frases
+                if len(" ".join(line + [w])) > 95:
+                    c.drawString(50, y, " ".join(line))
+                    y -= 13
+                    line = []
+                line.append(w)
+            c.drawString(50, y, " ".join(line))
+            y -= 24
+        for k in range(1, 4):
+            c.drawString(60, y, f"{k}) Condicionante {doc_id}.{page}.{k}: {rng.choice(SENTENCES)[:80]}")
+            y -= 13
+        y -= 10
+        rows = [("Parâmetro", "Frequência", "Limite"), ("TOG", rng.choice(["mensal", "trimestral"]), f"{rng.randint(10, 30)} mg/L")]
+        rows.append(("pH", rng.choice(["mensal", "semestral"]), f"{rng.randint(5, 6)} a {rng.randint(8, 9)}"))
+        for row in rows:
+            c.drawString(60, y, row[0]); c.drawString(220, y, row[1]); c.drawString(360, y, row[2])
+            y -= 13
+        c.setFont("Helvetica", 8)
+        c.drawString(50, 30, FOOTER.format(page=page, pages=pages))
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def make_corpus(docs: int, pages: int, seed: int = 0) -> List[Tuple[str, bytes]]:
+    return [(f"parecer_{i:04d}.pdf", make_pdf(i, pages, seed)) for i in range(docs)]
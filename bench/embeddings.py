@@ -0,0 +1,86 @@
+# bench/embeddings.py
+"""
+Vazão (trechos/s) do EmbeddingsCloud concorrente vs. o laço serial antigo
+(um request de 64 trechos por vez, com o mesmo retry), contra o servidor falso
+local, com 429 injetados e respostas fora de ordem.
+
+Cada vetor devolvido é comparado com fake_vector(texto); sai com código != 0
+se algum vier trocado, faltando ou diferente.
+
+    python -m bench.embeddings --chunks 2000 --latency 0.05 --error-rate 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .fake_openai import FakeOpenAI, fake_vector
+
+
+def _chunks(n: int):
+    base = "Relatório de monitoramento do poço RLO-{i}: parâmetros de pressão, vazão e resíduos. "
+    return [(base * 4).format(i=i) for i in range(n)]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.05)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    texts = _chunks(args.chunks)
+    with FakeOpenAI(latency=args.latency, error_rate=args.error_rate, shuffle=True) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        from src.llm_router import EmbeddingsCloud
+
+        expected = np.array([fake_vector(t, srv.dim) for t in texts], dtype=np.float32)
+
+        def mismatches(vecs) -> int:
+            got = np.asarray(vecs, dtype=np.float32)
+            if got.shape != expected.shape:
+                return len(texts)
+            return int((~np.isclose(got, expected, atol=1e-6).all(axis=1)).sum())
+
+        # laço serial antigo: BATCH_SIZE=64, uma requisição por vez (com retry, para terminar)
+        serial = EmbeddingsCloud(model="fake", api_key="sk-bench", concurrency=1, max_retries=8)
+        t0 = time.perf_counter()
+        serial_vecs = []
+        for i in range(0, len(texts), 64):
+            serial_vecs.extend(serial._request(texts[i : i + 64]))
+        serial_rate = len(texts) / (time.perf_counter() - t0)
+        serial_rejected = srv.rejected
+
+        # motor concorrente, com retry
+        conc = EmbeddingsCloud(model="fake", api_key="sk-bench", concurrency=args.concurrency, max_retries=8)
+        t0 = time.perf_counter()
+        vecs = conc.encode(texts)
+        conc_rate = len(texts) / (time.perf_counter() - t0)
+
+        bad = {"serial": mismatches(serial_vecs), "concurrent": mismatches(vecs)}
+        print(
+            json.dumps(
+                {
+                    "chunks": len(texts),
+                    "serial_chunks_per_s": round(serial_rate, 1),
+                    "concurrent_chunks_per_s": round(conc_rate, 1),
+                    "speedup": round(conc_rate / max(serial_rate, 1e-9), 2),
+                    "requests": srv.requests,
+                    "rejected_429": {"serial": serial_rejected, "concurrent": srv.rejected - serial_rejected},
+                    "wrong_vectors": bad,
+                },
+                indent=2,
+            )
+        )
+    if any(bad.values()):
+        print("vetores divergentes de fake_vector(texto): " + json.dumps(bad), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
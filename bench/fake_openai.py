@@ -0,0 +1,180 @@
+# bench/fake_openai.py
+"""
+Servidor HTTP local que imita a API da OpenAI (apenas o necessário para os benchmarks):
+- POST /v1/embeddings — vetores determinísticos (hash do texto), latência configurável
+  e uma fração de respostas 429 para exercitar o backoff;
+- POST /v1/chat/completions — resposta determinística (eco das palavras da pergunta),
+  inteira ou em fluxo SSE (stream=true), com atraso até o 1º token e entre tokens.
+
+Uso:
+    with FakeOpenAI(latency=0.05, error_rate=0.1) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import numpy as np
+
+
+def fake_vector(text: str, dim: int) -> List[float]:
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    v /= np.linalg.norm(v) or 1.0
+    return v.tolist()
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        dim: int = 256,
+        latency: float = 0.05,
+        per_input: float = 0.0005,
+        error_rate: float = 0.0,
+        first_token: float = 0.3,
+        per_token: float = 0.02,
+        shuffle: bool = False,
+    ):
+        self.dim = dim
+        self.shuffle = shuffle  # devolve `data` fora de ordem (o cliente deve ordenar por `index`)
+        self.first_token = first_token
+        self.per_token = per_token
+        self.latency = latency
+        self.per_input = per_input
+        self.error_rate = error_rate
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):  # silencioso
+                pass
+
+            def _send(self, status: int, payload: dict, headers: dict | None = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                req = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                if self.path.endswith("/embeddings"):
+                    return fake._embeddings(self, req)
+                if self.path.endswith("/chat/completions"):
+                    return fake._chat(self, req)
+                self._send(404, {"error": {"message": "not found"}})
+
+        return Handler
+
+    def _embeddings(self, h, req: dict) -> None:
+        inputs = req.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.rejected += 1
+            return h._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": "0.05"})
+        time.sleep(self.latency + self.per_input * len(inputs))
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_vector(t, self.dim)}
+            for i, t in enumerate(inputs)
+        ]
+        if self.shuffle:
+            random.shuffle(data)
+        h._send(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": req.get("model", "fake"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    @staticmethod
+    def reply_tokens(req: dict) -> List[str]:
+        """Texto da resposta simulada, já dividido nos pedaços enviados em fluxo."""
+        prompt = " ".join(str(m.get("content", "")) for m in req.get("messages") or [])
+        question = prompt.split("PERGUNTA:", 1)[-1].split("CONTEXTO:", 1)[0].split()
+        words = ["Resposta", "simulada", "para:"] + question[:40]
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _chat(self, h, req: dict) -> None:
+        tokens = self.reply_tokens(req)
+        model = req.get("model", "fake")
+        if not req.get("stream"):
+            time.sleep(self.first_token + self.per_token * len(tokens))
+            return h._send(
+                200,
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                },
+            )
+
+        def event(delta: dict, finish: str | None = None) -> bytes:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+        h.send_response(200)
+        h.send_header("Content-Type", "text/event-stream")
+        h.send_header("Cache-Control", "no-cache")
+        h.end_headers()
+        time.sleep(self.first_token)
+        h.wfile.write(event({"role": "assistant", "content": ""}))
+        for i, tok in enumerate(tokens):
+            if i:
+                time.sleep(self.per_token)
+            h.wfile.write(event({"content": tok}))
+            h.wfile.flush()
+        h.wfile.write(event({}, "stop"))
+        h.wfile.write(b"data: [DONE]\n\n")
+        h.wfile.flush()
+
+    def __enter__(self) -> "FakeOpenAI":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,112 @@
+# bench/import_time.py
+"""
+Tempo de import dos módulos do projeto que o app_streamlit.py carrega, num
+interpretador novo a cada rodada (abertura a frio do Streamlit Cloud).
+
+Sai com código != 0 se:
+- a mediana passar de --budget-ms;
+- algum import pesado (openai, torch, sentence-transformers, pymilvus, sklearn,
+  reportlab, pypdf, streamlit) vier junto — esses só no primeiro uso;
+- o SETTINGS for resolvido no import (st.secrets/ambiente lidos cedo demais).
+
+    python -m bench.import_time --runs 5 --budget-ms 400
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import List
+
+HEAVY = ("openai", "torch", "sentence_transformers", "pymilvus", "sklearn", "reportlab", "pypdf", "streamlit")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+{imports}
+dt = time.perf_counter() - t0
+import src.settings
+print(json.dumps({{
+    "ms": dt * 1000,
+    "heavy": sorted(m for m in {heavy!r} if m in sys.modules),
+    "settings_resolved": getattr(src.settings, "_RESOLVED", True) is not None,
+}}))
+"""
+
+
+def app_modules(path: str = os.path.join(ROOT, "app_streamlit.py")) -> List[str]:
+    """Módulos `src.*` importados no nível de topo do app."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    mods = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and (node.module or "").startswith("src"):
+            mods.append(node.module)
+        elif isinstance(node, ast.Import):
+            mods.extend(a.name for a in node.names if a.name.startswith("src"))
+    return sorted(set(mods))
+
+
+def _slowest(modules: List[str], n: int = 10) -> List[dict]:
+    # -X importtime: "import time: self | cumulative | módulo" no stderr
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {m}" for m in modules)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append({"module": parts[2].strip(), "cumulative_ms": int(parts[1]) / 1000})
+    return sorted(rows, key=lambda r: -r["cumulative_ms"])[:n]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=400.0)
+    args = ap.parse_args()
+
+    modules = app_modules()
+    probe = _PROBE.format(imports="\n".join(f"import {m}" for m in modules), heavy=HEAVY)
+    runs = []
+    for _ in range(max(1, args.runs)):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(out.stderr, file=sys.stderr)
+            sys.exit(2)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    median = statistics.median(r["ms"] for r in runs)
+    heavy = sorted({m for r in runs for m in r["heavy"]})
+    resolved = any(r["settings_resolved"] for r in runs)
+    report = {
+        "modules": modules,
+        "runs_ms": [round(r["ms"], 1) for r in runs],
+        "median_ms": round(median, 1),
+        "budget_ms": args.budget_ms,
+        "heavy_loaded": heavy,
+        "settings_resolved_on_import": resolved,
+        "slowest": _slowest(modules),
+    }
+    print(json.dumps(report, indent=2))
+
+    problems = []
+    if median > args.budget_ms:
+        problems.append(f"import levou {median:.0f} ms (orçamento {args.budget_ms:.0f} ms)")
+    if heavy:
+        problems.append("imports pesados no carregamento: " + ", ".join(heavy))
+    if resolved:
+        problems.append("SETTINGS resolvido no import")
+    if problems:
+        print("\n".join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
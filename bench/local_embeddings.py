@@ -0,0 +1,131 @@
+# bench/local_embeddings.py
+"""
+EmbeddingsLocal (PyTorch, float32) × EmbeddingsOnnx (onnxruntime, int8):
+trechos/s e memória residente, cada um num processo próprio (o RSS de um não
+contamina o do outro), e o cosseno entre os vetores dos dois nos mesmos trechos.
+Sai com código != 0 se o cosseno mínimo ficar abaixo de ONNX_MIN_COSINE.
+
+Precisa de sentence-transformers (torch) e de onnxruntime + tokenizers; a
+exportação para ONNX acontece na primeira execução (DATA_DIR/onnx).
+
+    python -m bench.local_embeddings --chunks 2000 --threads 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rss_mb() -> float:
+    # RSS atual (Linux); fora dele, o pico informado pelo resource
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == "darwin" else 1024)
+
+
+def _texts(n: int, seed: int = 0):
+    from .corpus import SENTENCES
+
+    rng = random.Random(seed)
+    # trechos de tamanhos variados, como os do chunker estrutural
+    return [" ".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 8))) for _ in range(n)]
+
+
+def _worker(backend: str, chunks: int, out_npy: str) -> None:
+    import numpy as np
+
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    if backend == "onnx":
+        from src.llm_router import EmbeddingsOnnx
+
+        enc = EmbeddingsOnnx()
+    else:
+        from src.llm_router import EmbeddingsLocal
+
+        enc = EmbeddingsLocal()
+    load_s = time.perf_counter() - t0
+    rss_loaded = _rss_mb()
+
+    texts = _texts(chunks)
+    enc.encode(texts[:32])  # aquecimento
+    t0 = time.perf_counter()
+    step = getattr(enc, "batch_size", 64)
+    vecs = [np.asarray(enc.encode(texts[i : i + step]), dtype=np.float32) for i in range(0, len(texts), step)]
+    encode_s = time.perf_counter() - t0
+    np.save(out_npy, np.concatenate(vecs))
+    print(
+        json.dumps(
+            {
+                "backend": backend,
+                "load_s": round(load_s, 2),
+                "chunks_per_s": round(chunks / encode_s, 1),
+                "rss_mb_before": round(rss0, 1),
+                "rss_mb_loaded": round(rss_loaded, 1),
+                "rss_mb_after": round(_rss_mb(), 1),
+            }
+        )
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=0, help="ONNX_THREADS (0 = padrão do onnxruntime)")
+    ap.add_argument("--worker", choices=["torch", "onnx"], help=argparse.SUPPRESS)
+    ap.add_argument("--out", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.chunks, args.out)
+        return
+
+    import numpy as np
+
+    from src.onnx_embed import cosine_rows
+    from src.settings import SETTINGS
+
+    tmp = tempfile.mkdtemp(prefix="bench_local_emb_")
+    env = {**os.environ, "ONNX_THREADS": str(args.threads), "EMBED_CACHE_MAX_ROWS": "0"}
+    results = {}
+    for backend in ("torch", "onnx"):
+        out = os.path.join(tmp, f"{backend}.npy")
+        proc = subprocess.run(
+            [sys.executable, "-m", "bench.local_embeddings", "--worker", backend, "--chunks", str(args.chunks), "--out", out],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(2)
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    cos = cosine_rows(np.load(os.path.join(tmp, "torch.npy")), np.load(os.path.join(tmp, "onnx.npy")))
+    report = {
+        "chunks": args.chunks,
+        "onnx_threads": args.threads,
+        **results,
+        "speedup": round(results["onnx"]["chunks_per_s"] / max(results["torch"]["chunks_per_s"], 1e-9), 2),
+        "rss_saved_mb": round(results["torch"]["rss_mb_after"] - results["onnx"]["rss_mb_after"], 1),
+        "cosine_min": round(float(cos.min()), 5),
+        "cosine_mean": round(float(cos.mean()), 5),
+    }
+    print(json.dumps(report, indent=2))
+    if cos.min() < SETTINGS.onnx_min_cosine:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
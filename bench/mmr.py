@@ -0,0 +1,132 @@
+# bench/mmr.py
+"""
+Busca vetorial × MMR (com junção de trechos vizinhos) num acervo sintético
+quebrado pelo chunk_text (1200 caracteres, 200 de sobreposição) e com
+cláusulas copiadas entre pareceres, como nos documentos reais.
+
+Por modo: latência p50/p95, pares quase repetidos no top-k (mesma página com
+sobreposição, ou cosseno ≥ --dup-cosine entre os textos), páginas distintas e
+relevância média. Sai com código != 0 se o MMR devolver mais repetição que a
+busca vetorial.
+
+    python -m bench.mmr --docs 2000 --queries 300 --lambdas 0.5 0.7 0.9
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=2000)
+    ap.add_argument("--pages", type=int, default=3)
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--lambdas", type=float, nargs="+", default=[0.5, 0.7, 0.9])
+    ap.add_argument("--dup-cosine", type=float, default=0.9)
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_mmr_")
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["EMBED_CACHE_MAX_ROWS"] = "0"
+
+    import numpy as np
+
+    from src.context_packer import MIN_OVERLAP_CHARS, suffix_prefix_overlap
+    from src.pdf_utils import chunk_text
+    from src.rag import retrieve_top_k
+    from src.settings import SETTINGS
+    from src.vectorstore import get_or_create_collection, insert_records
+
+    from .bm25 import TOPICS, TrigramEncoder
+    from .corpus import SENTENCES
+
+    rng = random.Random(0)
+    enc = TrigramEncoder()
+    # cláusulas-padrão: reaparecem em muitos pareceres, com o mesmo texto
+    clauses = [
+        f"Condicionante padrão {i}: {TOPICS[i % len(TOPICS)]}. " + " ".join(rng.sample(SENTENCES, 3))
+        for i in range(40)
+    ]
+    name = "bench_mmr"
+    col = get_or_create_collection(name, enc.dim)
+    t0 = time.perf_counter()
+    rows = 0
+    for d in range(args.docs):
+        texts, pages = [], []
+        for p in range(1, args.pages + 1):
+            parts = [rng.choice(clauses) if rng.random() < 0.4 else rng.choice(SENTENCES) for _ in range(40)]
+            for chunk in chunk_text(" ".join(parts)):
+                texts.append(chunk)
+                pages.append(p)
+        n = len(texts)
+        insert_records(col, enc.encode(texts), texts, [f"parecer_{d:05d}.pdf"] * n, pages, ["RLO"] * n, ["POÇO"] * n,
+                       flush=False)
+        rows += n
+    col.flush()
+    build_s = time.perf_counter() - t0
+
+    questions = [rng.choice(TOPICS + SENTENCES).lower().rstrip(".") for _ in range(args.queries)]
+
+    def redundancy(hits):
+        vecs = enc.encode([h["text"] for h in hits])
+        pairs = 0
+        for i in range(len(hits)):
+            for j in range(i + 1, len(hits)):
+                a, b = hits[i], hits[j]
+                same_page = (a["fonte"], a["pagina"]) == (b["fonte"], b["pagina"])
+                overlap = max(suffix_prefix_overlap(a["text"], b["text"]), suffix_prefix_overlap(b["text"], a["text"]))
+                if (same_page and overlap >= MIN_OVERLAP_CHARS) or float(vecs[i] @ vecs[j]) >= args.dup_cosine:
+                    pairs += 1
+        return pairs
+
+    def run(mode):
+        retrieve_top_k(enc, questions[0], name, top_k=args.k, mode=mode)  # aquecimento
+        lat, dups, pages, rel = [], [], [], []
+        for q in questions:
+            t = time.perf_counter()
+            hits = retrieve_top_k(enc, q, name, top_k=args.k, mode=mode)
+            lat.append((time.perf_counter() - t) * 1000)
+            dups.append(redundancy(hits))
+            pages.append(len({(h["fonte"], h["pagina"]) for h in hits}))
+            rel.append(float(np.mean(enc.encode([h["text"] for h in hits]) @ enc.encode([q])[0])) if hits else 0.0)
+        return {
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "dup_pairs_per_query": round(float(np.mean(dups)), 3),
+            "distinct_pages": round(float(np.mean(pages)), 2),
+            "mean_relevance": round(float(np.mean(rel)), 4),
+        }
+
+    results = {"vector": run("vector")}
+    default = SETTINGS.mmr_lambda
+    for lam in args.lambdas:
+        SETTINGS.mmr_lambda = lam
+        results[f"mmr_{lam:g}"] = run("mmr")
+    SETTINGS.mmr_lambda = default
+    base = results["vector"]["p50_ms"]
+    for k, r in results.items():
+        if k != "vector":
+            r["p50_overhead_ms"] = round(r["p50_ms"] - base, 3)
+
+    print(
+        json.dumps(
+            {"docs": args.docs, "chunks": rows, "queries": args.queries, "k": args.k, "build_s": round(build_s, 2),
+             "results": results},
+            indent=2,
+        )
+    )
+    worse = [k for k, r in results.items() if r["dup_pairs_per_query"] > results["vector"]["dup_pairs_per_query"]]
+    if worse:
+        print("MMR com mais repetição que a busca vetorial: " + ", ".join(worse), file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
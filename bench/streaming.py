@@ -0,0 +1,64 @@
+# bench/streaming.py
+"""
+Latência percebida da resposta: LLMCloud.answer() (espera tudo) × stream_answer()
+(tempo até o 1º pedaço), contra o servidor falso local com fluxo SSE.
+Confere também que o texto em fluxo é igual ao da resposta inteira; sai com
+código != 0 se não for.
+
+    python -m bench.streaming --turns 5 --first-token 0.3 --per-token 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from .fake_openai import FakeOpenAI
+
+QUESTIONS = [
+    "Quais documentos são exigidos para a renovação da RLO de poço?",
+    "Qual a periodicidade do monitoramento de água produzida?",
+    "Quem responde pelo plano de emergência individual?",
+]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=5)
+    ap.add_argument("--first-token", type=float, default=0.3)
+    ap.add_argument("--per-token", type=float, default=0.02)
+    args = ap.parse_args()
+
+    with FakeOpenAI(first_token=args.first_token, per_token=args.per_token) as srv:
+        os.environ["OPENAI_BASE_URL"] = srv.base_url
+        from src.llm_router import LLMCloud, LiteLocal, StreamTiming, timed_stream
+
+        llm = LLMCloud(model="fake", api_key="sk-bench")
+        ctx = ["O monitoramento de água produzida é semestral. O plano de emergência é do operador."]
+        rows, mismatches = [], 0
+        for i in range(args.turns):
+            q = QUESTIONS[i % len(QUESTIONS)]
+            t0 = time.perf_counter()
+            full = llm.answer(q, ctx)
+            blocking = time.perf_counter() - t0
+
+            timing = StreamTiming()
+            streamed = "".join(timed_stream(llm.stream_answer(q, ctx), timing)).strip()
+            mismatches += streamed != full
+            rows.append(
+                {"blocking_s": round(blocking, 3), "ttft_s": round(timing.ttft or 0.0, 3),
+                 "stream_total_s": round(timing.total or 0.0, 3), "chunks": timing.chunks}
+            )
+
+        lite = LiteLocal()
+        lite_ok = lite.answer(QUESTIONS[1], ctx) == "".join(lite.stream_answer(QUESTIONS[1], ctx))
+
+        print(json.dumps({"turns": rows, "mismatches": mismatches, "lite_local_same_text": lite_ok}, indent=2))
+        if mismatches or not lite_ok:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
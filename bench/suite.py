@@ -0,0 +1,207 @@
+# bench/suite.py
+"""
+Benchmark de ponta a ponta, sem rede: ingest_pdfs → retrieve_top_k → LiteLocal.answer.
+
+- acervo sintético de bench/corpus.py (--docs × --pages);
+- encoder determinístico (vetores por hash do texto) e armazenamento local;
+- vazão por etapa da ingestão (páginas/s na extração, trechos/s nos
+  embeddings e na inserção), reingestão sem mudanças, latência p50/p95/p99
+  das buscas (vector, hybrid, lexical, mmr) e da resposta extrativa, pico de RSS.
+
+Saída em JSON (--out para gravar). Com --compare, mostra a variação frente a
+uma execução anterior e sai com código != 0 se alguma métrica piorar mais que
+--max-regression.
+
+    python -m bench.suite --docs 40 --pages 10 --out atual.json --compare base.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+MODES = ("vector", "hybrid", "lexical", "mmr")
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def _percentiles(lat_ms: List[float]) -> Dict[str, float]:
+    import numpy as np
+
+    return {f"p{p}_ms": round(float(np.percentile(lat_ms, p)), 3) for p in (50, 95, 99)}
+
+
+def _rate(n: int, seconds: float) -> float:
+    return round(n / seconds, 1) if seconds > 0 else 0.0
+
+
+def _flatten(d: Dict, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[f"{prefix}{k}"] = float(v)
+    return out
+
+
+def _lower_is_better(metric: str) -> bool | None:
+    if metric.endswith("_per_s"):
+        return False
+    if metric.endswith(("_ms", "_s", "_mb")):
+        return True
+    return None  # contagens e parâmetros: só informativos
+
+
+def compare(current: Dict, base: Dict, max_regression: float) -> List[str]:
+    """Imprime a variação métrica a métrica; devolve as que pioraram além do limite."""
+    cur, old = _flatten(current["results"]), _flatten(base["results"])
+    worse = []
+    print(f"\n{'métrica':40s} {'base':>12s} {'atual':>12s} {'variação':>9s}", file=sys.stderr)
+    for k in sorted(cur.keys() & old.keys()):
+        lower = _lower_is_better(k)
+        if lower is None or not old[k]:
+            continue
+        change = (cur[k] - old[k]) / old[k]
+        regressed = change > max_regression if lower else change < -max_regression
+        flag = "  ← pior" if regressed else ""
+        print(f"{k:40s} {old[k]:12.3f} {cur[k]:12.3f} {change:+8.1%}{flag}", file=sys.stderr)
+        if regressed:
+            worse.append(k)
+    return worse
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=40)
+    ap.add_argument("--pages", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--out", help="grava o JSON neste arquivo")
+    ap.add_argument("--compare", help="JSON de uma execução anterior")
+    ap.add_argument("--max-regression", type=float, default=0.2, help="piora tolerada no --compare (0.2 = 20%%)")
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="bench_suite_")
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["EMBED_CACHE_MAX_ROWS"] = "0"
+
+    from src.llm_router import LiteLocal
+    from src.rag import ingest_pdfs, retrieve_top_k
+    from src.settings import SETTINGS
+
+    from .corpus import SENTENCES, make_corpus
+    from .fake_openai import fake_vector
+
+    class HashEncoder:
+        model_name = "fake-hash"
+
+        def __init__(self, dim: int):
+            self.dim = dim
+
+        def encode(self, texts):
+            return [fake_vector(t, self.dim) for t in texts]
+
+    t0 = time.perf_counter()
+    files = make_corpus(args.docs, args.pages)
+    corpus_s = time.perf_counter() - t0
+
+    enc = HashEncoder(args.dim)
+    name = "bench_suite"
+    t0 = time.perf_counter()
+    rep = ingest_pdfs(enc, files, "RLO", "POÇO", name)
+    ingest_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    again = ingest_pdfs(enc, files, "RLO", "POÇO", name)
+    reingest_s = time.perf_counter() - t0
+
+    questions = []
+    for i in range(args.queries):
+        if i % 2:
+            d, p, k = i % args.docs, 1 + i % args.pages, 1 + i % 3
+            questions.append(f"qual é a condicionante {d}.{p}.{k}?")
+        else:
+            questions.append(SENTENCES[i % len(SENTENCES)].lower().rstrip("."))
+
+    query: Dict[str, Dict[str, float]] = {}
+    contexts = []
+    for mode in MODES:
+        retrieve_top_k(enc, questions[0], name, top_k=args.k, mode=mode)  # aquecimento (índices, memmap)
+        lat = []
+        for q in questions:
+            t = time.perf_counter()
+            hits = retrieve_top_k(enc, q, name, top_k=args.k, mode=mode)
+            lat.append((time.perf_counter() - t) * 1000)
+            if mode == SETTINGS.retrieval_mode:
+                contexts.append([h["text"] for h in hits])
+        query[mode] = _percentiles(lat)
+
+    lite = LiteLocal(collection=name)
+    lat = []
+    for q, ctx in zip(questions, contexts):
+        t = time.perf_counter()
+        lite.answer(q, ctx)
+        lat.append((time.perf_counter() - t) * 1000)
+
+    results = {
+        "ingest": {
+            "pages": rep.pages_extracted,
+            "chunks": rep.chunks,
+            "extract_pages_per_s": _rate(rep.pages_extracted, rep.extract_s),
+            "embed_chunks_per_s": _rate(rep.chunks, rep.embed_s),
+            "insert_chunks_per_s": _rate(rep.chunks, rep.insert_s),
+            "total_chunks_per_s": _rate(rep.chunks, ingest_s),
+            "total_s": round(ingest_s, 3),
+        },
+        "reingest_unchanged": {"docs_skipped": again.docs_skipped, "total_s": round(reingest_s, 3)},
+        "query": query,
+        "answer_lite_local": _percentiles(lat),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {**vars(args), "retrieval_mode": SETTINGS.retrieval_mode, "chunker": SETTINGS.chunker},
+        "corpus_s": round(corpus_s, 2),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            worse = compare(report, json.load(f), args.max_regression)
+        if worse:
+            print(f"\n{len(worse)} métrica(s) pioraram mais de {args.max_regression:.0%}.", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# src/ann_index.py
+"""
+Índice aproximado (IVF) para o backend vetorial local.
+
+- centróides por k-means esférico (produto interno) sobre uma amostra;
+- cada linha vai para a lista do centróide mais próximo, inclusive nas
+  inserções incrementais do ingest_pdfs (sem reconstruir o índice);
+- a busca visita as `nprobe` listas mais próximas da consulta, como o
+  parâmetro {"nprobe": ...} do Milvus;
+- measure_recall() compara com a busca exata (recall@k × latência).
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def auto_nlist(n: int) -> int:
+    return int(min(4096, max(16, 4 * np.sqrt(max(1, n)))))
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, block: int = 32768) -> np.ndarray:
+    out = np.empty(x.shape[0], dtype=np.int32)
+    for b in range(0, x.shape[0], block):
+        out[b : b + block] = np.argmax(np.asarray(x[b : b + block], dtype=np.float32) @ centroids.T, axis=1)
+    return out
+
+
+def spherical_kmeans(x: np.ndarray, k: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    k = min(k, x.shape[0])
+    c = x[rng.choice(x.shape[0], size=k, replace=False)].copy()
+    for _ in range(n_iter):
+        a = _assign(x, c)
+        sums = np.zeros_like(c)
+        np.add.at(sums, a, x)
+        counts = np.bincount(a, minlength=k)
+        empty = counts == 0
+        if empty.any():  # reinicia centróides vazios em pontos aleatórios
+            sums[empty] = x[rng.choice(x.shape[0], size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        c = sums / norms
+    return c.astype(np.float32)
+
+
+def _grow(buf: np.ndarray, n: int) -> np.ndarray:
+    """`buf` com capacidade para `n` itens; dobra ao crescer (cópia amortizada)."""
+    if n <= len(buf):
+        return buf
+    out = np.empty(max(n, 2 * len(buf), 16), dtype=buf.dtype)
+    out[: len(buf)] = buf
+    return out
+
+
+class IVFIndex:
+    """Listas invertidas sobre as linhas da matriz memory-mapped da coleção."""
+
+    def __init__(self, root: str, load: bool = True):
+        self.root = root
+        self.centroids: np.ndarray | None = None
+        self.assign = np.zeros(0, dtype=np.int32)   # lista de cada linha (-1 = fora do índice)
+        self.lists: List[np.ndarray] = []
+        self.trained_rows = 0
+        # buffers com folga por trás de `assign` e de cada lista (que são fatias deles)
+        self._assign_buf = self.assign
+        self._list_bufs: List[np.ndarray] = []
+        self._saved = False  # arquivos em disco refletem este índice (add só acrescenta)
+        if load:
+            self._load()
+
+    # ---------- persistência ----------
+    def _paths(self) -> Tuple[str, str]:
+        return os.path.join(self.root, "ivf_centroids.npy"), os.path.join(self.root, "ivf_assign.i32")
+
+    def _load(self) -> None:
+        pc, pa = self._paths()
+        if os.path.exists(pc) and os.path.exists(pa):
+            self.centroids = np.load(pc)
+            # int32 cru, só acrescentado; descarta um final incompleto de gravação interrompida
+            with open(pa, "rb") as f:
+                raw = f.read()
+            self.assign = np.frombuffer(raw[: len(raw) // 4 * 4], dtype=np.int32).copy()
+            self._assign_buf = self.assign
+            self.trained_rows = int(len(self.assign))
+            self._rebuild_lists()
+            self._saved = True
+
+    def save(self) -> None:
+        """Grava centróides e atribuições inteiros (após o treino); depois disso add() só acrescenta."""
+        if self.centroids is None:
+            return
+        pc, pa = self._paths()
+        np.save(pc, self.centroids)
+        tmp = pa + ".tmp"
+        self.assign.tofile(tmp)
+        os.replace(tmp, pa)
+        self._saved = True
+
+    def _append_assign(self, lo: int) -> None:
+        """Regrava no disco só as atribuições a partir da linha `lo`."""
+        _, pa = self._paths()
+        with open(pa, "r+b") as f:
+            f.seek(lo * 4)
+            f.truncate()
+            f.write(self.assign[lo:].tobytes())
+
+    def _rebuild_lists(self) -> None:
+        k = 0 if self.centroids is None else self.centroids.shape[0]
+        order = np.argsort(self.assign, kind="stable")
+        bounds = np.searchsorted(self.assign[order], np.arange(k + 1))
+        self.lists = [order[bounds[i] : bounds[i + 1]].astype(np.int64) for i in range(k)]
+        self._list_bufs = list(self.lists)
+
+    # ---------- construção ----------
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, mm: np.ndarray, n: int, nlist: int = 0, sample: int = 100_000) -> None:
+        """Treina em memória sobre as `n` primeiras linhas; quem chama decide quando salvar()."""
+        nlist = nlist or auto_nlist(n)
+        rng = np.random.default_rng(0)
+        idx = np.sort(rng.choice(n, size=min(n, max(sample, nlist * 40)), replace=False))
+        self.centroids = spherical_kmeans(np.asarray(mm[idx], dtype=np.float32), nlist)
+        self.assign = _assign(mm[:n], self.centroids)
+        self._assign_buf = self.assign
+        self.trained_rows = n
+        self._rebuild_lists()
+        self._saved = False
+
+    def add(self, start: int, vecs: np.ndarray) -> None:
+        """
+        Inclui as linhas [start, start+len(vecs)) nas listas dos centróides mais próximos.
+        Custo proporcional ao lote: buffers com folga em memória e, no disco, só o trecho novo.
+        """
+        if self.centroids is None:
+            return
+        a = _assign(vecs, self.centroids)
+        n0, end = len(self.assign), start + len(a)
+        lo = min(start, n0)
+        buf = self._assign_buf = _grow(self._assign_buf, end)
+        buf[n0:start] = -1
+        buf[start:end] = a
+        self.assign = buf[:end]
+        if start < n0:  # linhas regravadas: as listas antigas apontariam para elas
+            self._rebuild_lists()
+        else:
+            ids = np.arange(start, end, dtype=np.int64)
+            for lst in np.unique(a):
+                new = ids[a == lst]
+                cur = len(self.lists[lst])
+                lb = self._list_bufs[lst] = _grow(self._list_bufs[lst], cur + len(new))
+                lb[cur : cur + len(new)] = new
+                # a busca lê self.lists sem lock: troca a fatia só depois de preenchida
+                self.lists[lst] = lb[: cur + len(new)]
+        if self._saved:
+            self._append_assign(lo)
+
+    # ---------- busca ----------
+    def search(
+        self, score: Callable[..., np.ndarray], q: np.ndarray, mask: np.ndarray, k: int, nprobe: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """`score(ids, qi)` → (1, len(ids)): escores da consulta `qi` nas linhas `ids`."""
+        assert self.centroids is not None
+        nprobe = max(1, min(int(nprobe), self.centroids.shape[0]))
+        probe = np.argpartition(-(q @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        lists = self.lists
+        scores = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+        ids = np.full((q.shape[0], k), -1, dtype=np.int64)
+        for qi in range(q.shape[0]):
+            cand = np.concatenate([lists[l] for l in probe[qi]])
+            cand = cand[cand < len(mask)]
+            cand = np.sort(cand[mask[cand]])
+            if not len(cand):
+                continue
+            s = score(cand, qi)[0]
+            top = np.argsort(-s)[:k] if len(s) <= k else np.argpartition(-s, k - 1)[:k]
+            top = top[np.argsort(-s[top])]
+            scores[qi, : len(top)] = s[top]
+            ids[qi, : len(top)] = cand[top]
+        return scores, ids
+
+
+def measure_recall(
+    col, queries: np.ndarray, k: int = 10, nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32, 64), expr: str | None = None
+) -> List[Dict[str, float]]:
+    """
+    recall@k e latência média por consulta (ms) do IVF para cada nprobe (0 = exata),
+    tomando a busca exata da mesma coleção local como gabarito.
+    """
+    from .local_store import _normalize
+
+    q = _normalize(queries)
+    t0 = time.perf_counter()
+    exact = col.search(q, limit=k, expr=expr, param={"params": {"exact": True}})
+    rows = [{"nprobe": 0, "recall": 1.0, "ms": (time.perf_counter() - t0) * 1000 / len(q)}]
+    truth = [{h.id for h in hits} for hits in exact]
+    for nprobe in nprobes:
+        t0 = time.perf_counter()
+        approx = col.search(q, limit=k, expr=expr, param={"params": {"nprobe": nprobe}})
+        ms = (time.perf_counter() - t0) * 1000 / len(q)
+        hit = sum(len(t & {h.id for h in a}) for t, a in zip(truth, approx))
+        total = sum(len(t) for t in truth) or 1
+        rows.append({"nprobe": int(nprobe), "recall": hit / total, "ms": ms})
+    return rows
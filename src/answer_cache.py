@@ -0,0 +1,187 @@
+# src/answer_cache.py
+"""
+Cache semântico de respostas para perguntas repetidas.
+
+Chave = (coleção, expressão de filtro, modo, memória da conversa — só quando
+o LLM a recebe: uma resposta que dependeu de turnos anteriores não serve para
+outra conversa). Dentro da mesma chave, uma
+pergunta nova reaproveita a resposta de outra já respondida quando o cosseno
+entre os embeddings das duas passa do limiar (ANSWER_CACHE_THRESHOLD): sem
+busca vetorial e sem chamada ao LLM.
+
+- validade por tempo (ANSWER_CACHE_TTL) e no máximo ANSWER_CACHE_MAX_ENTRIES
+  respostas no processo, com despejo LRU;
+- cada coleção tem um contador de geração: uma nova ingestão o incrementa e
+  descarta as respostas da coleção; respostas calculadas sobre uma geração
+  antiga (ingestão concorrente) não entram no cache;
+- contadores de acertos/faltas para acompanhamento.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from .settings import SETTINGS
+
+
+@dataclass(frozen=True)
+class AnswerKey:
+    collection: str
+    expr: str
+    mode: str  # ex.: "openai:gpt-4o-mini/hybrid", "extrativa/vector"
+    memory: str = ""  # memory_tag() da memória passada ao LLM ("" = sem memória)
+
+
+def memory_tag(memory: str) -> str:
+    """Impressão digital curta da memória da conversa, para a AnswerKey."""
+    return hashlib.sha256(memory.encode("utf-8")).hexdigest()[:16] if memory else ""
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    hits: List[Dict]
+    similarity: float = 1.0
+    created: float = field(default_factory=time.time)
+
+
+@dataclass
+class _Entry:
+    key: AnswerKey
+    vec: np.ndarray
+    value: CachedAnswer
+    generation: int
+
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32).reshape(-1)
+    n = float(np.linalg.norm(v))
+    return v / n if n else v
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 86400.0, max_entries: int = 1000):
+        self.threshold = float(threshold)
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # ordem = LRU
+        self._by_key: Dict[AnswerKey, List[int]] = {}
+        self._generations: Dict[str, int] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def generation(self, collection: str) -> int:
+        with self._lock:
+            return self._generations.get(collection, 0)
+
+    def _remove(self, eid: int) -> None:
+        entry = self._entries.pop(eid)
+        ids = self._by_key.get(entry.key)
+        if ids is not None:
+            ids.remove(eid)
+            if not ids:
+                del self._by_key[entry.key]
+
+    def lookup(self, key: AnswerKey, qvec) -> CachedAnswer | None:
+        """Resposta da pergunta mais parecida da mesma chave, se acima do limiar."""
+        q = _unit(qvec)
+        now = time.time()
+        with self._lock:
+            ids = list(self._by_key.get(key, ()))
+            for eid in ids:
+                if now - self._entries[eid].value.created > self.ttl:
+                    self._remove(eid)
+                    self.expired += 1
+            ids = self._by_key.get(key, [])
+            if ids:
+                vecs = [self._entries[eid].vec for eid in ids]
+                if all(v.shape == q.shape for v in vecs):
+                    sims = np.stack(vecs) @ q
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.threshold:
+                        eid = ids[best]
+                        self._entries.move_to_end(eid)
+                        self.hits += 1
+                        v = self._entries[eid].value
+                        return CachedAnswer(v.question, v.answer, v.hits, float(sims[best]), v.created)
+            self.misses += 1
+            return None
+
+    def put(self, key: AnswerKey, question: str, qvec, answer: str, hits: List[Dict], generation: int) -> bool:
+        """Guarda a resposta; ignora se a coleção foi reingerida depois de `generation`."""
+        if self.max_entries <= 0:
+            return False
+        with self._lock:
+            if self._generations.get(key.collection, 0) != generation:
+                return False
+            eid = self._next_id
+            self._next_id += 1
+            self._entries[eid] = _Entry(key, _unit(qvec), CachedAnswer(question, answer, list(hits)), generation)
+            self._by_key.setdefault(key, []).append(eid)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, collection: str) -> None:
+        """Nova ingestão na coleção: avança a geração e descarta as respostas dela."""
+        with self._lock:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+            for eid in [eid for eid, e in self._entries.items() if e.key.collection == collection]:
+                self._remove(eid)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_key.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "entries": len(self._entries),
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+            }
+
+
+_CACHE: AnswerCache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache | None:
+    """Cache do processo (None se ANSWER_CACHE_MAX_ENTRIES <= 0)."""
+    global _CACHE
+    if SETTINGS.answer_cache_max_entries <= 0:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = AnswerCache(
+                threshold=SETTINGS.answer_cache_threshold,
+                ttl=SETTINGS.answer_cache_ttl,
+                max_entries=SETTINGS.answer_cache_max_entries,
+            )
+        return _CACHE
+
+
+def invalidate_collection(collection: str) -> None:
+    cache = get_answer_cache()
+    if cache is not None:
+        cache.invalidate(collection)
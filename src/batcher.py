@@ -0,0 +1,145 @@
+# src/batcher.py
+"""
+Micro-lotes de chamadas concorrentes (embeddings e buscas das perguntas).
+
+Cada sessão do Streamlit roda na própria thread. Quando várias perguntas
+chegam juntas, a primeira de cada chave vira "líder": espera até
+QUERY_BATCH_WINDOW_MS (ou até juntar QUERY_BATCH_MAX), executa o lote inteiro
+numa chamada só e devolve a cada thread o seu resultado. As demais só
+aguardam. O líder só espera se houver outra chamada em andamento no
+batcher: uma pergunta solitária não paga a janela.
+
+Chaves separam o que não pode ir junto: encoders diferentes (outra chave da
+OpenAI, outro modelo) ou buscas com coleção/filtro diferentes.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Sequence
+
+from .settings import SETTINGS
+
+RunFn = Callable[[Hashable, List[Any]], Sequence[Any]]
+
+
+class _Slot:
+    __slots__ = ("item", "result", "error", "done")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    `run(key, items)` recebe os itens de um lote (mesma chave) e devolve um
+    resultado por item, na mesma ordem. Uma exceção vale para o lote todo.
+    `window_ms <= 0` ou `max_batch <= 1` desativa os lotes (chamada direta);
+    sem valores, valem QUERY_BATCH_WINDOW_MS e QUERY_BATCH_MAX.
+    """
+
+    def __init__(self, run: RunFn, window_ms: float | None = None, max_batch: int | None = None):
+        self._run = run
+        # None → QUERY_BATCH_WINDOW_MS / QUERY_BATCH_MAX, lidos no primeiro uso
+        self._window_s = None if window_ms is None else max(0.0, float(window_ms)) / 1000.0
+        self._max_batch = max_batch
+        self._cond = threading.Condition()
+        self._pending: Dict[Hashable, List[_Slot]] = {}
+        self._inflight = 0  # chamadas dentro do batcher (esperando ou executando)
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    @property
+    def window_s(self) -> float:
+        if self._window_s is None:
+            self._window_s = max(0.0, float(SETTINGS.query_batch_window_ms)) / 1000.0
+        return self._window_s
+
+    @window_s.setter
+    def window_s(self, value: float) -> None:
+        self._window_s = max(0.0, float(value))
+
+    @property
+    def max_batch(self) -> int:
+        if self._max_batch is None:
+            self._max_batch = int(SETTINGS.query_batch_max)
+        return self._max_batch
+
+    @max_batch.setter
+    def max_batch(self, value: int) -> None:
+        self._max_batch = int(value)
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0 and self.max_batch > 1
+
+    def __call__(self, key: Hashable, item: Any) -> Any:
+        if not self.enabled:
+            self._count(1)
+            return self._run(key, [item])[0]
+
+        slot = _Slot(item)
+        with self._cond:
+            self._inflight += 1
+            batch = self._pending.setdefault(key, [])
+            batch.append(slot)
+            leader = len(batch) == 1
+            alone = self._inflight == 1
+            if len(batch) >= self.max_batch:
+                self._cond.notify_all()
+
+        try:
+            if leader:
+                deadline = time.monotonic() + (0.0 if alone else self.window_s)
+                with self._cond:
+                    while len(self._pending[key]) < self.max_batch:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._cond.wait(left)
+                    batch = self._pending.pop(key)
+                for s in range(0, len(batch), self.max_batch):
+                    self._execute(key, batch[s : s + self.max_batch])
+            else:
+                slot.done.wait()
+        finally:
+            with self._cond:
+                self._inflight -= 1
+
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _count(self, n: int) -> None:
+        with self._cond:
+            self.batches += 1
+            self.items += n
+            self.largest = max(self.largest, n)
+
+    def _execute(self, key: Hashable, batch: List[_Slot]) -> None:
+        self._count(len(batch))
+        try:
+            results = self._run(key, [s.item for s in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Lote devolveu {len(results)} resultados para {len(batch)} itens.")
+            for s, r in zip(batch, results):
+                s.result = r
+        except BaseException as e:
+            for s in batch:
+                s.error = e
+        finally:
+            for s in batch:
+                s.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch": (self.items / self.batches) if self.batches else 0.0,
+                "largest": self.largest,
+            }
@@ -0,0 +1,416 @@
+# src/bm25.py
+"""
+Índice léxico BM25 por coleção, montado na ingestão junto com os vetores.
+
+Embeddings densos costumam errar strings exatas (códigos de licença, nomes de
+poços, números de processo); o BM25 acerta justamente essas. O retrieve_top_k
+combina as duas listas por reciprocal rank fusion (modo "hybrid").
+
+- tokenização para português: minúsculas, sem acentos (ç → c, ã → a…),
+  stopwords e redução leve de plural; códigos como "7-MO-0123-RN" geram as
+  partes e também a forma colada ("7mo0123rn");
+- listas invertidas no SQLite em segmentos (um por lote de ingestão), com ids
+  em delta + varint e tf em varint; optimize() junta os segmentos (e descarta
+  as linhas apagadas) só dos termos tocados desde a última vez que já somem
+  MERGE_SEGMENTS segmentos — uma ingestão pequena não reescreve o índice todo;
+- filtros com a mesma expressão do Milvus, avaliados em colunas em memória.
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .filter_expr import MetadataColumns
+from .settings import SETTINGS
+
+# parâmetros clássicos do BM25
+K1 = 1.2
+B = 0.75
+# segmentos de um termo a partir dos quais optimize() os junta num só
+MERGE_SEGMENTS = 8
+
+_WORD = re.compile(r"[0-9a-z]+(?:[-/.][0-9a-z]+)*")
+_SEP = re.compile(r"[-/.]")
+
+STOPWORDS = frozenset(
+    """
+    a o as os um uma uns umas de da do das dos e em no na nos nas ao aos ou
+    para pra por pela pelo pelas pelos com sem sob sobre entre ate apos que se
+    ser sao foi era sera ha nao mais menos muito como quando onde qual quais
+    quem cujo cuja seu sua seus suas este esta estes estas esse essa esses essas
+    isto isso aquele aquela aquilo ele ela eles elas lhe lhes ja tambem so
+    mesmo mesma pode deve devem bem ainda
+    """.split()
+)
+
+
+# ===== Tokenização =====
+def fold(text: str) -> str:
+    """Minúsculas e sem diacríticos (NFKD sem marcas combinantes)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _singular(tok: str) -> str:
+    """Redução de plural leve (no estilo do passo de plural do RSLP)."""
+    if len(tok) < 5 or not tok.isalpha() or not tok.endswith("s"):
+        return tok
+    if tok.endswith(("oes", "aes")):
+        return tok[:-3] + "ao"
+    if tok.endswith("ais"):
+        return tok[:-2] + "l"
+    if tok.endswith("eis"):
+        return tok[:-3] + "el"
+    if tok.endswith("ns"):
+        return tok[:-2] + "m"
+    if tok.endswith("ores"):
+        return tok[:-2]
+    if tok.endswith(("ss", "us", "is")):
+        return tok
+    return tok[:-1]
+
+
+def _term(tok: str) -> str | None:
+    if tok in STOPWORDS or (len(tok) < 2 and not tok.isdigit()):
+        return None
+    return _singular(tok)
+
+
+def tokenize(text: str) -> List[str]:
+    out: List[str] = []
+    for m in _WORD.finditer(fold(text)):
+        word = m.group()
+        parts = _SEP.split(word)
+        if len(parts) > 1:
+            out.append(_SEP.sub("", word))  # código inteiro: casa busca exata
+        for p in parts:
+            t = _term(p)
+            if t:
+                out.append(t)
+    return out
+
+
+# ===== Compressão das listas =====
+def encode_varints(values) -> bytes:
+    out = bytearray()
+    for v in values:
+        v = int(v)
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def decode_varints(buf: bytes) -> np.ndarray:
+    """Decodificação vetorizada (sem laço Python por byte)."""
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if not len(b):
+        return np.zeros(0, dtype=np.int64)
+    last = b < 0x80
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    group = np.cumsum(np.concatenate([[0], last[:-1].astype(np.int64)]))
+    shift = 7 * (np.arange(len(b)) - starts[group])
+    return np.add.reduceat((b & 0x7F).astype(np.int64) << shift, starts)
+
+
+def _encode_postings(ids: np.ndarray, tfs: np.ndarray) -> Tuple[int, bytes, bytes]:
+    first = int(ids[0])
+    return first, encode_varints(np.diff(ids, prepend=first)), encode_varints(tfs)
+
+
+class BM25Index:
+    """Documentos (trechos) e listas invertidas de uma coleção; id = ordem de inserção."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY, text TEXT, fonte TEXT, pagina INTEGER,
+                tipo_licenca TEXT, tipo_empreendimento TEXT, length INTEGER, alive INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT, first_id INTEGER, n INTEGER, ids BLOB, tfs BLOB,
+                PRIMARY KEY (term, first_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._db.commit()
+        self._dirty: set = set()  # termos com segmento novo desde o último optimize()
+        self._load()
+
+    def _load(self) -> None:
+        rows = self._db.execute(
+            "SELECT fonte, pagina, tipo_licenca, tipo_empreendimento, alive, length FROM docs ORDER BY id"
+        ).fetchall()
+        self._meta = MetadataColumns()
+        self._len = np.array([r[5] for r in rows], dtype=np.float32)
+        if rows:
+            self._meta.extend(*zip(*(r[:5] for r in rows)))
+
+    @property
+    def num_docs(self) -> int:
+        return int(self._meta.alive.sum())
+
+    # ---------- escrita ----------
+    def add(
+        self,
+        texts: Sequence[str],
+        fontes: Sequence[str],
+        paginas: Sequence[int],
+        tipo_licenca: Sequence[str],
+        tipo_empreendimento: Sequence[str],
+    ) -> None:
+        if not texts:
+            return
+        counts = [Counter(tokenize(t)) for t in texts]
+        with self._lock:
+            start = self._meta.n
+            by_term: Dict[str, Tuple[List[int], List[int]]] = {}
+            for i, c in enumerate(counts):
+                for term, tf in c.items():
+                    ids, tfs = by_term.setdefault(term, ([], []))
+                    ids.append(start + i)
+                    tfs.append(tf)
+            lengths = [sum(c.values()) for c in counts]
+            self._db.executemany(
+                "INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                [
+                    (start + i, texts[i], fontes[i], int(paginas[i]), tipo_licenca[i], tipo_empreendimento[i], lengths[i])
+                    for i in range(len(texts))
+                ],
+            )
+            rows = []
+            for term, (ids, tfs) in by_term.items():
+                first, ids_blob, tfs_blob = _encode_postings(np.asarray(ids, dtype=np.int64), np.asarray(tfs))
+                rows.append((term, first, len(ids), ids_blob, tfs_blob))
+            self._db.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            self._dirty.update(by_term)
+            self._len = np.concatenate([self._len, np.asarray(lengths, dtype=np.float32)])
+            self._meta.extend(
+                [str(f) for f in fontes], [int(p) for p in paginas],
+                [str(t) for t in tipo_licenca], [str(t) for t in tipo_empreendimento],
+            )
+
+    def delete(self, expr: str) -> int:
+        """Apaga (logicamente) os trechos que satisfazem a expressão; retorna quantos."""
+        with self._lock:
+            ids = np.flatnonzero(self._meta.mask(expr))
+            if not len(ids):
+                return 0
+            self._meta.kill(ids)
+            self._db.executemany("UPDATE docs SET alive = 0 WHERE id = ?", [(int(i),) for i in ids])
+            self._db.commit()
+            return int(len(ids))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM docs")
+            self._db.execute("DELETE FROM postings")
+            self._db.commit()
+            self._dirty.clear()
+            self._load()
+
+    def has_source(self, fonte: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM docs WHERE fonte = ? AND alive = 1 LIMIT 1", (fonte,)).fetchone()
+        return row is not None
+
+    def texts(self, expr: str) -> List[str]:
+        """Textos dos trechos vivos que satisfazem a expressão (para descontá-los do índice de frases)."""
+        with self._lock:
+            ids = [int(i) for i in np.flatnonzero(self._meta.mask(expr))]
+            out: List[str] = []
+            for i in range(0, len(ids), 500):
+                part = ids[i : i + 500]
+                marks = ",".join("?" * len(part))
+                out.extend(t for (t,) in self._db.execute(f"SELECT text FROM docs WHERE id IN ({marks})", part))
+        return out
+
+    def optimize(self, min_segments: int = MERGE_SEGMENTS, full: bool = False) -> int:
+        """
+        Para os termos tocados desde a última chamada com ≥ `min_segments` segmentos,
+        junta os segmentos mais novos enquanto o mais antigo seguinte não for maior
+        que a soma deles (fusão por camadas: a lista grande de um termo comum não é
+        reescrita a cada ingestão). `full`: todos os termos, todos os segmentos, sem
+        as linhas apagadas. Retorna quantos termos foram reescritos.
+        """
+        with self._lock:
+            min_segments = max(2, int(min_segments))
+            if full:
+                terms = [
+                    t for (t,) in self._db.execute(
+                        "SELECT term FROM postings GROUP BY term HAVING COUNT(*) >= ?", (min_segments,)
+                    )
+                ]
+            else:
+                dirty = list(self._dirty)
+                terms = []
+                for i in range(0, len(dirty), 500):
+                    part = dirty[i : i + 500]
+                    marks = ",".join("?" * len(part))
+                    terms.extend(
+                        t for (t,) in self._db.execute(
+                            f"SELECT term FROM postings WHERE term IN ({marks}) GROUP BY term HAVING COUNT(*) >= ?",
+                            [*part, min_segments],
+                        )
+                    )
+            self._dirty.clear()
+            alive = self._meta.alive
+            rows = []
+            for term in terms:
+                segs = self._db.execute(
+                    "SELECT first_id, n FROM postings WHERE term = ? ORDER BY first_id", (term,)
+                ).fetchall()
+                j, tail = len(segs) - 1, segs[-1][1]
+                while j > 0 and (full or segs[j - 1][1] <= tail):
+                    j -= 1
+                    tail += segs[j][1]
+                if j == len(segs) - 1:
+                    continue
+                ids, tfs = self._read_postings([term], min_first=segs[j][0])[term]
+                self._db.execute("DELETE FROM postings WHERE term = ? AND first_id >= ?", (term, segs[j][0]))
+                keep = alive[ids]
+                if keep.any():
+                    first, ids_blob, tfs_blob = _encode_postings(ids[keep], tfs[keep])
+                    rows.append((term, first, int(keep.sum()), ids_blob, tfs_blob))
+            self._db.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            return len(rows)
+
+    # ---------- leitura ----------
+    def _read_postings(self, terms: Sequence[str], min_first: int = -1) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        marks = ",".join("?" * len(terms))
+        segs: Dict[str, Tuple[List[np.ndarray], List[np.ndarray]]] = {}
+        for term, first, ids_blob, tfs_blob in self._db.execute(
+            f"SELECT term, first_id, ids, tfs FROM postings WHERE term IN ({marks}) AND first_id >= ? "
+            "ORDER BY term, first_id",
+            [*terms, min_first],
+        ):
+            ids, tfs = segs.setdefault(term, ([], []))
+            ids.append(first + np.cumsum(decode_varints(ids_blob)))
+            tfs.append(decode_varints(tfs_blob))
+        return {t: (np.concatenate(i), np.concatenate(f)) for t, (i, f) in segs.items()}
+
+    def search(self, query: str, top_k: int = 5, expr: str | None = None) -> List[Dict]:
+        """Top-k por BM25, em dicts como os do retrieve_top_k (score, text, fonte, pagina, …)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+        with self._lock:
+            n = self._meta.n
+            postings = self._read_postings(terms)
+            lengths = self._len[:n]
+        mask = self._meta.mask(expr, n)
+        live = self._meta.alive[:n]
+        n_live = int(live.sum())
+        if not n_live or not mask.any():
+            return []
+        avgdl = float(lengths[live].mean()) or 1.0
+
+        scores = np.zeros(n, dtype=np.float32)
+        for ids, tfs in postings.values():
+            keep = ids < n
+            ids, tfs = ids[keep], tfs[keep]
+            keep = live[ids]
+            ids, tfs = ids[keep], tfs[keep].astype(np.float32)
+            df = len(ids)
+            if not df:
+                continue
+            idf = math.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+            norm = K1 * (1.0 - B + B * lengths[ids] / avgdl)
+            scores[ids] += idf * tfs * (K1 + 1.0) / (tfs + norm)
+
+        cand = np.flatnonzero(mask & (scores > 0))
+        if not len(cand):
+            return []
+        if len(cand) > top_k:
+            cand = cand[np.argpartition(-scores[cand], top_k - 1)[:top_k]]
+        cand = cand[np.lexsort((cand, -scores[cand]))]
+
+        ids = [int(i) for i in cand]
+        with self._lock:
+            marks = ",".join("?" * len(ids))
+            found = {
+                r[0]: r[1:]
+                for r in self._db.execute(
+                    f"SELECT id, text, fonte, pagina, tipo_licenca, tipo_empreendimento FROM docs WHERE id IN ({marks})", ids
+                )
+            }
+        out = []
+        for i in ids:
+            text, fonte, pagina, tlic, temp = found[i]
+            out.append(
+                {
+                    "score": float(scores[i]),
+                    "text": text,
+                    "fonte": fonte,
+                    "pagina": int(pagina),
+                    "tipo_licenca": tlic,
+                    "tipo_empreendimento": temp,
+                }
+            )
+        return out
+
+    def stats(self) -> Dict[str, float]:
+        """Tamanho das listas comprimidas × cru (id int64 + tf int32 por ocorrência)."""
+        with self._lock:
+            terms, postings, size = self._db.execute(
+                "SELECT COUNT(DISTINCT term), COALESCE(SUM(n), 0), COALESCE(SUM(LENGTH(ids) + LENGTH(tfs)), 0) FROM postings"
+            ).fetchone()
+        raw = 12 * postings
+        return {
+            "docs": self.num_docs,
+            "terms": int(terms),
+            "postings": int(postings),
+            "bytes": int(size),
+            "raw_bytes": int(raw),
+            "ratio": (raw / size) if size else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_INDEXES: Dict[str, BM25Index] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def _path(collection_name: str) -> str:
+    safe = re.sub(r"[^\w.-]", "_", collection_name)
+    return os.path.join(SETTINGS.data_dir, "bm25", f"{safe}.sqlite")
+
+
+def get_bm25_index(collection_name: str) -> BM25Index:
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(collection_name)
+        if idx is None:
+            idx = _INDEXES[collection_name] = BM25Index(_path(collection_name))
+        return idx
+
+
+def drop_bm25_index(collection_name: str) -> None:
+    with _INDEXES_LOCK:
+        idx = _INDEXES.pop(collection_name, None)
+        if idx is not None:
+            idx.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(_path(collection_name) + suffix)
+            except FileNotFoundError:
+                pass
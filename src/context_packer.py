@@ -0,0 +1,123 @@
+# src/context_packer.py
+"""
+Montagem do contexto do prompt do LLMCloud dentro de um orçamento de tokens.
+
+- ordem por escore (o trecho mais relevante entra primeiro);
+- trechos vizinhos da mesma fonte/página repetem a sobreposição do chunk_text
+  (200 caracteres): o pedaço repetido sai do trecho que entra depois, e
+  trechos inteiramente contidos em outro já escolhido são descartados;
+- preenche até CONTEXT_MAX_TOKENS (tokenizador local de src/tokens.py); o
+  último trecho é cortado se ainda couber um pedaço útil;
+- informa quantos tokens o prompt economizou frente à junção antiga
+  (contexts[:8] inteiros).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple, Union
+
+from .settings import SETTINGS
+from .tokens import count_tokens, truncate_tokens
+
+SEPARATOR = "\n\n---\n\n"
+# sobreposições menores que isso são coincidência, não repetição do chunk_text
+MIN_OVERLAP_CHARS = 32
+# não vale a pena incluir um trecho cortado com menos tokens que isso
+MIN_PIECE_TOKENS = 48
+# limite da junção antiga, usado como base de comparação
+LEGACY_MAX_CONTEXTS = 8
+
+Context = Union[str, Dict]
+
+
+@dataclass
+class PackedContext:
+    texts: List[str] = field(default_factory=list)
+    hits: List[Dict] = field(default_factory=list)  # hits usados, na ordem de `texts`
+    tokens: int = 0            # tokens do contexto montado
+    naive_tokens: int = 0      # tokens da junção antiga (contexts[:8])
+    dropped: int = 0           # trechos descartados (repetidos ou sem orçamento)
+    trimmed_chars: int = 0     # caracteres de sobreposição removidos
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.naive_tokens - self.tokens
+
+    def joined(self) -> str:
+        return SEPARATOR.join(self.texts)
+
+
+def suffix_prefix_overlap(a: str, b: str) -> int:
+    """Maior k tal que a termina com b[:k] (função de falha do KMP, O(len(a) + len(b)))."""
+    m = min(len(a), len(b))
+    if not m:
+        return 0
+    s = b[:m] + "\x00" + a[-m:]
+    fail = [0] * len(s)
+    for i in range(1, len(s)):
+        k = fail[i - 1]
+        while k and s[i] != s[k]:
+            k = fail[k - 1]
+        if s[i] == s[k]:
+            k += 1
+        fail[i] = k
+    return fail[-1]
+
+
+def _as_hit(c: Context) -> Dict:
+    return c if isinstance(c, dict) else {"text": c}
+
+
+def _trim(text: str, chosen: Sequence[str]) -> Tuple[str | None, int]:
+    """Remove de `text` o que repete trechos já escolhidos; None se nada sobrar."""
+    removed = 0
+    for other in chosen:
+        if text in other:
+            return None, len(text)
+        k = suffix_prefix_overlap(other, text)  # other … | sobreposição | … text
+        if k >= MIN_OVERLAP_CHARS:
+            text, removed = text[k:].lstrip(), removed + k
+        k = suffix_prefix_overlap(text, other)  # text … | sobreposição | … other
+        if k >= MIN_OVERLAP_CHARS:
+            text, removed = text[:-k].rstrip(), removed + k
+        if not text:
+            return None, removed
+    return text, removed
+
+
+def pack_contexts(contexts: Sequence[Context], max_tokens: int | None = None) -> PackedContext:
+    """
+    `contexts`: hits do retrieve_top_k (dicts com text/fonte/pagina/score) ou
+    textos soltos (tratados como vindos da mesma página).
+    """
+    budget = int(SETTINGS.context_max_tokens if max_tokens is None else max_tokens)
+    hits = [_as_hit(c) for c in contexts if _as_hit(c).get("text")]
+    naive = [h["text"] for h in hits[:LEGACY_MAX_CONTEXTS]]
+    out = PackedContext(naive_tokens=count_tokens(SEPARATOR.join(naive)) if naive else 0)
+
+    order = sorted(range(len(hits)), key=lambda i: (-float(hits[i].get("score", 0.0)), i))
+    chosen: Dict[Tuple[object, object], List[str]] = {}
+    sep_tokens = count_tokens(SEPARATOR)
+    used = 0
+    for i in order:
+        hit = hits[i]
+        page = (hit.get("fonte"), hit.get("pagina"))
+        text, removed = _trim(str(hit["text"]).strip(), chosen.get(page, []))
+        out.trimmed_chars += removed
+        if text is None:
+            out.dropped += 1
+            continue
+        cost = count_tokens(text) + (sep_tokens if out.texts else 0)
+        if used + cost > budget:
+            room = budget - used - (sep_tokens if out.texts else 0)
+            if room < MIN_PIECE_TOKENS:
+                out.dropped += 1
+                continue
+            text = truncate_tokens(text, room)
+            cost = count_tokens(text) + (sep_tokens if out.texts else 0)
+        chosen.setdefault(page, []).append(str(hit["text"]).strip())
+        out.texts.append(text)
+        out.hits.append(hit)
+        used += cost
+    out.tokens = count_tokens(out.joined()) if out.texts else 0
+    return out
@@ -0,0 +1,367 @@
+# src/conversation.py
+"""
+Memória da conversa com custo por pergunta constante.
+
+- transcrição completa em SQLite (DATA_DIR/conversations.sqlite), fora do
+  st.session_state: a sessão guarda só o id da conversa, a tela mostra as
+  últimas CONVERSATION_WINDOW mensagens e o PDF exportado lê tudo daqui;
+  a conversa só é criada na primeira pergunta, e as paradas há mais de
+  CONVERSATION_RETENTION_DAYS dias são apagadas (0 = guarda para sempre);
+- resumo acumulado: as mensagens que saem das CONVERSATION_RECENT mais
+  recentes são dobradas, de FOLD_BATCH em FOLD_BATCH, num resumo de até
+  CONVERSATION_SUMMARY_TOKENS (pelo LLM, se houver; senão extrativo: perguntas
+  e o começo das respostas); até lá elas seguem literais no prompt;
+- reescrita da pergunta: uma continuação ("e para a LO?") vira uma pergunta
+  completa a partir do resumo e das mensagens recentes — é ela que vai para o
+  embedding, a busca e o cache de respostas;
+- o prompt recebe o resumo + as mensagens recentes, cada parte com teto de
+  tokens: a centésima pergunta custa o mesmo que a segunda.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from .settings import SETTINGS
+from .tokens import count_tokens, truncate_tokens
+from .tracing import span
+
+USER, ASSISTANT = "user", "assistant"
+# teto de cada mensagem recente no prompt e no resumo extrativo
+MESSAGE_TOKENS = 250
+ANSWER_GIST_TOKENS = 40
+# mensagens dobradas no resumo por chamada
+FOLD_BATCH = 6
+REWRITE_MAX_TOKENS = 80
+SOURCES_MARK = "\n\n**Fontes consultadas:**"
+# intervalo mínimo entre duas limpezas de conversas antigas (s)
+PRUNE_EVERY = 3600.0
+
+# começo típico de continuação e palavras que apontam para o que já foi dito
+_FOLLOWUP_START = re.compile(
+    r"^\s*(e|mas|também|tambem|então|entao|quanto a|sobre isso|e se|e quanto|e sobre)\b", re.IGNORECASE
+)
+_ANAPHORA = re.compile(
+    r"\b(isso|isto|disso|nisso|desse|dessa|deste|desta|nesse|nessa|neste|nesta|dele|dela|deles|delas|"
+    r"mesmo|mesma|anterior|acima|aquele|aquela|ele|ela|eles|elas)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Message:
+    role: str
+    text: str
+    query: str = ""  # pergunta reescrita (mensagens do usuário)
+
+
+@dataclass
+class Memory:
+    """O que o modelo vê da conversa: resumo das antigas + as mais recentes, literais."""
+
+    summary: str = ""
+    recent: List[Message] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.recent
+
+    def last_query(self) -> str:
+        """Última pergunta independente; sem nenhuma nas recentes, a última reescrita."""
+        users = [m for m in self.recent if m.role == USER]
+        for m in reversed(users):
+            if not is_followup(m.text):
+                return m.text
+        if not users:
+            return ""
+        last = users[-1]
+        query, text = last.query or last.text, last.text.strip()
+        # reescrita extrativa ("<anterior> <continuação>"): vale a parte anterior
+        return query[: -len(text)].strip() if query != text and query.endswith(text) else query
+
+    def prompt_block(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"Resumo: {self.summary}")
+        for m in self.recent:
+            who = "Usuário" if m.role == USER else "Assistente"
+            parts.append(f"{who}: {truncate_tokens(plain(m.text), MESSAGE_TOKENS)}")
+        return "\n".join(parts)
+
+
+def plain(text: str) -> str:
+    """Mensagem sem o bloco de fontes e sem a marcação do Markdown."""
+    text = (text or "").split(SOURCES_MARK, 1)[0]
+    lines = [ln.strip().lstrip("•").strip() for ln in text.replace("**", "").splitlines()]
+    # cabeçalhos como "Resposta extrativa (sem LLM):" não dizem nada do conteúdo
+    return " ".join(ln for ln in lines if ln and not ln.endswith(":"))
+
+
+# ===== Transcrição (SQLite) =====
+class ConversationStore:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY, summary TEXT DEFAULT '', summarized INTEGER DEFAULT 0,
+                created REAL, updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation TEXT, seq INTEGER, role TEXT, text TEXT, query TEXT, created REAL,
+                PRIMARY KEY (conversation, seq)
+            );
+            CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated);
+            """
+        )
+        self._db.commit()
+        self._pruned = 0.0
+        self.prune()
+
+    def new_conversation(self) -> str:
+        """Cria a conversa; chame na primeira pergunta, não na abertura da sessão."""
+        if time.time() - self._pruned >= PRUNE_EVERY:
+            self.prune()
+        conv = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO conversations (id, created, updated) VALUES (?, ?, ?)", (conv, now, now))
+            self._db.commit()
+        return conv
+
+    def prune(self, max_age_days: float | None = None) -> int:
+        """Apaga as conversas sem mensagem nova há mais de CONVERSATION_RETENTION_DAYS; devolve quantas."""
+        days = SETTINGS.conversation_retention_days if max_age_days is None else float(max_age_days)
+        self._pruned = time.time()
+        if days <= 0:
+            return 0
+        cutoff = time.time() - days * 86400
+        with self._lock:
+            old = [r[0] for r in self._db.execute("SELECT id FROM conversations WHERE updated < ?", (cutoff,))]
+            self._db.executemany("DELETE FROM messages WHERE conversation = ?", [(c,) for c in old])
+            self._db.execute("DELETE FROM conversations WHERE updated < ?", (cutoff,))
+            self._db.commit()
+        return len(old)
+
+    def append(self, conv: str, role: str, text: str, query: str = "") -> int:
+        now = time.time()
+        with self._lock:
+            seq = self._db.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE conversation = ?", (conv,)
+            ).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO messages (conversation, seq, role, text, query, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (conv, seq, role, text, query, now),
+            )
+            self._db.execute(
+                "INSERT INTO conversations (id, created, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated = excluded.updated",
+                (conv, now, now),
+            )
+            self._db.commit()
+        return int(seq)
+
+    def set_query(self, conv: str, seq: int, query: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE messages SET query = ? WHERE conversation = ? AND seq = ?", (query, conv, seq))
+            self._db.commit()
+
+    def count(self, conv: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages WHERE conversation = ?", (conv,)).fetchone()[0]
+
+    def _tail(self, conv: str, n: int) -> List[Tuple[int, Message]]:
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, role, text, query FROM messages WHERE conversation = ? ORDER BY seq DESC LIMIT ?",
+                (conv, int(n)),
+            ).fetchall()
+        return [(r[0], Message(r[1], r[2], r[3] or "")) for r in reversed(rows)]
+
+    def recent(self, conv: str, n: int) -> List[Tuple[str, str]]:
+        """Últimas `n` mensagens (papel, texto), da mais antiga para a mais nova."""
+        return [(m.role, m.text) for _, m in self._tail(conv, n)]
+
+    def messages(self, conv: str) -> List[Tuple[str, str]]:
+        """Conversa inteira (para exportar)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, text FROM messages WHERE conversation = ? ORDER BY seq", (conv,)
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def summary(self, conv: str) -> Tuple[str, int]:
+        """Resumo acumulado e a última mensagem (seq) que já entrou nele."""
+        with self._lock:
+            row = self._db.execute("SELECT summary, summarized FROM conversations WHERE id = ?", (conv,)).fetchone()
+        return ((row[0] or ""), int(row[1] or 0)) if row else ("", 0)
+
+    def memory(self, conv: str, recent: int | None = None) -> Memory:
+        """
+        Resumo + as `recent` mensagens mais novas; as que já saíram delas mas
+        ainda esperam o próximo resumo (menos de FOLD_BATCH) vêm literais também.
+        """
+        recent = SETTINGS.conversation_recent if recent is None else recent
+        summary, done = self.summary(conv)
+        with self._lock:
+            last = self._db.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation = ?", (conv,)
+            ).fetchone()[0]
+        n = min(max(recent, last - done), recent + FOLD_BATCH)
+        return Memory(summary=summary, recent=[m for _, m in self._tail(conv, n)])
+
+    def pending(self, conv: str, recent: int, limit: int = FOLD_BATCH) -> List[Tuple[int, Message]]:
+        """Mensagens que já saíram das `recent` mais novas e ainda não estão no resumo."""
+        with self._lock:
+            done = self._db.execute("SELECT summarized FROM conversations WHERE id = ?", (conv,)).fetchone()
+            last = self._db.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation = ?", (conv,)
+            ).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT seq, role, text, query FROM messages WHERE conversation = ? AND seq > ? AND seq <= ? "
+                "ORDER BY seq LIMIT ?",
+                (conv, (done[0] or 0) if done else 0, last - max(0, recent), int(limit)),
+            ).fetchall()
+        return [(r[0], Message(r[1], r[2], r[3] or "")) for r in rows]
+
+    def set_summary(self, conv: str, summary: str, upto: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE conversations SET summary = ?, summarized = ?, updated = ? WHERE id = ?",
+                (summary, int(upto), time.time(), conv),
+            )
+            self._db.commit()
+
+    def clear(self, conv: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM messages WHERE conversation = ?", (conv,))
+            self._db.execute("DELETE FROM conversations WHERE id = ?", (conv,))
+            self._db.commit()
+
+
+_STORE: ConversationStore | None = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            os.makedirs(SETTINGS.data_dir, exist_ok=True)
+            _STORE = ConversationStore(os.path.join(SETTINGS.data_dir, "conversations.sqlite"))
+        return _STORE
+
+
+# ===== Reescrita da pergunta =====
+def is_followup(question: str) -> bool:
+    """
+    Pergunta que depende do que já foi dito ("e para a LO?", "qual o prazo dele?").
+    Pergunta curta não basta: "O que é TOG?" é independente.
+    """
+    q = question or ""
+    return bool(_FOLLOWUP_START.match(q) or _ANAPHORA.search(q))
+
+
+def _one_line(text: str) -> str:
+    line = next((ln.strip() for ln in (text or "").splitlines() if ln.strip()), "")
+    return line.strip("\"'“”«» ")
+
+
+def rewrite_query(question: str, memory: Memory, llm=None) -> str:
+    """
+    Pergunta completa para a busca. Sem histórico, desligada ou já
+    independente: a própria pergunta. Com LLM, ele reescreve; sem LLM (ou se
+    falhar), só uma continuação explícita ("e para a LO?") é juntada à última
+    pergunta completa — a anáfora sozinha ("qual o prazo dele?") segue como veio.
+    """
+    if not SETTINGS.conversation_rewrite or memory.empty or not is_followup(question):
+        return question
+    with span("conversation.rewrite") as s:
+        if llm is not None:
+            prompt = (
+                "Reescreva a ÚLTIMA PERGUNTA do usuário como uma pergunta completa e independente, em "
+                "português, usando o histórico só para resolver as referências (ex.: \"e para a LO?\"). "
+                "Responda apenas com a pergunta reescrita.\n\n"
+                f"HISTÓRICO:\n{memory.prompt_block()}\n\n"
+                f"ÚLTIMA PERGUNTA:\n{question}\n"
+            )
+            try:
+                out = _one_line(llm.complete(prompt, max_tokens=REWRITE_MAX_TOKENS))
+                if out:
+                    s.add("llm")
+                    return out
+            except Exception:
+                pass  # sem a reescrita do LLM, vale a junção simples
+        if not _FOLLOWUP_START.match(question):
+            return question
+        # com teto: continuações seguidas não fazem a pergunta crescer sem limite
+        previous = truncate_tokens(memory.last_query(), REWRITE_MAX_TOKENS)
+        return f"{previous} {question.strip()}".strip() if previous else question
+
+
+# ===== Resumo acumulado =====
+def _fold_extractive(summary: str, messages: List[Message], max_tokens: int) -> str:
+    lines = [ln for ln in summary.splitlines() if ln.strip()]
+    for m in messages:
+        if m.role == USER:
+            lines.append(f"- P: {m.query or m.text}")
+        else:
+            lines.append(f"  R: {truncate_tokens(plain(m.text), ANSWER_GIST_TOKENS)}")
+    # as mais antigas saem primeiro (a pergunta leva junto a resposta dela)
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+        while len(lines) > 1 and not lines[0].startswith("- "):
+            lines.pop(0)
+    return truncate_tokens("\n".join(lines), max_tokens)
+
+
+def fold_summary(summary: str, messages: List[Message], llm=None, max_tokens: int | None = None) -> str:
+    """Novo resumo = resumo atual + `messages`, dentro de `max_tokens` (CONVERSATION_SUMMARY_TOKENS)."""
+    max_tokens = SETTINGS.conversation_summary_tokens if max_tokens is None else int(max_tokens)
+    if not messages:
+        return summary
+    if llm is not None:
+        lines = "\n".join(
+            f"{'Usuário' if m.role == USER else 'Assistente'}: {truncate_tokens(plain(m.text), MESSAGE_TOKENS)}"
+            for m in messages
+        )
+        prompt = (
+            "Atualize o resumo de uma conversa entre um analista do IDEMA/RN e o assistente. Mantenha "
+            "assuntos, tipos de licença, empreendimentos, números e conclusões que possam ser retomados; "
+            f"descarte o resto. Use no máximo {max(20, max_tokens * 2 // 3)} palavras.\n\n"
+            f"RESUMO ATUAL:\n{summary or '(vazio)'}\n\n"
+            f"NOVAS MENSAGENS:\n{lines}\n\n"
+            "NOVO RESUMO:"
+        )
+        try:
+            out = llm.complete(prompt, max_tokens=max_tokens).strip()
+            if out:
+                return truncate_tokens(out, max_tokens)
+        except Exception:
+            pass  # sem o LLM, o resumo extrativo
+    return _fold_extractive(summary, messages, max_tokens)
+
+
+def update_memory(store: ConversationStore, conv: str, llm=None, recent: int | None = None) -> int:
+    """
+    Dobra no resumo o que saiu das mensagens recentes, em lotes de FOLD_BATCH:
+    o pedido extra ao LLM acontece a cada poucos turnos, não a cada um.
+    Devolve quantas mensagens entraram.
+    """
+    recent = SETTINGS.conversation_recent if recent is None else recent
+    pending = store.pending(conv, recent)
+    if len(pending) < FOLD_BATCH:
+        return 0
+    with span("conversation.summary", messages=len(pending)):
+        summary = fold_summary(store.summary(conv)[0], [m for _, m in pending], llm)
+        store.set_summary(conv, summary, pending[-1][0])
+    return len(pending)
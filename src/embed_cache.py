@@ -0,0 +1,217 @@
+# src/embed_cache.py
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .settings import SETTINGS
+
+
+def normalize_text(text: str) -> str:
+    """Normalização usada na chave do cache (NFC + espaços colapsados)."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings endereçado por conteúdo: (modelo, hash do texto normalizado).
+
+    - índice em SQLite (chave → linha da matriz, último uso);
+    - vetores numa matriz memory-mapped (float16 ou float32), um arquivo por modelo;
+    - no máximo `max_rows` linhas por modelo, com despejo LRU;
+    - contadores de acertos/faltas para acompanhamento.
+    """
+
+    def __init__(self, root: str, max_rows: int = 200_000, dtype: str = "float16"):
+        self.root = root
+        self.max_rows = int(max_rows)
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mms: Dict[str, np.memmap] = {}
+
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "embeddings.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS matrices (
+                model TEXT PRIMARY KEY, dim INTEGER, capacity INTEGER, next_slot INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                model TEXT, h TEXT, slot INTEGER, last_used REAL, PRIMARY KEY (model, h)
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, last_used);
+            """
+        )
+        self._db.commit()
+
+    # ---------- matriz em disco ----------
+    def _path(self, model: str, dim: int) -> str:
+        tag = hashlib.sha1(model.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.root, f"{tag}_{dim}d.{self.dtype.name}")
+
+    def _matrix(self, model: str) -> Tuple[np.memmap | None, int]:
+        row = self._db.execute("SELECT dim, capacity FROM matrices WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            return None, 0
+        dim, capacity = int(row[0]), int(row[1])
+        mm = self._mms.get(model)
+        if mm is None or mm.shape != (capacity, dim):
+            mm = np.memmap(self._path(model, dim), dtype=self.dtype, mode="r+", shape=(capacity, dim))
+            self._mms[model] = mm
+        return mm, dim
+
+    def _grow(self, model: str, dim: int, capacity: int) -> None:
+        path = self._path(model, dim)
+        self._mms.pop(model, None)
+        with open(path, "ab") as f:
+            f.truncate(capacity * dim * self.dtype.itemsize)
+        self._db.execute("UPDATE matrices SET capacity = ? WHERE model = ?", (capacity, model))
+
+    def _alloc(self, model: str, dim: int, n: int) -> List[int]:
+        """Reserva `n` linhas: novas enquanto houver espaço, depois despeja as menos usadas."""
+        row = self._db.execute("SELECT capacity, next_slot FROM matrices WHERE model = ?", (model,)).fetchone()
+        if row is None:
+            capacity, next_slot = 0, 0
+            self._db.execute("INSERT INTO matrices VALUES (?, ?, 0, 0)", (model, dim))
+        else:
+            capacity, next_slot = int(row[0]), int(row[1])
+
+        slots: List[int] = []
+        fresh = min(n, self.max_rows - next_slot)
+        if fresh > 0:
+            slots.extend(range(next_slot, next_slot + fresh))
+            next_slot += fresh
+            self._db.execute("UPDATE matrices SET next_slot = ? WHERE model = ?", (next_slot, model))
+            if next_slot > capacity:
+                new_cap = min(self.max_rows, max(next_slot, capacity * 2, 1024))
+                self._grow(model, dim, new_cap)
+
+        missing = n - len(slots)
+        if missing > 0:
+            victims = self._db.execute(
+                "SELECT h, slot FROM entries WHERE model = ? ORDER BY last_used LIMIT ?",
+                (model, missing),
+            ).fetchall()
+            self._db.executemany(
+                "DELETE FROM entries WHERE model = ? AND h = ?", [(model, h) for h, _ in victims]
+            )
+            slots.extend(int(s) for _, s in victims)
+        return slots
+
+    def _slots_of(self, model: str, hashes: Sequence[str]) -> Dict[str, int]:
+        found: Dict[str, int] = {}
+        uniq = list(dict.fromkeys(hashes))
+        for i in range(0, len(uniq), 500):
+            part = uniq[i : i + 500]
+            marks = ",".join("?" * len(part))
+            for h, slot in self._db.execute(
+                f"SELECT h, slot FROM entries WHERE model = ? AND h IN ({marks})", (model, *part)
+            ):
+                found[h] = int(slot)
+        return found
+
+    # ---------- API ----------
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """Retorna {índice do texto: vetor float32} apenas para os textos em cache."""
+        if not texts:
+            return {}
+        hashes = [text_hash(t) for t in texts]
+        with self._lock:
+            found = self._slots_of(model, hashes)
+            out: Dict[int, np.ndarray] = {}
+            if found:
+                mm, _ = self._matrix(model)
+                if mm is not None:
+                    now = time.time()
+                    self._db.executemany(
+                        "UPDATE entries SET last_used = ? WHERE model = ? AND h = ?",
+                        [(now, model, h) for h in found],
+                    )
+                    self._db.commit()
+                    for i, h in enumerate(hashes):
+                        slot = found.get(h)
+                        if slot is not None:
+                            out[i] = np.asarray(mm[slot], dtype=np.float32)
+            self.hits += len(out)
+            self.misses += len(texts) - len(out)
+            return out
+
+    def put_many(self, model: str, texts: Sequence[str], vecs: np.ndarray) -> None:
+        if self.max_rows <= 0 or not len(texts):
+            return
+        vecs = np.asarray(vecs, dtype=np.float32)
+        uniq: Dict[str, int] = {}
+        for i, t in enumerate(texts):
+            uniq.setdefault(text_hash(t), i)
+        items = list(uniq.items())[-self.max_rows :]
+
+        with self._lock:
+            row = self._db.execute("SELECT dim FROM matrices WHERE model = ?", (model,)).fetchone()
+            dim = int(vecs.shape[1])
+            if row is not None and int(row[0]) != dim:
+                return  # mesmo nome de modelo com outra dimensão: não mistura
+            known = self._slots_of(model, [h for h, _ in items])
+            items = [(h, i) for h, i in items if h not in known]
+            if not items:
+                return
+
+            slots = self._alloc(model, dim, len(items))
+            mm, _ = self._matrix(model)
+            now = time.time()
+            for (h, i), slot in zip(items, slots):
+                mm[slot] = vecs[i]
+            mm.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                [(model, h, slot, now) for (h, _), slot in zip(items, slots)],
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            rows = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "rows": int(rows),
+        }
+
+
+_CACHE: EmbeddingCache | None = None
+_CACHE_LOCK = threading.Lock()
+_CACHE_FAILED = False
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Cache do processo (None se desativado ou se o diretório não for gravável)."""
+    global _CACHE, _CACHE_FAILED
+    if SETTINGS.embed_cache_max_rows <= 0 or _CACHE_FAILED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                _CACHE = EmbeddingCache(
+                    os.path.join(SETTINGS.data_dir, "embeddings"),
+                    max_rows=SETTINGS.embed_cache_max_rows,
+                    dtype=SETTINGS.embed_cache_dtype,
+                )
+            except Exception:
+                _CACHE_FAILED = True
+                return None
+        return _CACHE
@@ -0,0 +1,187 @@
+# src/filter_expr.py
+"""
+Subconjunto das expressões booleanas do Milvus usado pelo app, para os backends locais:
+
+    tipo_licenca == "RLO" && tipo_empreendimento == "POÇO"
+    fonte == "x.pdf" and pagina in [1, 2, 3]
+    pagina != 0
+
+Cláusulas `campo == valor`, `campo != valor`, `campo in [...]` e `campo not in [...]`,
+unidas por `&&`/`and`. Literais: strings entre aspas duplas (com escapes) e inteiros.
+MetadataColumns avalia essas expressões sobre colunas em memória, de forma vetorizada.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+Literal = Union[str, int]
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<str>"(?:[^"\\]|\\.)*")
+      | (?P<num>-?\d+)
+      | (?P<op>==|!=|&&|\[|\]|,)
+      | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""",
+    re.VERBOSE,
+)
+
+
+@dataclass(frozen=True)
+class Clause:
+    field: str
+    op: str  # "==", "!=", "in", "not in"
+    values: Tuple[Literal, ...]
+
+
+def _tokens(expr: str) -> List[Tuple[str, str]]:
+    out, pos = [], 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Expressão de filtro não suportada perto de: {expr[pos:pos + 20]!r}")
+        kind = m.lastgroup or ""
+        out.append((kind, m.group(kind)))
+        pos = m.end()
+        while pos < len(expr) and expr[pos].isspace():
+            pos += 1
+    return out
+
+
+def _literal(kind: str, text: str) -> Literal:
+    if kind == "str":
+        return re.sub(r"\\(.)", r"\1", text[1:-1])
+    if kind == "num":
+        return int(text)
+    raise ValueError(f"Literal inválido no filtro: {text!r}")
+
+
+def parse(expr: str | None) -> List[Clause]:
+    """Converte a expressão em cláusulas (conjunção). Vazio/None → []."""
+    if not expr or not expr.strip():
+        return []
+    toks = _tokens(expr)
+    clauses: List[Clause] = []
+    i = 0
+
+    def take() -> Tuple[str, str]:
+        nonlocal i
+        if i >= len(toks):
+            raise ValueError(f"Expressão de filtro incompleta: {expr!r}")
+        i += 1
+        return toks[i - 1]
+
+    while True:
+        kind, field = take()
+        if kind != "word":
+            raise ValueError(f"Campo esperado no filtro: {field!r}")
+        kind, op = take()
+        if op == "not":
+            _, nxt = take()
+            if nxt != "in":
+                raise ValueError(f"Operador não suportado no filtro: not {nxt}")
+            op = "not in"
+        if op in ("==", "!="):
+            clauses.append(Clause(field, op, (_literal(*take()),)))
+        elif op in ("in", "not in"):
+            if take()[1] != "[":
+                raise ValueError("Lista esperada após 'in' no filtro.")
+            values: List[Literal] = []
+            while True:
+                kind, text = take()
+                if text == "]" and kind == "op":
+                    break
+                if text == "," and kind == "op":
+                    continue
+                values.append(_literal(kind, text))
+            clauses.append(Clause(field, op, tuple(values)))
+        else:
+            raise ValueError(f"Operador não suportado no filtro: {op!r}")
+
+        if i >= len(toks):
+            return clauses
+        _, conj = take()
+        if conj not in ("&&", "and"):
+            raise ValueError(f"Só conjunções (&&/and) são suportadas no filtro, não {conj!r}.")
+
+
+def fields(clauses: Sequence[Clause]) -> List[str]:
+    return sorted({c.field for c in clauses})
+
+
+class _Codes:
+    """Coluna de strings codificada como inteiros (filtro vetorizado)."""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.codes = np.zeros(0, dtype=np.int32)
+
+    def code(self, value: str) -> int:
+        c = self.index.get(value)
+        if c is None:
+            c = self.index[value] = len(self.index)
+        return c
+
+    def extend(self, values: Sequence[str]) -> None:
+        self.codes = np.concatenate([self.codes, np.array([self.code(str(v)) for v in values], dtype=np.int32)])
+
+
+class MetadataColumns:
+    """
+    Metadados por linha (id = posição) para filtrar sem consultar o SQLite:
+    strings codificadas, `pagina` inteira e a marca de linha viva (deletes lógicos).
+    """
+
+    STR_FIELDS = ("fonte", "tipo_licenca", "tipo_empreendimento")
+
+    def __init__(self):
+        self.n = 0
+        self.alive = np.zeros(0, dtype=bool)
+        self.pagina = np.zeros(0, dtype=np.int64)
+        self._codes = {f: _Codes() for f in self.STR_FIELDS}
+
+    def extend(
+        self,
+        fontes: Sequence[str],
+        paginas: Sequence[int],
+        tipo_licenca: Sequence[str],
+        tipo_empreendimento: Sequence[str],
+        alive: Sequence[bool] | None = None,
+    ) -> None:
+        n = len(fontes)
+        for f, values in zip(self.STR_FIELDS, (fontes, tipo_licenca, tipo_empreendimento)):
+            self._codes[f].extend(values)
+        self.pagina = np.concatenate([self.pagina, np.asarray(paginas, dtype=np.int64).reshape(-1)])
+        flags = np.ones(n, dtype=bool) if alive is None else np.asarray(alive, dtype=bool)
+        # `alive` é trocado por último: buscas concorrentes só veem linhas completas
+        self.alive = np.concatenate([self.alive, flags])
+        self.n += n
+
+    def kill(self, ids: np.ndarray) -> None:
+        self.alive[ids] = False
+
+    def mask(self, expr: str | None, n: int | None = None) -> np.ndarray:
+        """Linhas vivas (até `n`) que satisfazem a expressão."""
+        n = self.n if n is None else n
+        mask = self.alive[:n].copy()
+        for c in parse(expr):
+            if c.field == "pagina":
+                col = self.pagina[:n]
+                vals = np.array([int(v) for v in c.values], dtype=np.int64)
+            elif c.field in self._codes:
+                codes = self._codes[c.field]
+                col = codes.codes[:n]
+                vals = np.array([codes.index.get(str(v), -1) for v in c.values], dtype=np.int32)
+            elif c.field == "id":
+                col = np.arange(n, dtype=np.int64)
+                vals = np.array([int(v) for v in c.values], dtype=np.int64)
+            else:
+                raise ValueError(f"Campo não filtrável: {c.field}")
+            hit = np.isin(col, vals)
+            mask &= ~hit if c.op in ("!=", "not in") else hit
+        return mask
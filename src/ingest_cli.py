@@ -0,0 +1,168 @@
+# src/ingest_cli.py
+"""
+Ingestão em lote pela linha de comando (sem Streamlit), sobre o ingest_pdfs().
+
+    python -m src.ingest_cli PASTA [--manifest tipos.csv] [--tipo-licenca RLO --tipo-empreendimento POÇO]
+                                   [--embeddings cloud|local] [--collection NOME]
+
+Tipos de cada PDF, nesta ordem:
+1. --manifest: CSV (ou JSON) com as colunas arquivo, tipo_licenca, tipo_empreendimento
+   (arquivo relativo à PASTA);
+2. estrutura de pastas: PASTA/<tipo_licenca>/<tipo_empreendimento>/arquivo.pdf;
+3. --tipo-licenca / --tipo-empreendimento como padrão.
+
+Retomada: o ingest_pdfs grava um checkpoint no manifesto a cada lote inserido.
+Se a execução cair (Ctrl+C, queda de rede…), basta rodar o mesmo comando de novo:
+documentos completos são pulados e os interrompidos continuam da última página gravada.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from dataclasses import fields
+from typing import Dict, Iterator, List, Tuple
+
+from .rag import IngestReport, collection_for, ingest_pdfs
+from .settings import SETTINGS
+
+Types = Tuple[str, str]
+
+
+def _read_manifest(path: str) -> Dict[str, Types]:
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    out: Dict[str, Types] = {}
+    for r in rows:
+        try:
+            out[os.path.normpath(r["arquivo"])] = (r["tipo_licenca"].strip(), r["tipo_empreendimento"].strip())
+        except KeyError as e:
+            raise ValueError(f"Manifesto sem a coluna {e} (use arquivo, tipo_licenca, tipo_empreendimento).") from None
+    return out
+
+
+def discover(root: str, manifest: Dict[str, Types], default: Types | None) -> Tuple[Dict[Types, List[str]], List[str]]:
+    """Agrupa os PDFs por (tipo_licenca, tipo_empreendimento); devolve também os sem tipo."""
+    groups: Dict[Types, List[str]] = defaultdict(list)
+    missing: List[str] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.lower().endswith(".pdf"):
+                continue
+            rel = os.path.normpath(os.path.relpath(os.path.join(dirpath, name), root))
+            parts = rel.split(os.sep)
+            if rel in manifest:
+                types = manifest[rel]
+            elif len(parts) >= 3:
+                types = (parts[-3], parts[-2])
+            elif default is not None:
+                types = default
+            else:
+                missing.append(rel)
+                continue
+            groups[types].append(rel)
+    return groups, missing
+
+
+def _read_files(root: str, rels: List[str]) -> Iterator[Tuple[str, bytes]]:
+    # um PDF em memória por vez; a fonte usa o nome do arquivo, como no upload do app
+    for rel in rels:
+        with open(os.path.join(root, rel), "rb") as f:
+            yield os.path.basename(rel), f.read()
+
+
+def _rate(n: int, seconds: float) -> str:
+    return f"{n / seconds:,.1f}/s" if seconds > 0 else "—"
+
+
+def _encoder(kind: str):
+    from .llm_router import get_embeddings_cloud, get_embeddings_local
+
+    if kind == "auto":
+        kind = "cloud" if SETTINGS.openai_api_key else "local"
+    if kind == "cloud":
+        if not SETTINGS.openai_api_key:
+            raise RuntimeError("OPENAI_API_KEY ausente para --embeddings cloud.")
+        return get_embeddings_cloud(api_key=SETTINGS.openai_api_key)
+    return get_embeddings_local()
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m src.ingest_cli", description="Ingestão de PDFs em lote, com retomada.")
+    ap.add_argument("pasta")
+    ap.add_argument("--manifest", help="CSV/JSON com arquivo, tipo_licenca, tipo_empreendimento")
+    ap.add_argument("--tipo-licenca")
+    ap.add_argument("--tipo-empreendimento")
+    ap.add_argument("--embeddings", choices=["auto", "cloud", "local"], default="auto")
+    ap.add_argument("--collection", help="padrão: o mesmo nome que o app usaria")
+    args = ap.parse_args(argv)
+
+    if bool(args.tipo_licenca) != bool(args.tipo_empreendimento):
+        ap.error("informe --tipo-licenca e --tipo-empreendimento juntos")
+    default = (args.tipo_licenca, args.tipo_empreendimento) if args.tipo_licenca else None
+    manifest = _read_manifest(args.manifest) if args.manifest else {}
+    groups, missing = discover(args.pasta, manifest, default)
+    if missing:
+        print(f"{len(missing)} PDF(s) sem tipo (use --manifest, pastas ou os padrões):", file=sys.stderr)
+        for rel in missing:
+            print(f"  {rel}", file=sys.stderr)
+        return 2
+    if not groups:
+        print("Nenhum PDF encontrado.", file=sys.stderr)
+        return 1
+
+    encoder = _encoder(args.embeddings)
+    coll_name = args.collection or collection_for(encoder, SETTINGS.milvus_collection)
+    n_files = sum(len(v) for v in groups.values())
+    print(f"{n_files} PDF(s) em {len(groups)} grupo(s) → coleção {coll_name}")
+
+    total = IngestReport()
+    done_before = 0
+    t0 = time.perf_counter()
+    try:
+        for (tlic, temp), rels in sorted(groups.items()):
+            print(f"[{tlic}/{temp}] {len(rels)} arquivo(s)")
+
+            last = [-1, -1]
+
+            def _progress(done: int, _total: int, chunks: int, base: int = done_before) -> None:
+                if [done, chunks] != last:  # o último lote repete a contagem final
+                    last[:] = [done, chunks]
+                    print(f"  {base + done}/{n_files} arquivo(s) · {chunks} trechos inseridos", flush=True)
+
+            rep = ingest_pdfs(encoder, _read_files(args.pasta, rels), tlic, temp, coll_name, progress=_progress)
+            for f in fields(IngestReport):
+                setattr(total, f.name, getattr(total, f.name) + getattr(rep, f.name))
+            done_before += len(rels)
+    except KeyboardInterrupt:
+        print("\nInterrompido. Rode o mesmo comando para continuar do último lote gravado.", file=sys.stderr)
+        return 130
+    wall = time.perf_counter() - t0
+
+    print(
+        f"\nDocumentos: {total.docs_added} novos, {total.docs_replaced} atualizados, "
+        f"{total.docs_resumed} retomados, {total.docs_skipped} sem mudança"
+    )
+    print(
+        f"Páginas: {total.pages_added} novas, {total.pages_replaced} substituídas, "
+        f"{total.pages_skipped} puladas, {total.pages_removed} removidas · {total.chunks} trechos inseridos"
+    )
+    print("Vazão por etapa:")
+    print(f"  extração  {total.extract_s:8.2f} s  {_rate(total.pages_extracted, total.extract_s)} páginas")
+    print(f"  embedding {total.embed_s:8.2f} s  {_rate(total.chunks, total.embed_s)} trechos")
+    print(f"  inserção  {total.insert_s:8.2f} s  {_rate(total.chunks, total.insert_s)} trechos")
+    print(f"  total     {wall:8.2f} s  {_rate(total.chunks, wall)} trechos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# src/jobs.py
+"""
+Fila de ingestão em segundo plano, fora da execução do script do Streamlit.
+
+- os uploads são gravados em disco (DATA_DIR/uploads/<job>/) no envio; a
+  sessão só guarda o id do job e acompanha o andamento pela tabela;
+- tabela `jobs` em SQLite (DATA_DIR/jobs.sqlite): situação
+  (queued → running → done | failed), arquivos/trechos concluídos, o
+  IngestReport final e o erro, se houver;
+- no máximo INGEST_MAX_CONCURRENT ingestões ao mesmo tempo (threads do
+  processo, que compartilham o pool de encoders): um upload grande não
+  disputa CPU/rede com as consultas além desse limite;
+- a chave da OpenAI fica só na memória do processo, nunca na tabela. Jobs
+  que o processo deixou pela metade voltam para a fila na próxima abertura
+  (o ingest_pdfs retoma do último checkpoint) quando o encoder pode ser
+  recriado: embeddings locais ou a mesma chave do app.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .settings import SETTINGS
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+
+@dataclass
+class Job:
+    id: str
+    collection: str
+    tipo_licenca: str
+    tipo_empreendimento: str
+    files: List[str]
+    status: str = QUEUED
+    files_done: int = 0
+    chunks: int = 0
+    report: Dict[str, float] = field(default_factory=dict)
+    error: str = ""
+    created: float = 0.0
+    started: float = 0.0
+    finished: float = 0.0
+
+    @property
+    def files_total(self) -> int:
+        return len(self.files)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    @property
+    def elapsed(self) -> float:
+        if not self.started:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+_COLUMNS = (
+    "id, collection, tipo_licenca, tipo_empreendimento, files, status, "
+    "files_done, chunks, report, error, created, started, finished"
+)
+
+
+def _row_to_job(row: Tuple) -> Job:
+    return Job(
+        id=row[0],
+        collection=row[1],
+        tipo_licenca=row[2],
+        tipo_empreendimento=row[3],
+        files=json.loads(row[4]),
+        status=row[5],
+        files_done=int(row[6]),
+        chunks=int(row[7]),
+        report=json.loads(row[8]) if row[8] else {},
+        error=row[9] or "",
+        created=row[10] or 0.0,
+        started=row[11] or 0.0,
+        finished=row[12] or 0.0,
+    )
+
+
+def _make_encoder(kind: str, model: str, api_key: str | None):
+    from .llm_router import get_embeddings_cloud, get_embeddings_local
+
+    if kind == "cloud":
+        return get_embeddings_cloud(model=model, api_key=api_key)
+    return get_embeddings_local(model)
+
+
+def _key_id(api_key: str | None) -> str:
+    from .llm_router import _key_id as key_id
+
+    return key_id(api_key or "")
+
+
+class JobQueue:
+    def __init__(self, root: str, max_workers: int = 1, app_key: str | None = None):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.spool_dir = os.path.join(root, "uploads")
+        self._db = sqlite3.connect(os.path.join(root, "jobs.sqlite"), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, collection TEXT, tipo_licenca TEXT, tipo_empreendimento TEXT,
+                files TEXT, status TEXT, files_done INTEGER DEFAULT 0, chunks INTEGER DEFAULT 0,
+                report TEXT, error TEXT, created REAL, started REAL, finished REAL,
+                embeddings TEXT, model TEXT, key_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+            """
+        )
+        self._db.commit()
+        self._keys: Dict[str, str] = {}  # job → chave da OpenAI (só em memória)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="ingest")
+        self._recover(app_key)
+
+    # ---------- tabela ----------
+    def _update(self, job_id: str, **values) -> None:
+        cols = ", ".join(f"{k} = ?" for k in values)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*values.values(), job_id))
+            self._db.commit()
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, ids: Iterable[str] | None = None, limit: int = 20) -> List[Job]:
+        """Jobs mais recentes primeiro (todos, ou só os de `ids`)."""
+        with self._lock:
+            if ids is None:
+                rows = self._db.execute(
+                    f"SELECT {_COLUMNS} FROM jobs ORDER BY created DESC LIMIT ?", (int(limit),)
+                ).fetchall()
+            else:
+                ids = list(ids)
+                marks = ",".join("?" * len(ids))
+                rows = self._db.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE id IN ({marks}) ORDER BY created DESC LIMIT ?",
+                    (*ids, int(limit)),
+                ).fetchall() if ids else []
+        return [_row_to_job(r) for r in rows]
+
+    # ---------- envio ----------
+    def submit(
+        self,
+        files: Iterable[Tuple[str, bytes]],
+        tipo_licenca: str,
+        tipo_empreendimento: str,
+        collection_name: str,
+        embeddings: str = "local",
+        model: str = "",
+        api_key: str | None = None,
+    ) -> str:
+        """
+        Grava os PDFs em disco e enfileira a ingestão; retorna o id do job.
+        `embeddings`: "cloud" (OpenAI, `model` e `api_key`) ou "local".
+        """
+        if embeddings not in ("cloud", "local"):
+            raise ValueError(f"embeddings inválido: {embeddings!r} (use cloud ou local).")
+        if embeddings == "cloud" and not api_key:
+            raise RuntimeError("Forneça uma OPENAI_API_KEY para indexar com embeddings da OpenAI.")
+        model = model or ("text-embedding-3-large" if embeddings == "cloud" else "all-MiniLM-L6-v2")
+
+        job_id = uuid.uuid4().hex[:12]
+        spool = os.path.join(self.spool_dir, job_id)
+        os.makedirs(spool, exist_ok=True)
+        names: List[str] = []
+        try:
+            # nome original fica na tabela; no disco, só o índice (nada de caminhos vindos do upload)
+            for i, (name, data) in enumerate(files):
+                with open(os.path.join(spool, f"{i:05d}.pdf"), "wb") as f:
+                    f.write(data)
+                names.append(os.path.basename(name))
+        except BaseException:
+            shutil.rmtree(spool, ignore_errors=True)
+            raise
+        if not names:
+            shutil.rmtree(spool, ignore_errors=True)
+            raise ValueError("Nenhum arquivo para indexar.")
+
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, collection, tipo_licenca, tipo_empreendimento, files, status, created, "
+                "embeddings, model, key_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, collection_name, tipo_licenca, tipo_empreendimento, json.dumps(names), QUEUED,
+                    time.time(), embeddings, model, _key_id(api_key) if embeddings == "cloud" else "",
+                ),
+            )
+            self._db.commit()
+        if api_key:
+            self._keys[job_id] = api_key
+        self._pool.submit(self._run, job_id)
+        return job_id
+
+    # ---------- execução ----------
+    def _spooled(self, job_id: str, names: List[str]) -> Iterator[Tuple[str, bytes]]:
+        # um PDF em memória por vez, como no upload
+        spool = os.path.join(self.spool_dir, job_id)
+        for i, name in enumerate(names):
+            with open(os.path.join(spool, f"{i:05d}.pdf"), "rb") as f:
+                yield name, f.read()
+
+    def _run(self, job_id: str) -> None:
+        from .rag import ingest_pdfs
+
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return
+        with self._lock:
+            kind, model = self._db.execute("SELECT embeddings, model FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        self._update(job_id, status=RUNNING, started=time.time())
+        try:
+            encoder = _make_encoder(kind, model, self._keys.get(job_id))
+
+            def _progress(done: int, _total: int, chunks: int) -> None:
+                self._update(job_id, files_done=done, chunks=chunks)
+
+            rep = ingest_pdfs(
+                encoder=encoder,
+                files=self._spooled(job_id, job.files),
+                tipo_licenca=job.tipo_licenca,
+                tipo_empreendimento=job.tipo_empreendimento,
+                collection_name=job.collection,
+                progress=_progress,
+            )
+            self._update(
+                job_id, status=DONE, files_done=len(job.files), chunks=rep.chunks,
+                report=json.dumps(asdict(rep)), finished=time.time(),
+            )
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", finished=time.time())
+        finally:
+            self._keys.pop(job_id, None)
+            shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+
+    def _recover(self, app_key: str | None = None) -> None:
+        """Jobs deixados na fila/em execução por um processo anterior (`app_key`: chave do app, se houver)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, embeddings, key_id FROM jobs WHERE status IN (?, ?) ORDER BY created", ACTIVE
+            ).fetchall()
+        app_key = app_key or SETTINGS.openai_api_key or os.getenv("OPENAI_API_KEY", "")
+        for job_id, kind, key_id in rows:
+            if not os.path.isdir(os.path.join(self.spool_dir, job_id)):
+                self._update(job_id, status=FAILED, error="Interrompido: arquivos enviados não encontrados.",
+                             finished=time.time())
+            elif kind == "cloud" and (not app_key or _key_id(app_key) != key_id):
+                self._update(job_id, status=FAILED, error="Interrompido: envie os PDFs de novo (a chave da "
+                             "OpenAI usada não fica gravada).", finished=time.time())
+                shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+            else:
+                if kind == "cloud":
+                    self._keys[job_id] = app_key
+                self._update(job_id, status=QUEUED)
+                self._pool.submit(self._run, job_id)
+
+    def wait(self, job_id: str, timeout: float | None = None, poll: float = 0.1) -> Job | None:
+        """Bloqueia até o job terminar (linha de comando/benchmarks)."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or not job.active or (end is not None and time.monotonic() >= end):
+                return job
+            time.sleep(poll)
+
+
+_QUEUE: JobQueue | None = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_job_queue(app_key: str | None = None) -> JobQueue:
+    """Fila do processo; a primeira chamada retoma os jobs interrompidos (`app_key` só vale nela)."""
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = JobQueue(SETTINGS.data_dir, max_workers=SETTINGS.ingest_max_concurrent, app_key=app_key)
+        return _QUEUE
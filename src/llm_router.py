@@ -1,24 +1,30 @@
 # src/llm_router.py
 from __future__ import annotations
 
+import hashlib
+import importlib.util
 import os
-import re
-from dataclasses import dataclass
-from typing import List, Sequence
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Sequence, TypeVar
 
-# Embeddings cloud/local
-from openai import OpenAI
-
-try:
-    # sentence-transformers para embeddings locais (CPU)
-    from sentence_transformers import SentenceTransformer
-    _HAS_ST = True
-except Exception:
-    _HAS_ST = False
-
-# Para o extrativo (sem LLM)
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+from .sentence_index import (
+    MAX_SENTENCES_PER_CONTEXT,
+    Sentence,
+    analyze,
+    cosine_scores,
+    get_sentence_index,
+    idf,
+    term_counts,
+)
+from .context_packer import PackedContext, pack_contexts
+from .settings import SETTINGS
+from .tokens import count_tokens
+from .tracing import record, span, traced
 
 
 # -------------------------
@@ -32,14 +38,54 @@ def _ensure_2d_list(vecs) -> List[List[float]]:
     return [[float(x) for x in row] for row in vecs]
 
 
-def _split_sentences(text: str) -> List[str]:
-    # split simples e robusto, evitando quebrar demais
-    text = re.sub(r"\s+", " ", text).strip()
-    sents = re.split(r"(?<=[.!?])\s+(?=[A-ZÁÂÃÀÉÊÍÓÔÕÚÜÇ])", text)
-    # fallback se vier muito curto
-    if len(sents) <= 1:
-        sents = re.split(r"[.;:\n]+", text)
-    return [s.strip() for s in sents if s.strip()]
+T = TypeVar("T")
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """429, 5xx, timeouts e falhas de conexão merecem nova tentativa."""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "RateLimitError")
+
+
+def _retry_after(exc: Exception) -> float | None:
+    resp = getattr(exc, "response", None)
+    try:
+        return float(resp.headers.get("retry-after"))  # type: ignore[union-attr]
+    except Exception:
+        return None
+
+
+def with_retries(fn: Callable[[], T], max_retries: int, base_delay: float = 0.5, max_delay: float = 30.0) -> T:
+    """Executa `fn` com backoff exponencial e jitter total nas falhas transitórias."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            time.sleep(min(delay, max_delay))
+            attempt += 1
+
+
+def pack_by_tokens(texts: Sequence[str], max_tokens: int, max_inputs: int) -> List[range]:
+    """Agrupa índices consecutivos em lotes de até `max_tokens` tokens e `max_inputs` entradas."""
+    batches: List[range] = []
+    start, used = 0, 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t)
+        if i > start and (used + n > max_tokens or i - start >= max_inputs):
+            batches.append(range(start, i))
+            start, used = i, 0
+        used += n
+    if start < len(texts):
+        batches.append(range(start, len(texts)))
+    return batches
 
 
 # -------------------------
@@ -47,28 +93,76 @@ def _split_sentences(text: str) -> List[str]:
 # -------------------------
 @dataclass
 class EmbeddingsCloud:
+    """
+    Embeddings da OpenAI com envio concorrente:
+    - lotes empacotados por nº de tokens (limites da API por requisição);
+    - até `concurrency` requisições em voo;
+    - 429/5xx com backoff exponencial + jitter (respeita Retry-After);
+    - resultados remontados na ordem de entrada.
+    """
+
     model: str = "text-embedding-3-large"  # 3072 dims
+    api_key: str = field(default="", repr=False)  # vazio → OPENAI_API_KEY
+    concurrency: int = field(default_factory=lambda: SETTINGS.openai_embed_concurrency)
+    max_inputs: int = field(default_factory=lambda: SETTINGS.openai_embed_max_inputs)
+    max_tokens: int = field(default_factory=lambda: SETTINGS.openai_embed_max_tokens)
+    max_retries: int = field(default_factory=lambda: SETTINGS.openai_max_retries)
+    # o rag.py entrega lotes maiores para haver o que paralelizar
+    batch_size: int = 512
 
     def __post_init__(self):
-        key = os.getenv("OPENAI_API_KEY", "")
+        key = self.api_key or os.getenv("OPENAI_API_KEY", "")
         if not key:
             raise RuntimeError("OPENAI_API_KEY ausente para EmbeddingsCloud.")
-        self.client = OpenAI(api_key=key)
+        from openai import OpenAI  # import no primeiro uso: não pesa na abertura do app
+
+        # as novas tentativas ficam por nossa conta (with_retries), não do cliente
+        self.client = OpenAI(api_key=key, max_retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="emb")
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        with span("openai.embed", inputs=len(texts)) as s:
+            resp = with_retries(
+                lambda: self.client.embeddings.create(model=self.model, input=texts),
+                max_retries=self.max_retries,
+            )
+            usage = getattr(resp, "usage", None)
+            s.add("tokens", getattr(usage, "total_tokens", 0) or 0)
+        data = sorted(resp.data, key=lambda d: d.index)
+        return [d.embedding for d in data]
 
     def encode(self, texts: Sequence[str]):
         # OpenAI v1
-        resp = self.client.embeddings.create(model=self.model, input=list(texts))
-        vecs = [d.embedding for d in resp.data]
+        texts = list(texts)
+        batches = pack_by_tokens(texts, self.max_tokens, self.max_inputs)
+        if len(batches) <= 1:
+            return _ensure_2d_list(self._request(texts))
+        parts: List[Any] = []
+        for b in batches:
+            try:
+                parts.append(self._executor.submit(self._request, texts[b.start : b.stop]))
+            except RuntimeError:  # close() no meio do uso (descartado do pool): o resto vai em série
+                parts.append(self._request(texts[b.start : b.stop]))
+        vecs: List[List[float]] = []
+        for part in parts:  # mesma ordem dos lotes → mesma ordem dos textos
+            vecs.extend(part.result() if isinstance(part, Future) else part)
         return _ensure_2d_list(vecs)
 
+    def close(self) -> None:
+        """Encerra as threads de envio (o ResourcePool chama ao descartar a instância)."""
+        self._executor.shutdown(wait=False)
+
 
 @dataclass
 class EmbeddingsLocal:
     model_name: str = "all-MiniLM-L6-v2"  # 384 dims (rápido)
 
     def __post_init__(self):
-        if not _HAS_ST:
-            raise RuntimeError("sentence-transformers não disponível para EmbeddingsLocal.")
+        try:
+            # sentence-transformers (e o torch) só quando um encoder local é criado
+            from sentence_transformers import SentenceTransformer
+        except Exception:
+            raise RuntimeError("sentence-transformers não disponível para EmbeddingsLocal.") from None
         # força CPU
         self.model = SentenceTransformer(self.model_name, device="cpu")
 
@@ -77,35 +171,124 @@ class EmbeddingsLocal:
         return _ensure_2d_list(vecs)
 
 
+@dataclass
+class EmbeddingsOnnx:
+    """
+    Mesmo modelo do EmbeddingsLocal, exportado para ONNX com pesos int8 e
+    rodando no onnxruntime (src/onnx_embed.py): sem torch no processo, menos
+    memória e mais trechos/s na CPU. Os vetores são conferidos contra os do
+    PyTorch na exportação, por isso a coleção "local" é a mesma.
+    """
+
+    model_name: str = "all-MiniLM-L6-v2"
+    threads: int = field(default_factory=lambda: SETTINGS.onnx_threads)
+    session_batch: int = field(default_factory=lambda: SETTINGS.onnx_batch_size)
+    # o rag.py entrega lotes maiores: mais textos para ordenar por tamanho
+    batch_size: int = 256
+
+    def __post_init__(self):
+        from .onnx_embed import OnnxEncoder, ensure_exported
+
+        self.model = OnnxEncoder(ensure_exported(self.model_name), threads=self.threads, batch_size=self.session_batch)
+
+    def encode(self, texts: Sequence[str]):
+        return self.model.encode(list(texts))
+
+
 # -------------------------
 # LLM na Nuvem (opcional)
 # -------------------------
 @dataclass
 class LLMCloud:
     model: str = "gpt-4o-mini"
+    api_key: str = field(default="", repr=False)  # vazio → OPENAI_API_KEY
+    context_tokens: int = field(default_factory=lambda: SETTINGS.context_max_tokens)
 
     def __post_init__(self):
-        key = os.getenv("OPENAI_API_KEY", "")
+        key = self.api_key or os.getenv("OPENAI_API_KEY", "")
         if not key:
             raise RuntimeError("OPENAI_API_KEY ausente para LLMCloud.")
+        from openai import OpenAI
+
         self.client = OpenAI(api_key=key)
 
-    def answer(self, question: str, contexts: Sequence[str]) -> str:
-        ctx = "\n\n---\n\n".join(contexts[:8]) if contexts else "N/A"
+    def _messages(
+        self, question: str, contexts: Sequence[str] | PackedContext, memory: str = ""
+    ) -> List[Dict[str, str]]:
+        # contexto já montado pelo chamador (hits com fonte/página) ou montado aqui
+        packed = contexts if isinstance(contexts, PackedContext) else pack_contexts(contexts, self.context_tokens)
+        ctx = packed.joined() or "N/A"
+        # histórico (src/conversation.py): resumo + mensagens recentes, de tamanho limitado
+        history = (
+            "HISTÓRICO DA CONVERSA (só para entender a pergunta; os fatos vêm do CONTEXTO):\n"
+            f"{memory}\n\n"
+            if memory
+            else ""
+        )
         prompt = (
             "Você é um analista técnico do IDEMA/RN.\n"
             "Responda de forma objetiva, citando apenas informações presentes no CONTEXTO abaixo.\n"
             "Se algo não estiver no contexto, diga que não há dados suficientes.\n\n"
+            f"{history}"
             f"PERGUNTA:\n{question}\n\n"
             f"CONTEXTO:\n{ctx}\n"
         )
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0,
-        )
+        return [{"role": "user", "content": prompt}]
+
+    def complete(self, prompt: str, max_tokens: int = 256) -> str:
+        """Pedido curto fora do RAG (reescrita de pergunta, resumo da conversa)."""
+        with span("llm.complete") as s:
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                max_tokens=int(max_tokens),
+            )
+            usage = getattr(resp, "usage", None)
+            s.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+            s.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+        return (resp.choices[0].message.content or "").strip()
+
+    def answer(self, question: str, contexts: Sequence[str] | PackedContext, memory: str = "") -> str:
+        messages = self._messages(question, contexts, memory)
+        with span("llm.answer") as s:
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.0,
+            )
+            usage = getattr(resp, "usage", None)
+            s.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+            s.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
         return resp.choices[0].message.content.strip()
 
+    def stream_answer(
+        self, question: str, contexts: Sequence[str] | PackedContext, memory: str = ""
+    ) -> Iterator[str]:
+        """Mesma resposta do answer(), entregue em pedaços à medida que é gerada."""
+        messages = self._messages(question, contexts, memory)
+        with span("llm.stream") as s:
+            t0 = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.0,
+                stream=True,
+            )
+            started = False
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                piece = chunk.choices[0].delta.content or ""
+                if not started:  # mesmo corte do .strip() do answer()
+                    piece = piece.lstrip()
+                    started = bool(piece)
+                    if started:
+                        record("llm.ttft", time.perf_counter() - t0)
+                if piece:
+                    s.add("chars", len(piece))
+                    yield piece
+
 
 # -------------------------
 # LiteLocal — resposta EXTRATIVA (sem LLM)
@@ -115,43 +298,271 @@ class LiteLocal:
     Módulo de resposta extrativa:
     - Não "inventa" texto. Só seleciona/fraciona frases que melhor respondem,
       a partir dos trechos recuperados (RAG).
-    - Implementado com TF-IDF + similaridade cosseno.
+    - TF-IDF + similaridade cosseno sobre o índice de frases montado na
+      ingestão (sentence_index): frases e termos já vêm prontos e o IDF é o da
+      coleção `collection`. Trechos fora do índice (ou sem coleção) são
+      analisados na hora.
     """
 
-    def __init__(self, max_sentences: int = 6):
+    def __init__(self, max_sentences: int = 6, collection: str = ""):
         self.max_sentences = max_sentences
+        self.collection = collection
 
-    def answer(self, question: str, contexts: Sequence[str]) -> str:
+    def answer(self, question: str, contexts: Sequence[str], memory: str = "") -> str:
+        return "".join(self.stream_answer(question, contexts, memory))
+
+    def stream_answer(self, question: str, contexts: Sequence[str], memory: str = "") -> Iterator[str]:
+        """
+        Mesma interface do LLMCloud.stream_answer: cabeçalho e depois uma frase
+        por vez. `memory` é ignorado — a pergunta já chega reescrita.
+        """
         if not contexts:
-            return "Não encontrei trechos suficientes no acervo para responder."
+            yield "Não encontrei trechos suficientes no acervo para responder."
+            return
+
+        picked = self._pick(question, contexts)
+        if not picked:
+            yield "Encontrei trechos, mas nenhum responde claramente à pergunta."
+            return
+
+        # Monta resposta extrativa
+        yield "**Resposta extrativa (sem LLM):**\n\n"
+        for i, sent in enumerate(picked):
+            yield ("\n" if i else "") + f"• {sent}"
+
+    @traced("lite.rank")
+    def _pick(self, question: str, contexts: Sequence[str]) -> List[str]:
+        """Frases distintas mais parecidas com a pergunta, da melhor para a pior."""
+        try:
+            index = get_sentence_index(self.collection) if self.collection else None
+            known = index.lookup(contexts) if index is not None else {}
+        except Exception:
+            index, known = None, {}
 
         # Junta todas as frases candidatas
-        candidates: List[str] = []
-        for c in contexts:
-            candidates.extend(_split_sentences(c)[:20])  # corta por contexto para evitar explosão
+        candidates: List[Sentence] = []
+        for i, c in enumerate(contexts):
+            sents = known.get(i)
+            if sents is None:
+                sents = analyze(c)
+            candidates.extend(sents[:MAX_SENTENCES_PER_CONTEXT])  # corta por contexto para evitar explosão
 
-        # TF-IDF: pergunta vs frases
-        docs = [question] + candidates
-        tfidf = TfidfVectorizer(ngram_range=(1, 2), max_features=5000).fit_transform(docs)
-        q_vec = tfidf[0:1]
-        sents_vec = tfidf[1:]
-        sims = linear_kernel(q_vec, sents_vec).flatten()
+        # TF-IDF: pergunta vs frases (IDF do acervo; sem índice, das próprias frases)
+        q_terms = term_counts(question)
+        if index is not None and known:
+            vocab = set(q_terms).union(*(terms for _, terms in candidates))
+            n_docs, df = index.document_frequencies(vocab)
+        else:
+            docs = [q_terms] + [terms for _, terms in candidates]
+            n_docs, df = len(docs), {}
+            for terms in docs:
+                for t in terms:
+                    df[t] = df.get(t, 0) + 1
+        idf_cache: Dict[str, float] = {}
+
+        def idf_of(t: str) -> float:
+            v = idf_cache.get(t)
+            if v is None:
+                v = idf_cache[t] = idf(n_docs, df.get(t, 0))
+            return v
+
+        sims = cosine_scores(q_terms, [terms for _, terms in candidates], idf_of)
 
         # Top-k frases distintas
-        idxs = sims.argsort()[::-1]
+        idxs = sorted(range(len(candidates)), key=lambda i: (-sims[i], -i))
         picked, seen = [], set()
         for i in idxs:
-            sent = candidates[i].strip()
+            sent = candidates[i][0].strip()
             key = sent.lower()
             if key not in seen:
                 picked.append(sent)
                 seen.add(key)
             if len(picked) >= self.max_sentences:
                 break
+        return picked
 
-        if not picked:
-            return "Encontrei trechos, mas nenhum responde claramente à pergunta."
 
-        # Monta resposta extrativa
-        bullets = "\n".join([f"• {s}" for s in picked])
-        return f"**Resposta extrativa (sem LLM):**\n\n{bullets}"
+# -------------------------
+# Tempo de resposta em fluxo
+# -------------------------
+@dataclass
+class StreamTiming:
+    """Tempo até o 1º pedaço (TTFT) e total de uma resposta em fluxo, em segundos."""
+    ttft: float | None = None
+    total: float | None = None
+    chunks: int = 0
+    chars: int = 0
+
+
+def timed_stream(pieces: Iterable[str], timing: StreamTiming, start: float | None = None) -> Iterator[str]:
+    """
+    Repassa os pedaços preenchendo `timing`. O relógio começa em `start`
+    (time.perf_counter(), ex.: quando a pergunta chegou) ou na 1ª iteração.
+    """
+    t0 = time.perf_counter() if start is None else start
+    try:
+        for piece in pieces:
+            if timing.ttft is None:
+                timing.ttft = time.perf_counter() - t0
+            timing.chunks += 1
+            timing.chars += len(piece)
+            yield piece
+    finally:
+        timing.total = time.perf_counter() - t0
+
+
+# -------------------------
+# Pool de recursos (compartilhado entre reruns e sessões do Streamlit)
+# -------------------------
+def _close(obj: Any) -> None:
+    close = getattr(obj, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+class ResourcePool:
+    """
+    Cache LRU thread-safe de encoders/clientes:
+    - cada recurso é criado uma única vez por chave (modelo, chave da API);
+    - threads que pedem a mesma chave durante a criação esperam pela mesma instância;
+    - acima de `max_size` entradas, a menos usada recentemente é descartada
+      (e fechada, se tiver close()).
+    """
+
+    def __init__(self, max_size: int | None = None):
+        self._max_size = max_size  # None → POOL_MAX_SIZE, lido no primeiro uso
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._building: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self) -> int:
+        return max(1, int(SETTINGS.pool_max_size if self._max_size is None else self._max_size))
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._items:  # outra thread criou enquanto esperávamos
+                    self._items.move_to_end(key)
+                    return self._items[key]
+            try:
+                obj = factory()
+            except BaseException:
+                with self._lock:
+                    self._building.pop(key, None)
+                raise
+            # guarda e libera a chave juntos: quem chegar depois já encontra o objeto
+            with self._lock:
+                self._items[key] = obj
+                self._items.move_to_end(key)
+                self._building.pop(key, None)
+                evicted = []
+                while len(self._items) > self.max_size:
+                    evicted.append(self._items.popitem(last=False)[1])
+            for old in evicted:
+                _close(old)
+            return obj
+
+    def clear(self) -> None:
+        with self._lock:
+            evicted = list(self._items.values())
+            self._items.clear()
+        for old in evicted:
+            _close(old)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+POOL = ResourcePool()
+
+
+def _key_id(api_key: str | None) -> str:
+    """Identifica a chave da API sem guardá-la em claro na chave do pool."""
+    key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY", "")
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16] if key else ""
+
+
+def get_embeddings_cloud(model: str = "text-embedding-3-large", api_key: str | None = None) -> EmbeddingsCloud:
+    key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY", "")
+    return POOL.get(("emb_cloud", model, _key_id(key)), lambda: EmbeddingsCloud(model=model, api_key=key))
+
+
+# modelos cuja exportação/carga em ONNX falhou neste processo → motivo (só no modo auto)
+_ONNX_FAILED: Dict[str, str] = {}
+
+
+def local_backend(model_name: str = "all-MiniLM-L6-v2") -> str:
+    """
+    torch | onnx, conforme LOCAL_EMBEDDINGS (auto: onnx se der para usar ou
+    exportar e se ainda não falhou neste processo).
+    """
+    from .onnx_embed import is_exported, model_dir, onnx_available
+
+    kind = SETTINGS.local_embeddings
+    if kind == "auto":
+        if model_name in _ONNX_FAILED:
+            return "torch"
+        can_export = importlib.util.find_spec("sentence_transformers") is not None
+        return "onnx" if onnx_available() and (can_export or is_exported(model_dir(model_name))) else "torch"
+    if kind not in ("torch", "onnx"):
+        raise ValueError(f"LOCAL_EMBEDDINGS inválido: {kind!r} (use torch, onnx ou auto).")
+    return kind
+
+
+def has_local_embeddings() -> bool:
+    """Há como criar um encoder local? (sem importar sentence-transformers/onnxruntime)"""
+    return local_backend() == "onnx" or importlib.util.find_spec("sentence_transformers") is not None
+
+
+def get_embeddings_local(model_name: str = "all-MiniLM-L6-v2") -> EmbeddingsLocal | EmbeddingsOnnx:
+    if local_backend(model_name) == "onnx":
+        try:
+            return POOL.get(("emb_onnx", model_name), lambda: EmbeddingsOnnx(model_name=model_name))
+        except Exception as e:
+            if SETTINGS.local_embeddings == "onnx":
+                raise
+            # auto: registra uma vez (sem nova exportação a cada chamada) e segue no PyTorch
+            _ONNX_FAILED[model_name] = str(e)
+    return POOL.get(("emb_local", model_name), lambda: EmbeddingsLocal(model_name=model_name))
+
+
+def get_llm_cloud(model: str = "gpt-4o-mini", api_key: str | None = None) -> LLMCloud:
+    key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY", "")
+    return POOL.get(("llm_cloud", model, _key_id(key)), lambda: LLMCloud(model=model, api_key=key))
+
+
+def warmup(api_key: str | None = None, background: bool = True) -> None:
+    """
+    Pré-carrega os recursos mais caros (pesos do SentenceTransformer e,
+    havendo chave do app, os clientes OpenAI). Falhas são ignoradas:
+    o recurso será criado sob demanda.
+    """
+
+    def _run():
+        if has_local_embeddings():
+            try:
+                get_embeddings_local()
+            except Exception:
+                pass
+        if api_key:
+            try:
+                get_embeddings_cloud(api_key=api_key)
+                get_llm_cloud(api_key=api_key)
+            except Exception:
+                pass
+
+    if background:
+        threading.Thread(target=_run, name="pool-warmup", daemon=True).start()
+    else:
+        _run()
@@ -0,0 +1,421 @@
+# src/local_store.py
+"""
+Backend vetorial local (em processo), alternativo ao Milvus/Zilliz.
+
+Cada coleção é um diretório em DATA_DIR/local_store/<nome>/ com:
+- vectors.f32 — matriz float32 memory-mapped (vetores normalizados);
+- rows.sqlite — texto e metadados por linha (id = linha da matriz).
+
+A busca é exata (produto interno = cosseno) por multiplicação de matrizes em
+blocos, com filtro pelos metadados no mesmo subconjunto de `expr` usado no app.
+Com LOCAL_ANN=ivf e a partir de ANN_MIN_ROWS linhas, um índice IVF (ann_index)
+é treinado (numa thread, fora do lock de inserção) e mantido a cada inserção;
+a busca passa a visitar só `nprobe` listas.
+Com VECTOR_ENCODING ≠ float32 (ou truncamento), a varredura usa codes.bin
+(float16/int8/binário) e os melhores candidatos são reavaliados em vectors.f32.
+O objeto LocalCollection imita a parte da pymilvus.Collection que o RAG usa.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .filter_expr import MetadataColumns
+from .ann_index import IVFIndex
+from .manifest import get_manifest
+from .quantize import Codec, current_encoding
+from .settings import SETTINGS
+from .tracing import span
+
+# linhas por bloco na multiplicação (limita a memória temporária)
+_BLOCK_ROWS = 65536
+# com filtro muito seletivo a busca exata é mais barata que o IVF
+_EXACT_MAX_ROWS = 20000
+_ALL_FIELDS = ("text", "fonte", "pagina", "tipo_licenca", "tipo_empreendimento")
+
+
+class LocalHit:
+    """Mesmo formato usado no rag.py para os hits da pymilvus (id, distance, entity.get)."""
+
+    __slots__ = ("id", "distance", "entity")
+
+    def __init__(self, id: int, distance: float, entity: Dict[str, Any]):
+        self.id = id
+        self.distance = distance
+        self.entity = entity
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    if x.ndim == 1:
+        x = x.reshape(1, -1)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+class LocalCollection:
+    def __init__(self, name: str, root: str, dim: int):
+        self.name = name
+        self.root = root
+        self.dim = int(dim)
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+        enc = current_encoding()
+        meta_path = os.path.join(root, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = int(meta["dim"])
+            if meta.get("encoding", "") != enc.tag:
+                raise ValueError(
+                    f"Coleção {name} gravada com codificação {meta.get('encoding') or 'float32'!r}, "
+                    f"não {enc.tag or 'float32'!r}."
+                )
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "encoding": enc.tag}, f)
+        self._codec = Codec(enc, self.dim, root)
+
+        self._db = sqlite3.connect(os.path.join(root, "rows.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS rows (
+                id INTEGER PRIMARY KEY, text TEXT, fonte TEXT, pagina INTEGER,
+                tipo_licenca TEXT, tipo_empreendimento TEXT, alive INTEGER DEFAULT 1
+            )"""
+        )
+        self._db.commit()
+
+        # colunas em memória para filtrar sem tocar no SQLite
+        self._meta = MetadataColumns()
+        rows = self._db.execute(
+            "SELECT fonte, pagina, tipo_licenca, tipo_empreendimento, alive FROM rows ORDER BY id"
+        ).fetchall()
+        self._n = len(rows)
+        if rows:
+            self._meta.extend(*zip(*rows))
+
+        self._vec_path = os.path.join(root, "vectors.f32")
+        self._capacity = 0
+        self._mm: np.memmap | None = None
+        if os.path.exists(self._vec_path):
+            self._capacity = os.path.getsize(self._vec_path) // (4 * self.dim)
+            if self._capacity:
+                self._mm = np.memmap(self._vec_path, dtype=np.float32, mode="r+", shape=(self._capacity, self.dim))
+        # códigos compactos para a varredura (só quando a codificação tem perda)
+        self._codes_path = os.path.join(root, "codes.bin")
+        self._codes: np.memmap | None = None
+        if enc.lossy and self._capacity:
+            self._codes = self._open_codes(self._capacity)
+
+        self._ivf: IVFIndex | None = IVFIndex(root) if SETTINGS.local_ann == "ivf" else None
+        self._training: threading.Thread | None = None
+        if self._ivf is not None and self._ivf.trained and len(self._ivf.assign) < self._n:
+            # linhas gravadas depois do último salvamento do índice
+            start = len(self._ivf.assign)
+            self._ivf.add(start, np.asarray(self._mm[start : self._n]))  # type: ignore[index]
+
+    # ---------- compatibilidade com pymilvus.Collection ----------
+    @property
+    def num_entities(self) -> int:
+        return int(self._meta.alive.sum())
+
+    def load(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+            self._db.commit()
+
+    def _open_codes(self, capacity: int) -> np.memmap:
+        c = self._codec
+        with open(self._codes_path, "ab") as f:
+            f.truncate(capacity * c.width * c.dtype.itemsize)
+        return np.memmap(self._codes_path, dtype=c.dtype, mode="r+", shape=(capacity, c.width))
+
+    def _reserve(self, n_total: int) -> None:
+        if n_total <= self._capacity:
+            return
+        new_cap = max(n_total, self._capacity * 2, 1024)
+        with open(self._vec_path, "ab") as f:
+            f.truncate(new_cap * self.dim * 4)
+        self._capacity = new_cap
+        self._mm = np.memmap(self._vec_path, dtype=np.float32, mode="r+", shape=(new_cap, self.dim))
+        if self._codec.enc.lossy:
+            self._codes = self._open_codes(new_cap)
+
+    def insert(self, data: Sequence[Sequence[Any]]) -> None:
+        embs, texts, fontes, paginas, tlic, temp = data
+        vecs = _normalize(np.asarray(embs, dtype=np.float32))
+        if vecs.shape[1] != self.dim:
+            raise ValueError(f"Dimensão {vecs.shape[1]} incompatível com a coleção {self.name} ({self.dim}d).")
+        n = vecs.shape[0]
+        with self._lock:
+            start = self._n
+            self._reserve(start + n)
+            self._mm[start : start + n] = vecs  # type: ignore[index]
+            self._mm.flush()  # type: ignore[union-attr]
+            if self._codes is not None:
+                self._codes[start : start + n] = self._codec.encode(vecs)
+                self._codes.flush()
+            self._db.executemany(
+                "INSERT INTO rows (id, text, fonte, pagina, tipo_licenca, tipo_empreendimento) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (start + i, str(texts[i]), str(fontes[i]), int(paginas[i]), str(tlic[i]), str(temp[i]))
+                    for i in range(n)
+                ],
+            )
+            self._db.commit()
+            # só agora as linhas ficam visíveis para a busca
+            self._meta.extend(
+                [str(v) for v in fontes], [int(v) for v in paginas], [str(v) for v in tlic], [str(v) for v in temp]
+            )
+            self._n = start + n
+            self._update_index(start, vecs)
+
+    def _update_index(self, start: int, vecs: np.ndarray) -> None:
+        """
+        Treina o IVF ao atingir ANN_MIN_ROWS; depois só adiciona (retreina a cada 4× de crescimento).
+        O treino roda numa thread, fora do lock: as inserções seguem no índice atual
+        (ou na busca exata, antes do primeiro) até a troca em _train_index.
+        """
+        ivf = self._ivf
+        if ivf is None or self._n < SETTINGS.ann_min_rows:
+            return
+        if ivf.trained:
+            ivf.add(start, vecs)
+        if (not ivf.trained or self._n >= 4 * ivf.trained_rows) and self._training is None:
+            self._training = threading.Thread(
+                target=self._train_index, args=(self._mm, self._n), name=f"ivf-{self.name}", daemon=True
+            )
+            self._training.start()
+
+    def _train_index(self, mm: np.ndarray, n: int) -> None:
+        try:
+            fresh = IVFIndex(self.root, load=False)
+            fresh.train(mm, n, nlist=SETTINGS.ann_nlist)  # linhas [0, n) não mudam mais
+            with self._lock:
+                if self._n > n:  # inseridas durante o treino
+                    fresh.add(n, np.asarray(self._mm[n : self._n]))  # type: ignore[index]
+                fresh.save()
+                self._ivf = fresh
+        except Exception:
+            pass  # p.ex. coleção removida no meio do treino; o próximo insert tenta de novo
+        finally:
+            self._training = None
+
+    def wait_index(self, timeout: float | None = None) -> None:
+        """Espera o (re)treino do IVF em andamento, se houver."""
+        t = self._training
+        if t is not None:
+            t.join(timeout)
+
+    def _mask(self, expr: str | None, n: int) -> np.ndarray:
+        return self._meta.mask(expr, n)
+
+    def delete(self, expr: str) -> None:
+        with self._lock:
+            ids = np.flatnonzero(self._mask(expr, self._n))
+            if not len(ids):
+                return
+            self._db.executemany("UPDATE rows SET alive = 0 WHERE id = ?", [(int(i),) for i in ids])
+            self._db.commit()
+            self._meta.kill(ids)
+
+    def _entities(self, ids: Sequence[int], output_fields: Sequence[str]) -> Dict[int, Dict[str, Any]]:
+        fields = [f for f in output_fields if f in _ALL_FIELDS]
+        if not ids:
+            return {}
+        cols = ", ".join(["id"] + fields)
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(f"SELECT {cols} FROM rows WHERE id IN ({marks})", [int(i) for i in ids]).fetchall()
+        return {int(r[0]): dict(zip(fields, r[1:])) for r in rows}
+
+    def _exact_topk(
+        self, score: Callable[..., np.ndarray], nq: int, rows: np.ndarray | None, n: int, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k por varredura em blocos; `score(ids)` → (nq, len(ids)); `rows` restringe às linhas filtradas."""
+        best_s = np.full((nq, 0), -np.inf, dtype=np.float32)
+        best_i = np.zeros((nq, 0), dtype=np.int64)
+        total = len(rows) if rows is not None else n
+        for b in range(0, total, _BLOCK_ROWS):
+            idx = rows[b : b + _BLOCK_ROWS] if rows is not None else np.arange(b, min(n, b + _BLOCK_ROWS))
+            scores = score(idx)
+            s = np.concatenate([best_s, scores], axis=1)
+            i = np.concatenate([best_i, np.broadcast_to(idx, (nq, len(idx)))], axis=1)
+            if s.shape[1] > k:
+                part = np.argpartition(-s, k - 1, axis=1)[:, :k]
+                s = np.take_along_axis(s, part, axis=1)
+                i = np.take_along_axis(i, part, axis=1)
+            best_s, best_i = s, i
+        order = np.argsort(-best_s, axis=1)
+        return np.take_along_axis(best_s, order, axis=1), np.take_along_axis(best_i, order, axis=1)
+
+    @staticmethod
+    def _rows(mat: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        # fatia contígua quando possível (evita cópia por índice)
+        if len(idx) and idx[-1] - idx[0] == len(idx) - 1:
+            return mat[idx[0] : idx[-1] + 1]
+        return mat[idx]
+
+    def _rescore(self, mm: np.ndarray, q: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Reavalia os candidatos da varredura quantizada com os vetores float32 completos."""
+        scores = np.full((q.shape[0], k), -np.inf, dtype=np.float32)
+        out = np.full((q.shape[0], k), -1, dtype=np.int64)
+        for qi in range(q.shape[0]):
+            cand = ids[qi][ids[qi] >= 0]
+            if not len(cand):
+                continue
+            order = np.argsort(cand)
+            cand = cand[order]
+            s = np.asarray(mm[cand], dtype=np.float32) @ q[qi]
+            top = np.argsort(-s)[:k]
+            scores[qi, : len(top)] = s[top]
+            out[qi, : len(top)] = cand[top]
+        return scores, out
+
+    def search(
+        self,
+        data,
+        anns_field: str = "embedding",
+        param: Dict[str, Any] | None = None,
+        limit: int = 5,
+        expr: str | None = None,
+        output_fields: Sequence[str] | None = None,
+        **_: Any,
+    ) -> List[List[LocalHit]]:
+        q = _normalize(np.asarray(data, dtype=np.float32))
+        with self._lock:  # retrato consistente; o cálculo roda fora do lock
+            n, mm, codes = self._n, self._mm, self._codes
+            mask = self._mask(expr, n)
+        if n == 0 or mm is None or not mask.any():
+            return [[] for _ in range(q.shape[0])]
+
+        n_ok = int(mask.sum())
+        k = min(int(limit), n_ok)
+        p = (param or {}).get("params", {}) or {}
+
+        # varredura: códigos compactos (com folga para o rescoring) ou float32 direto
+        if codes is not None:
+            codec = self._codec
+            qp = codec.prepare_query(q)
+            k_scan = min(n_ok, k * max(1, SETTINGS.rescore_factor))
+
+            def score(idx: np.ndarray, qi: int | None = None) -> np.ndarray:
+                return codec.scores(self._rows(codes, idx), qp if qi is None else codec.select(qp, qi))
+        else:
+            k_scan = k
+
+            def score(idx: np.ndarray, qi: int | None = None) -> np.ndarray:
+                qq = q if qi is None else q[qi : qi + 1]
+                return qq @ np.asarray(self._rows(mm, idx), dtype=np.float32).T
+
+        ivf = self._ivf
+        if ivf is not None and ivf.trained and not p.get("exact") and n_ok > _EXACT_MAX_ROWS:
+            scores, ids = ivf.search(score, q, mask, k_scan, int(p.get("nprobe", SETTINGS.search_nprobe)))
+        else:
+            rows = None if mask.all() else np.flatnonzero(mask)
+            scores, ids = self._exact_topk(score, q.shape[0], rows, n, k_scan)
+        if codes is not None:
+            scores, ids = self._rescore(mm, q, ids, k)
+
+        ents = self._entities(sorted({int(i) for i in ids.ravel() if i >= 0}), output_fields or [])
+        if "embedding" in (output_fields or []) and ents:
+            rows = np.fromiter(ents, dtype=np.int64, count=len(ents))
+            for i, v in zip(ents, np.asarray(mm[rows], dtype=np.float32)):
+                ents[i]["embedding"] = v
+        out: List[List[LocalHit]] = []
+        for qi in range(q.shape[0]):
+            out.append(
+                [
+                    LocalHit(int(i), float(s), ents.get(int(i), {}))
+                    for s, i in zip(scores[qi], ids[qi])
+                    if i >= 0
+                ]
+            )
+        return out
+
+
+# ===== API do backend (mesmas funções de milvus_utils) =====
+_COLLECTIONS: Dict[str, LocalCollection] = {}
+_LOCK = threading.Lock()
+
+
+def _root(name: str) -> str:
+    return os.path.join(SETTINGS.data_dir, "local_store", name)
+
+
+def get_or_create_collection(name: str, dim: int) -> LocalCollection:
+    with _LOCK:
+        col = _COLLECTIONS.get(name)
+        if col is None:
+            col = _COLLECTIONS[name] = LocalCollection(name, _root(name), dim)
+        if col.dim != int(dim):
+            raise ValueError(f"Coleção {name} existe com dimensão {col.dim}, não {dim}.")
+        return col
+
+
+def drop_collection(name: str) -> None:
+    with _LOCK:
+        _COLLECTIONS.pop(name, None)
+        get_manifest().forget_collection(name)
+        shutil.rmtree(_root(name), ignore_errors=True)
+
+
+def insert_records(col: LocalCollection, *args, flush: bool = True) -> None:
+    # Aceita lista de dicts ou 6 colunas paralelas, como milvus_utils.insert_records
+    if len(args) == 1 and isinstance(args[0], (list, tuple)) and args[0] and isinstance(args[0][0], dict):
+        regs = args[0]
+        args = (
+            [r["embedding"] for r in regs],
+            [str(r["text"]) for r in regs],
+            [str(r.get("fonte", "")) for r in regs],
+            [int(r.get("pagina", 0)) for r in regs],
+            [str(r.get("tipo_licenca", "")) for r in regs],
+            [str(r.get("tipo_empreendimento", "")) for r in regs],
+        )
+    elif len(args) != 6:
+        raise TypeError("insert_records: use lista de dicts OU 6 listas paralelas")
+    with span("local.insert", rows=len(args[1])):
+        col.insert(list(args))
+    if flush:
+        with span("local.flush"):
+            col.flush()
+
+
+def delete_records(col: LocalCollection, expr: str) -> None:
+    col.delete(expr)
+
+
+def has_rows(col: LocalCollection, expr: str | None = None) -> bool:
+    with col._lock:
+        return bool(col._mask(expr, col._n).any())
+
+
+def search_many(col: LocalCollection, qvecs, top_k: int = 5, expr: str | None = None, vectors: bool = False):
+    qvecs = list(qvecs)
+    if not qvecs:
+        return []
+    with span("local.search", queries=len(qvecs)):
+        return col.search(
+            data=qvecs,
+            param={"metric_type": "IP", "params": {"nprobe": SETTINGS.search_nprobe}},
+            limit=top_k,
+            expr=expr,
+            output_fields=list(_ALL_FIELDS) + (["embedding"] if vectors else []),
+        )
+
+
+def search(col: LocalCollection, qvec, top_k: int = 5, expr: str | None = None, vectors: bool = False):
+    return search_many(col, [qvec], top_k=top_k, expr=expr, vectors=vectors)[0]
@@ -0,0 +1,112 @@
+# src/manifest.py
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from .settings import SETTINGS
+
+
+def fingerprint(data: bytes | str, salt: str = "") -> str:
+    """SHA-256 do arquivo (bytes) ou do texto de uma página; `salt` (ex.: o chunker) entra antes."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    h = hashlib.sha256(salt.encode("utf-8")) if salt else hashlib.sha256()
+    h.update(data)
+    return h.hexdigest()
+
+
+# prefixo do sha256 de um documento com ingestão interrompida (checkpoint)
+PARTIAL = "partial:"
+
+
+@dataclass
+class DocumentEntry:
+    fonte: str
+    sha256: str
+    pages: Dict[int, str] = field(default_factory=dict)  # pagina → sha256 do texto
+
+    @property
+    def partial(self) -> bool:
+        """Checkpoint: só as páginas listadas estão garantidamente completas no índice."""
+        return self.sha256.startswith(PARTIAL)
+
+
+class Manifest:
+    """
+    O que já está indexado em cada coleção: impressão digital por documento
+    (`fonte`) e por página. Permite pular documentos iguais e substituir
+    apenas as páginas que mudaram.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                collection TEXT, fonte TEXT, sha256 TEXT, updated REAL,
+                PRIMARY KEY (collection, fonte)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                collection TEXT, fonte TEXT, pagina INTEGER, sha256 TEXT,
+                PRIMARY KEY (collection, fonte, pagina)
+            );
+            """
+        )
+        self._db.commit()
+
+    def document(self, collection: str, fonte: str) -> Optional[DocumentEntry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM documents WHERE collection = ? AND fonte = ?", (collection, fonte)
+            ).fetchone()
+            pages = dict(
+                self._db.execute(
+                    "SELECT pagina, sha256 FROM pages WHERE collection = ? AND fonte = ?", (collection, fonte)
+                ).fetchall()
+            )
+        if row is None and not pages:
+            return None
+        return DocumentEntry(fonte=fonte, sha256=row[0] if row else "", pages={int(k): v for k, v in pages.items()})
+
+    def save_document(self, collection: str, fonte: str, sha256: str, pages: Dict[int, str]) -> None:
+        """Grava o estado final do documento (substitui as páginas anteriores)."""
+        with self._lock:
+            self._db.execute("DELETE FROM pages WHERE collection = ? AND fonte = ?", (collection, fonte))
+            self._db.executemany(
+                "INSERT INTO pages VALUES (?, ?, ?, ?)",
+                [(collection, fonte, int(p), h) for p, h in pages.items()],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)", (collection, fonte, sha256, time.time())
+            )
+            self._db.commit()
+
+    def save_checkpoint(self, collection: str, fonte: str, sha256: str, pages: Dict[int, str]) -> None:
+        """Estado parcial do documento, gravado a cada lote inserido (retomada após interrupção)."""
+        self.save_document(collection, fonte, PARTIAL + sha256, pages)
+
+    def forget_collection(self, collection: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM pages WHERE collection = ?", (collection,))
+            self._db.execute("DELETE FROM documents WHERE collection = ?", (collection,))
+            self._db.commit()
+
+
+_MANIFEST: Manifest | None = None
+_MANIFEST_LOCK = threading.Lock()
+
+
+def get_manifest() -> Manifest:
+    global _MANIFEST
+    with _MANIFEST_LOCK:
+        if _MANIFEST is None:
+            _MANIFEST = Manifest(os.path.join(SETTINGS.data_dir, "manifest.sqlite"))
+        return _MANIFEST
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Sequence
+import threading
+from typing import Dict, Any, List, Sequence, Tuple
+
+import numpy as np
 from pymilvus import (
     connections,
     utility,
@@ -9,7 +12,10 @@ from pymilvus import (
     DataType,
     Collection,
 )
+from .manifest import get_manifest
+from .quantize import current_encoding
 from .settings import SETTINGS
+from .tracing import span
 
 
 def _sanitize_uri(uri: str) -> str:
@@ -46,10 +52,11 @@ def connect() -> None:
 
 # ===== Schema com PK auto =====
 def _schema(dim: int) -> CollectionSchema:
+    vec_type = DataType.FLOAT16_VECTOR if current_encoding().kind == "float16" else DataType.FLOAT_VECTOR
     return CollectionSchema(
         fields=[
             FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),
+            FieldSchema(name="embedding", dtype=vec_type, dim=dim),
             FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=16384),
             FieldSchema(name="fonte", dtype=DataType.VARCHAR, max_length=512),
             FieldSchema(name="pagina", dtype=DataType.INT64),
@@ -61,22 +68,47 @@ def _schema(dim: int) -> CollectionSchema:
     )
 
 
+# Handles já carregados, por (nome, dim): evita has_collection + load() a cada pergunta
+_COLLECTIONS: Dict[Tuple[str, int], Collection] = {}
+_COLLECTIONS_LOCK = threading.Lock()
+
+
 def get_or_create_collection(name: str, dim: int) -> Collection:
-    connect()
-    if utility.has_collection(name):
-        col = Collection(name)
-    else:
-        col = Collection(name=name, schema=_schema(dim))
-        col.create_index(
-            field_name="embedding",
-            index_params={"index_type": "AUTOINDEX", "metric_type": "IP"},
-        )
-    col.load()
-    return col
+    enc = current_encoding()
+    if enc.kind not in ("float32", "float16"):
+        raise ValueError(f"VECTOR_ENCODING={enc.kind} só é suportado no backend local (VECTOR_BACKEND=local).")
+    dim = enc.stored_dim(int(dim))  # truncamento Matryoshka: a coleção guarda só N dimensões
+    key = (name, int(dim))
+    with _COLLECTIONS_LOCK:
+        col = _COLLECTIONS.get(key)
+        if col is not None:
+            return col
+
+        connect()
+        if utility.has_collection(name):
+            col = Collection(name)
+        else:
+            col = Collection(name=name, schema=_schema(dim))
+            col.create_index(
+                field_name="embedding",
+                index_params={"index_type": "AUTOINDEX", "metric_type": "IP"},
+            )
+        col.load()
+        _COLLECTIONS[key] = col
+        return col
+
+
+def forget_collection(name: str) -> None:
+    """Descarta os handles em cache de uma coleção (todas as dimensões)."""
+    with _COLLECTIONS_LOCK:
+        for key in [k for k in _COLLECTIONS if k[0] == name]:
+            del _COLLECTIONS[key]
 
 
 def drop_collection(name: str) -> None:
     connect()
+    forget_collection(name)
+    get_manifest().forget_collection(name)
     if utility.has_collection(name):
         utility.drop_collection(name)
 
@@ -94,26 +126,68 @@ def _normalize_records(regs: Sequence[Dict[str, Any]]):
     return embs, texts, fontes, paginas, tlic, temp
 
 
-def insert_records(col: Collection, *args) -> None:
-    # Aceita lista de dicts ou 6 listas paralelas (compatível com seu rag.py)
+def _encode_vectors(vecs):
+    """Aplica VECTOR_ENCODING/VECTOR_TRUNCATE_DIM; no formato original devolve como veio."""
+    enc = current_encoding()
+    if not enc.lossy:
+        return vecs
+    x = enc.prepare(vecs)
+    return x.astype(np.float16) if enc.kind == "float16" else x
+
+
+def insert_records(col: Collection, *args, flush: bool = True) -> None:
+    # Aceita lista de dicts ou 6 colunas paralelas (embeddings pode ser np.ndarray 2D float32)
     if len(args) == 1 and isinstance(args[0], (list, tuple)) and args[0] and isinstance(args[0][0], dict):
         embs, texts, fontes, paginas, tlic, temp = _normalize_records(args[0])  # type: ignore
     elif len(args) == 6:
         embs, texts, fontes, paginas, tlic, temp = args  # type: ignore
     else:
         raise TypeError("insert_records: use lista de dicts OU 6 listas paralelas")
-    col.insert([embs, texts, fontes, paginas, tlic, temp])
-    col.flush()
-
-
-def search(col: Collection, qvec, top_k: int = 5, expr: str | None = None):
-    params = {"metric_type": "IP", "params": {"nprobe": 32}}
-    res = col.search(
-        data=[qvec],
-        anns_field="embedding",
-        param=params,
-        limit=top_k,
-        expr=expr,
-        output_fields=["text", "fonte", "pagina", "tipo_licenca", "tipo_empreendimento"],
-    )
-    return res[0] if res else []
+    with span("milvus.insert", rows=len(texts)):
+        col.insert([_encode_vectors(embs), texts, fontes, paginas, tlic, temp])
+    if flush:  # em lotes, deixe o flush para o fim (um só)
+        with span("milvus.flush"):
+            col.flush()
+
+
+def delete_records(col: Collection, expr: str) -> None:
+    """Apaga por expressão (ex.: fonte == "x" && pagina in [1, 2])."""
+    col.delete(expr)
+
+
+def has_rows(col: Collection, expr: str | None = None) -> bool:
+    """
+    Há alguma linha (viva) que satisfaz a expressão? Consulta a própria coleção, com
+    consistência forte: num_entities é aproximado antes do flush e conta as apagadas.
+    """
+    rows = col.query(expr=expr or "id >= 0", output_fields=["id"], limit=1, consistency_level="Strong")
+    return bool(rows)
+
+
+def search_many(col: Collection, qvecs, top_k: int = 5, expr: str | None = None, vectors: bool = False):
+    """
+    Várias perguntas numa requisição só; uma lista de hits por vetor.
+    `vectors` devolve também o embedding de cada hit — só no formato float32
+    (codificado, o rag.py recalcula pelo cache de embeddings).
+    """
+    qvecs = list(qvecs)
+    if not qvecs:
+        return []
+    params = {"metric_type": "IP", "params": {"nprobe": SETTINGS.search_nprobe}}
+    fields = ["text", "fonte", "pagina", "tipo_licenca", "tipo_empreendimento"]
+    if vectors and not current_encoding().lossy:
+        fields.append("embedding")
+    with span("milvus.search", queries=len(qvecs)):
+        res = col.search(
+            data=list(_encode_vectors(qvecs)),
+            anns_field="embedding",
+            param=params,
+            limit=top_k,
+            expr=expr,
+            output_fields=fields,
+        )
+    return [list(r) for r in res] if res else [[] for _ in qvecs]
+
+
+def search(col: Collection, qvec, top_k: int = 5, expr: str | None = None, vectors: bool = False):
+    return search_many(col, [qvec], top_k=top_k, expr=expr, vectors=vectors)[0]
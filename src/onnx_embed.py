@@ -0,0 +1,239 @@
+# src/onnx_embed.py
+"""
+Embeddings locais em ONNX com pesos int8 (onnxruntime), alternativa ao
+SentenceTransformer em PyTorch no EmbeddingsLocal.
+
+- exportação (uma vez por modelo, em DATA_DIR/onnx/<modelo>/ ou ONNX_MODEL_DIR):
+  o transformer do SentenceTransformer vai para ONNX, os pesos passam por
+  quantização dinâmica int8 e o tokenizador rápido é salvo ao lado. Roda num
+  subprocesso: o torch nunca é carregado no processo do app;
+- conferência numérica na exportação: cosseno entre os vetores ONNX int8 e os
+  do PyTorch em frases de exemplo, no mínimo ONNX_MIN_COSINE (senão a
+  exportação falha e nada é gravado);
+- inferência só com onnxruntime + tokenizers: textos ordenados por tamanho e
+  lotes de ONNX_BATCH_SIZE com padding só até o maior do lote; o pooling e a
+  normalização do SentenceTransformer são refeitos em NumPy;
+- ONNX_THREADS limita as threads do onnxruntime (0 = padrão dele).
+
+    python -m src.onnx_embed all-MiniLM-L6-v2 [PASTA]
+"""
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .settings import SETTINGS
+
+MODEL_FILE = "model-int8.onnx"
+META_FILE = "meta.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+# frases de conferência (registro dos pareceres: termos técnicos, siglas, números)
+SAMPLE_TEXTS = [
+    "O empreendedor deverá apresentar relatório semestral de monitoramento da água produzida.",
+    "Licença de Operação RLO nº 2021-00417 para o poço 7-MO-0123-RN, campo de Mossoró.",
+    "Fica proibido o lançamento de efluentes oleosos em corpos hídricos ou no solo.",
+    "TOG mensal com limite de 20 mg/L; pH entre 5 e 9.",
+    "Plano de emergência individual para vazamento de óleo na locação.",
+    "condicionantes",
+    "A borra oleosa deverá ser destinada a empresa licenciada, com manifesto de transporte de resíduos, "
+    "e o abandono do poço seguirá as normas da ANP e o plano de recuperação de área degradada.",
+]
+
+
+def model_dir(model_name: str) -> str:
+    root = SETTINGS.onnx_model_dir or os.path.join(SETTINGS.data_dir, "onnx")
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+def onnx_available() -> bool:
+    """onnxruntime e tokenizers instalados? (sem importá-los)"""
+    return all(importlib.util.find_spec(m) is not None for m in ("onnxruntime", "tokenizers"))
+
+
+def is_exported(path: str) -> bool:
+    return all(os.path.isfile(os.path.join(path, f)) for f in (MODEL_FILE, META_FILE, TOKENIZER_FILE))
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-12)
+    b = b / (np.linalg.norm(b, axis=1, keepdims=True) + 1e-12)
+    return np.sum(a * b, axis=1)
+
+
+# ===== Exportação (precisa de torch + sentence-transformers + onnxruntime) =====
+def export(model_name: str, out_dir: str, opset: int = 17) -> Dict:
+    """Exporta, quantiza e confere o modelo; grava em `out_dir` só se passar na conferência."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    hf = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    pooling = st_model[1]
+    mode = "cls" if getattr(pooling, "pooling_mode_cls_token", False) else "mean"
+    normalize = any(type(m).__name__ == "Normalize" for m in st_model)
+
+    sample = tokenizer(["exemplo de exportação"], return_tensors="pt")
+    inputs = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class _Hidden(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(inputs, args))).last_hidden_state
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_dir)), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".export_", dir=os.path.dirname(os.path.abspath(out_dir)))
+    try:
+        fp32 = os.path.join(tmp, "model-fp32.onnx")
+        dynamic = {n: {0: "batch", 1: "seq"} for n in inputs + ["last_hidden_state"]}
+        with torch.no_grad():
+            torch.onnx.export(
+                _Hidden(hf),
+                tuple(sample[n] for n in inputs),
+                fp32,
+                input_names=inputs,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic,
+                opset_version=opset,
+            )
+        quantize_dynamic(fp32, os.path.join(tmp, MODEL_FILE), weight_type=QuantType.QInt8)
+        os.remove(fp32)
+        tokenizer.save_pretrained(tmp)  # tokenizer.json (tokenizador rápido)
+        if not os.path.isfile(os.path.join(tmp, TOKENIZER_FILE)):
+            raise RuntimeError(f"O modelo {model_name} não tem tokenizador rápido (tokenizer.json).")
+
+        meta = {
+            "model_name": model_name,
+            "pooling": mode,
+            "normalize": normalize,
+            "max_seq_length": int(st_model.max_seq_length or 512),
+            "inputs": inputs,
+            "dim": int(st_model.get_sentence_embedding_dimension()),
+        }
+        with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        # conferência numérica contra o PyTorch
+        ref = np.asarray(st_model.encode(SAMPLE_TEXTS, convert_to_numpy=True), dtype=np.float32)
+        got = OnnxEncoder(tmp, threads=0, batch_size=4).encode(SAMPLE_TEXTS)
+        cos = cosine_rows(ref, got)
+        meta["check"] = {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean()), "texts": len(SAMPLE_TEXTS)}
+        if cos.min() < SETTINGS.onnx_min_cosine:
+            raise RuntimeError(
+                f"ONNX int8 diverge do PyTorch: cosseno mínimo {cos.min():.4f} < {SETTINGS.onnx_min_cosine}."
+            )
+        with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp, out_dir)
+        return meta
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+_EXPORT_LOCK = threading.Lock()
+
+
+def ensure_exported(model_name: str) -> str:
+    """Pasta do modelo exportado; exporta num subprocesso se ainda não existir."""
+    path = model_dir(model_name)
+    with _EXPORT_LOCK:
+        if is_exported(path):
+            return path
+        proc = subprocess.run(
+            [sys.executable, "-m", "src.onnx_embed", model_name, path],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0 or not is_exported(path):
+            tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["sem saída"]
+            raise RuntimeError(f"Falha ao exportar {model_name} para ONNX: {tail[0]}")
+    return path
+
+
+# ===== Inferência (onnxruntime + tokenizers, sem torch) =====
+class OnnxEncoder:
+    def __init__(self, path: str, threads: int = 0, batch_size: int = 32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.batch_size = max(1, int(batch_size))
+        self.dim = int(self.meta["dim"])
+        self._inputs: List[str] = list(self.meta["inputs"])
+        self._mean = self.meta["pooling"] == "mean"
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, TOKENIZER_FILE))
+        self.tokenizer.no_padding()  # o padding é feito por lote, só até o maior texto dele
+        self.tokenizer.enable_truncation(max_length=int(self.meta["max_seq_length"]))
+
+        opts = ort.SessionOptions()
+        if threads > 0:
+            opts.intra_op_num_threads = int(threads)
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(path, MODEL_FILE), sess_options=opts, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        texts = list(texts)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        encs = self.tokenizer.encode_batch(texts)
+        lengths = np.fromiter((len(e.ids) for e in encs), dtype=np.int64, count=len(encs))
+        order = np.argsort(lengths, kind="stable")  # vizinhos de tamanho parecido: pouco padding
+        for s in range(0, len(order), self.batch_size):
+            idx = order[s : s + self.batch_size]
+            width = int(lengths[idx].max())
+            ids = np.zeros((len(idx), width), dtype=np.int64)
+            types = np.zeros_like(ids)
+            mask = np.zeros_like(ids)
+            for row, i in enumerate(idx):
+                e = encs[i]
+                n = len(e.ids)
+                ids[row, :n] = e.ids
+                types[row, :n] = e.type_ids
+                mask[row, :n] = 1
+            feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": types}
+            hidden = self.session.run(None, {k: feeds[k] for k in self._inputs})[0]
+            if self._mean:
+                m = mask[:, :, None].astype(np.float32)
+                pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+            else:
+                pooled = hidden[:, 0]
+            out[idx] = pooled
+        if self.meta.get("normalize"):
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("uso: python -m src.onnx_embed MODELO [PASTA]", file=sys.stderr)
+        sys.exit(2)
+    name = sys.argv[1]
+    info = export(name, sys.argv[2] if len(sys.argv) == 3 else model_dir(name))
+    print(json.dumps(info, indent=2))
@@ -1,24 +1,155 @@
 # src/pdf_utils.py
 from __future__ import annotations
 import io
+import multiprocessing
+import os
 import re
-from typing import Iterable, Iterator, Tuple
-from pypdf import PdfReader
+import signal
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Sequence, Set, Tuple
 
-def extract_text_pages(file_bytes: bytes, fonte: str) -> Iterator[Tuple[str, int, str]]:
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+from .settings import SETTINGS
+from .tokens import count_tokens
+from .tracing import span
+
+# abaixo disso o custo de subir processos não compensa
+_PARALLEL_MIN_PAGES = 8
+
+
+def _reader(file_bytes: bytes) -> "PdfReader":
+    # pypdf só na primeira extração: as consultas não pagam o import
+    from pypdf import PdfReader
+
+    return PdfReader(io.BytesIO(file_bytes))
+
+
+def _clean_page_text(txt: str) -> str:
+    # normaliza espaços
+    return re.sub(r"[ \t]+\n", "\n", txt)
+
+
+def _extract_serial(file_bytes: bytes, fonte: str, skip: Set[int] = frozenset()) -> Iterator[Tuple[str, int, str]]:
+    reader = _reader(file_bytes)
+    for i, page in enumerate(reader.pages, start=1):
+        if i in skip:
+            continue
+        try:
+            txt = page.extract_text() or ""
+        except Exception:
+            txt = ""
+        yield _clean_page_text(txt), i, fonte
+
+
+# ---- modo paralelo: cada processo abre o PDF uma vez e extrai páginas avulsas ----
+_WORKER_READER: PdfReader | None = None
+# por página: quando começou e em qual processo (memória compartilhada com o pai)
+_WORKER_STARTED = None
+_WORKER_PIDS = None
+
+
+def _init_worker(file_bytes: bytes, started, pids) -> None:
+    global _WORKER_READER, _WORKER_STARTED, _WORKER_PIDS
+    _WORKER_READER = _reader(file_bytes)
+    _WORKER_STARTED, _WORKER_PIDS = started, pids
+
+
+def _extract_page(index: int) -> str:
+    if _WORKER_STARTED is not None:
+        _WORKER_PIDS[index] = os.getpid()  # type: ignore[index]
+        _WORKER_STARTED[index] = time.time()  # type: ignore[index]
+    try:
+        return _WORKER_READER.pages[index].extract_text() or ""  # type: ignore[union-attr]
+    except Exception:
+        return ""
+
+
+def _wait_page(res, index: int, started, page_timeout: float, poll: float = 0.05) -> bool:
+    """Espera a página até `page_timeout` contado do início dela (não da espera); False se estourou."""
+    while True:
+        t0 = started[index]
+        if not t0:  # ainda na fila, atrás de outras páginas
+            res.wait(poll)
+        else:
+            res.wait(max(0.0, t0 + page_timeout - time.time()))
+        if res.ready():
+            return True
+        if t0 and time.time() >= t0 + page_timeout:
+            return False
+
+
+def _extract_parallel(
+    file_bytes: bytes, fonte: str, n_pages: int, workers: int, page_timeout: float, done: Set[int]
+) -> Iterator[Tuple[str, int, str]]:
+    # "spawn": o processo do app tem threads (Streamlit, fila de ingestão) e fork copiaria locks presos.
+    # Cada processo marca início e pid da página; a que estoura o tempo tem o processo encerrado,
+    # o Pool sobe outro no lugar e as páginas seguintes não esperam por ela.
+    ctx = multiprocessing.get_context("spawn")
+    started = ctx.RawArray("d", n_pages)
+    pids = ctx.RawArray("i", n_pages)
+    pool = ctx.Pool(processes=workers, initializer=_init_worker, initargs=(file_bytes, started, pids))
+    clean = False
+    try:
+        results = [pool.apply_async(_extract_page, (i,)) for i in range(n_pages)]
+        killed = False
+        for i, res in enumerate(results, start=1):
+            if page_timeout <= 0 or _wait_page(res, i - 1, started, page_timeout):
+                txt = res.get()
+            else:
+                # página patológica: segue sem texto para não travar o lote
+                killed = True
+                try:
+                    os.kill(pids[i - 1], signal.SIGTERM)
+                except OSError:
+                    pass  # já terminou
+                txt = ""
+            done.add(i)
+            yield _clean_page_text(txt), i, fonte
+        clean = not killed  # tarefa de processo encerrado nunca conclui: close() + join() não voltaria
+    finally:
+        if clean:
+            pool.close()
+        else:  # página encerrada, erro ou consumidor que parou no meio
+            pool.terminate()
+        pool.join()
+
+
+def extract_text_pages(
+    file_bytes: bytes,
+    fonte: str,
+    workers: int | None = None,
+    page_timeout: float | None = None,
+) -> Iterator[Tuple[str, int, str]]:
     """
     Extrai texto página a página de um PDF e retorna (texto_da_pagina, numero_pagina, fonte).
     A assinatura bate com o rag.py.
+
+    Com `workers` > 1 (padrão: PDF_WORKERS) as páginas são distribuídas num
+    multiprocessing.Pool ("spawn"), mantendo a ordem; cada página tem até
+    `page_timeout` segundos (PDF_PAGE_TIMEOUT) contados do início dela e, se
+    estourar, sai vazia e o processo dela é encerrado. Se o pool falhar, as
+    páginas restantes são extraídas em série.
     """
-    reader = PdfReader(io.BytesIO(file_bytes))
-    for i, page in enumerate(reader.pages, start=1):
+    workers = SETTINGS.pdf_workers if workers is None else int(workers)
+    page_timeout = SETTINGS.pdf_page_timeout if page_timeout is None else float(page_timeout)
+
+    done: Set[int] = set()
+    if workers > 1:
         try:
-            txt = page.extract_text() or ""
+            n_pages = len(_reader(file_bytes).pages)
         except Exception:
-            txt = ""
-        # normaliza espaços
-        txt = re.sub(r"[ \t]+\n", "\n", txt)
-        yield txt, i, fonte
+            n_pages = 0
+        if n_pages >= _PARALLEL_MIN_PAGES:
+            try:
+                yield from _extract_parallel(file_bytes, fonte, n_pages, workers, page_timeout, done)
+                return
+            except Exception:
+                pass  # ex.: falha ao subir os processos — completa em série
+
+    yield from _extract_serial(file_bytes, fonte, skip=done)
 
 def chunk_text(texto: str, max_chars: int = 1200, overlap: int = 200) -> Iterator[str]:
     """
@@ -35,3 +166,148 @@ def chunk_text(texto: str, max_chars: int = 1200, overlap: int = 200) -> Iterato
         if end == n:
             break
         start = max(0, end - overlap)
+
+
+# ===== Quebra estrutural (por parágrafo/frase, em tokens) =====
+# linhas do topo/rodapé de cada página examinadas como possível cabeçalho/rodapé
+_EDGE_LINES = 4
+# fração mínima de páginas em que a linha precisa se repetir
+_REPEAT_FRACTION = 0.5
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+(?=[\"'(\[]?[A-ZÁÂÃÀÉÊÍÓÔÕÚÜÇ0-9•\-])")
+_TABLE_ROW = re.compile(r"\S(?: {2,}|\t| \| )\S.*\S(?: {2,}|\t| \| )\S")
+_LIST_ITEM = re.compile(r"^\s*(?:[-•*▪]|\(?[0-9ivxIVX]{1,4}[.)-]|[a-z]\))\s+")
+
+
+def _line_key(line: str) -> str:
+    """Linha normalizada para comparar entre páginas (números viram '#': 'Página 3 de 10')."""
+    return re.sub(r"\d+", "#", " ".join(line.split()).lower())
+
+
+def repeated_lines(pages: Sequence[str], min_pages: int = 3) -> Set[str]:
+    """Chaves das linhas de topo/rodapé que se repetem em boa parte das páginas."""
+    if len(pages) < min_pages:
+        return set()
+    seen: Counter = Counter()
+    for text in pages:
+        lines = [ln for ln in text.splitlines() if ln.strip()]
+        edges = lines[:_EDGE_LINES] + lines[-_EDGE_LINES:]
+        seen.update({_line_key(ln) for ln in edges})
+    need = max(min_pages, int(_REPEAT_FRACTION * len(pages) + 0.5))
+    # só linhas com 2+ palavras: células soltas de tabela ("mensal", "pH") não são moldura
+    return {k for k, n in seen.items() if n >= need and len(re.findall(r"[^\W\d_]{2,}", k)) >= 2}
+
+
+def strip_repeated(text: str, repeated: Set[str]) -> str:
+    """Remove cabeçalhos/rodapés repetidos do topo e do fim da página."""
+    if not repeated:
+        return text
+    lines = text.splitlines()
+    body = [i for i, ln in enumerate(lines) if ln.strip()]
+    drop = {i for i in body[:_EDGE_LINES] + body[-_EDGE_LINES:] if _line_key(lines[i]) in repeated}
+    if len(drop) == len(body):  # página só com a linha "repetida": é conteúdo, não moldura
+        return text
+    return "\n".join(ln for i, ln in enumerate(lines) if i not in drop)
+
+
+def _units(text: str) -> Iterator[str]:
+    """Parágrafos → frases; linhas de tabela e itens de lista ficam inteiros."""
+    for para in re.split(r"\n\s*\n", text):
+        prose: List[str] = []
+        for line in para.splitlines():
+            if not line.strip():
+                continue
+            if _TABLE_ROW.search(line) or _LIST_ITEM.match(line):
+                if prose:
+                    yield from _SENTENCE_END.split(" ".join(prose))
+                    prose = []
+                yield " ".join(line.split())
+            else:
+                prose.append(line.strip())
+        if prose:
+            # hifenização de fim de linha: "licencia-\nmento" → "licenciamento"
+            joined = re.sub(r"(\w)- (\w)", r"\1\2", " ".join(prose))
+            yield from _SENTENCE_END.split(joined)
+
+
+def _fit_words(words: List[str], max_tokens: int) -> Tuple[str, List[str]]:
+    """Recontagem na fronteira: o maior prefixo de `words` que cabe inteiro, e o que sobrou."""
+    cut = len(words)
+    while cut > 1 and count_tokens(" ".join(words[:cut])) > max_tokens:
+        cut -= 1
+    return " ".join(words[:cut]), words[cut:]
+
+
+def _split_long(unit: str, max_tokens: int) -> Iterator[str]:
+    """
+    Frase maior que o orçamento: corta entre palavras. Cada palavra é contada uma
+    vez (soma corrente); só o pedaço fechado é recontado inteiro e, se a junção
+    der mais tokens que a soma, as últimas palavras passam para o próximo.
+    """
+    cur: List[str] = []
+    used = 0
+    for w in unit.split():
+        n = count_tokens(w)
+        if cur and used + n > max_tokens:
+            piece, cur = _fit_words(cur, max_tokens)
+            yield piece
+            used = sum(count_tokens(c) for c in cur)
+        cur.append(w)
+        used += n
+    while cur:
+        piece, cur = _fit_words(cur, max_tokens)
+        yield piece
+
+
+def chunk_structured(texto: str, max_tokens: int | None = None) -> Iterator[str]:
+    """
+    Junta parágrafos/frases inteiros até `max_tokens` (CHUNK_MAX_TOKENS) por trecho.
+    Uma página gera os próprios trechos (a página de origem é preservada).
+    """
+    max_tokens = SETTINGS.chunk_max_tokens if max_tokens is None else int(max_tokens)
+    cur: List[str] = []
+    used = 0
+    for unit in _units(texto or ""):
+        unit = unit.strip()
+        if not unit:
+            continue
+        n = count_tokens(unit)
+        pieces = [unit] if n <= max_tokens else list(_split_long(unit, max_tokens))
+        for piece in pieces:
+            n = count_tokens(piece) if len(pieces) > 1 else n
+            if cur and used + n > max_tokens:
+                yield " ".join(cur)
+                cur, used = [], 0
+            cur.append(piece)
+            used += n
+    if cur:
+        yield " ".join(cur)
+
+
+def chunker_signature() -> str:
+    """
+    Identifica a forma de quebra na impressão digital do manifesto: trocar o
+    chunker (ou o orçamento) reprocessa os documentos. Vazio no modo antigo,
+    para não invalidar o que já foi indexado com ele.
+    """
+    if (SETTINGS.chunker or "structured").strip().lower() == "chars":
+        return ""
+    return f"structured-v1:{SETTINGS.chunk_max_tokens}"
+
+
+def document_pages(file_bytes: bytes, fonte: str) -> List[Tuple[str, int]]:
+    """(texto, página) do documento, já sem cabeçalhos/rodapés repetidos (no modo estrutural)."""
+    with span("pdf.extract", bytes=len(file_bytes)) as s:
+        pages = [(t, int(p)) for t, p, _f in extract_text_pages(file_bytes, fonte=fonte)]
+        s.add("pages", len(pages))
+        if not chunker_signature():
+            return pages
+        repeated = repeated_lines([t for t, _ in pages])
+        return [(strip_repeated(t, repeated), p) for t, p in pages]
+
+
+def chunk_page(texto: str) -> Iterator[str]:
+    """Quebra da página conforme CHUNKER (structured | chars)."""
+    with span("pdf.chunk", chars=len(texto)) as s:
+        chunks = list(chunk_structured(texto) if chunker_signature() else chunk_text(texto))
+        s.add("chunks", len(chunks))
+    return iter(chunks)
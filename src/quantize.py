@@ -0,0 +1,140 @@
+# src/quantize.py
+"""
+Codificação dos vetores para armazenamento/busca (VECTOR_ENCODING / VECTOR_TRUNCATE_DIM):
+
+- float32 — sem perda (padrão, mesmo formato de antes);
+- float16 — metade do tamanho;
+- int8    — quantização escalar por dimensão (mín/máx aprendidos no 1º lote), 1/4 do tamanho;
+- binary  — 1 bit por dimensão (sinal), busca por Hamming, 1/32 do tamanho;
+- truncamento estilo Matryoshka (modelos text-embedding-3 da OpenAI): mantém as
+  primeiras N dimensões e renormaliza.
+
+No backend local os vetores float32 completos ficam no disco e os melhores
+candidatos da varredura quantizada são reavaliados com eles (rescoring exato).
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from .settings import SETTINGS
+
+_KINDS = {"float32": "f32", "float16": "f16", "int8": "i8", "binary": "b1"}
+# nº de bits 1 em cada byte (popcount por tabela)
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int32)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+@dataclass(frozen=True)
+class VectorEncoding:
+    kind: str = "float32"
+    truncate_dim: int = 0
+
+    def __post_init__(self):
+        if self.kind not in _KINDS:
+            raise ValueError(f"VECTOR_ENCODING inválido: {self.kind!r} (use {', '.join(_KINDS)}).")
+
+    @property
+    def tag(self) -> str:
+        """Sufixo do nome da coleção; vazio no formato original (float32 completo)."""
+        if self.kind == "float32" and not self.truncate_dim:
+            return ""
+        return _KINDS[self.kind] + (f"t{self.truncate_dim}" if self.truncate_dim else "")
+
+    @property
+    def lossy(self) -> bool:
+        return bool(self.tag)
+
+    def stored_dim(self, dim: int) -> int:
+        return min(self.truncate_dim, dim) if self.truncate_dim else dim
+
+    def prepare(self, vecs) -> np.ndarray:
+        """float32 2D, truncado (se configurado) e normalizado."""
+        x = np.asarray(vecs, dtype=np.float32)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        if self.truncate_dim and x.shape[1] > self.truncate_dim:
+            x = x[:, : self.truncate_dim]
+        return _normalize(x)
+
+
+def current_encoding() -> VectorEncoding:
+    return VectorEncoding(
+        kind=(SETTINGS.vector_encoding or "float32").strip().lower(),
+        truncate_dim=int(SETTINGS.vector_truncate_dim or 0),
+    )
+
+
+class Codec:
+    """Códigos compactos de uma coleção local e o produto interno aproximado sobre eles."""
+
+    def __init__(self, enc: VectorEncoding, dim: int, root: str):
+        self.enc = enc
+        self.dim = enc.stored_dim(dim)
+        self._params_path = os.path.join(root, "int8_params.npy")
+        self.lo: np.ndarray | None = None
+        self.scale: np.ndarray | None = None
+        if enc.kind == "int8" and os.path.exists(self._params_path):
+            self.lo, self.scale = np.load(self._params_path)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype({"float32": np.float32, "float16": np.float16, "int8": np.int8, "binary": np.uint8}[self.enc.kind])
+
+    @property
+    def width(self) -> int:
+        return (self.dim + 7) // 8 if self.enc.kind == "binary" else self.dim
+
+    def _fit_int8(self, x: np.ndarray) -> None:
+        lo, hi = x.min(axis=0), x.max(axis=0)
+        margin = 0.1 * (hi - lo) + 1e-6  # folga para lotes futuros
+        self.lo = (lo - margin).astype(np.float32)
+        self.scale = ((hi - lo + 2 * margin) / 255.0).astype(np.float32)
+        np.save(self._params_path, np.stack([self.lo, self.scale]))
+
+    def encode(self, vecs: np.ndarray) -> np.ndarray:
+        x = self.enc.prepare(vecs)
+        kind = self.enc.kind
+        if kind == "float32":
+            return x
+        if kind == "float16":
+            return x.astype(np.float16)
+        if kind == "int8":
+            if self.lo is None:
+                self._fit_int8(x)
+            q = np.rint((x - self.lo) / self.scale) - 128
+            return np.clip(q, -128, 127).astype(np.int8)
+        return np.packbits(x > 0, axis=1)
+
+    def prepare_query(self, q: np.ndarray):
+        x = self.enc.prepare(q)
+        if self.enc.kind == "int8":
+            qs = x * self.scale
+            return qs, 128.0 * qs.sum(axis=1) + x @ self.lo
+        if self.enc.kind == "binary":
+            return np.packbits(x > 0, axis=1)
+        return x
+
+    def select(self, qp, qi: int):
+        """Consulta preparada só da linha `qi`."""
+        if self.enc.kind == "int8":
+            return qp[0][qi : qi + 1], qp[1][qi : qi + 1]
+        return qp[qi : qi + 1]
+
+    def scores(self, codes: np.ndarray, qp) -> np.ndarray:
+        """(nq, nb) — maior é melhor, como o IP do Milvus."""
+        kind = self.enc.kind
+        if kind == "int8":
+            qs, const = qp
+            return qs @ np.asarray(codes, dtype=np.float32).T + const[:, None]
+        if kind == "binary":
+            ham = _POPCOUNT[np.bitwise_xor(np.asarray(codes)[None, :, :], qp[:, None, :])].sum(axis=2)
+            return (self.dim - 2 * ham).astype(np.float32)
+        return qp @ np.asarray(codes, dtype=np.float32).T
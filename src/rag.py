@@ -1,16 +1,37 @@
 # src/rag.py
 from __future__ import annotations
 
-from typing import Iterable, List, Dict, Tuple
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Sized, Tuple
 import numpy as np
 
-from .milvus_utils import get_or_create_collection, insert_records, search
-from .pdf_utils import extract_text_pages, chunk_text
+from .answer_cache import invalidate_collection
+from .batcher import MicroBatcher
+from .bm25 import get_bm25_index
+from .context_packer import MIN_OVERLAP_CHARS, suffix_prefix_overlap
+from .embed_cache import get_embedding_cache, text_hash
+from .manifest import fingerprint, get_manifest
+from .vectorstore import delete_records, get_or_create_collection, has_rows, insert_records, search_many
+from .pdf_utils import chunk_page, chunker_signature, document_pages
+from .quantize import current_encoding
+from .sentence_index import get_sentence_index
+from .settings import SETTINGS
+from .tracing import span
 
 # Tamanho máximo para caber no VARCHAR(16384) com folga
 MAX_CHARS = 16000
-# Tamanho de lote para gerar embeddings (evita milhares de chamadas)
+# Tamanho de lote para gerar embeddings (evita milhares de chamadas);
+# encoders podem declarar o próprio `batch_size`
 BATCH_SIZE = 64
+# Reciprocal rank fusion: 1 / (RRF_K + posição), como no artigo original
+RRF_K = 60
+# Modo híbrido: candidatos buscados em cada lista antes da fusão (× top_k)
+HYBRID_FETCH = 4
+# Modo MMR: candidatos buscados (× top_k) para diversificar
+MMR_FETCH = 4
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical", "mmr")
 
 
 def _to_2d_array(x) -> np.ndarray:
@@ -22,76 +43,532 @@ def _to_2d_array(x) -> np.ndarray:
 
 
 def _embed_batch(encoder, texts: List[str]) -> np.ndarray:
-    """Encapsula o encoder.encode, garantindo np.ndarray float32."""
-    vecs = encoder.encode(texts)
-    return _to_2d_array(vecs)
+    """
+    Encapsula o encoder.encode, garantindo np.ndarray float32.
+    Consulta antes o cache em disco: só as faltas vão ao encoder, num único lote.
+    """
+    cache = get_embedding_cache()
+    if cache is None or not texts:
+        return _to_2d_array(encoder.encode(texts))
+
+    model = _encoder_key(encoder)
+    found = cache.get_many(model, texts)
+    misses = [i for i in range(len(texts)) if i not in found]
+    if not misses:
+        return np.stack([found[i] for i in range(len(texts))]).astype(np.float32)
+
+    miss_texts = [texts[i] for i in misses]
+    new = _to_2d_array(encoder.encode(miss_texts))
+    cache.put_many(model, miss_texts, new)
+
+    out = np.empty((len(texts), new.shape[1]), dtype=np.float32)
+    out[misses] = new
+    for i, v in found.items():
+        out[i] = v
+    return out
 
 
 def _probe_dim(encoder) -> int:
     """Descobre a dimensão do embedding no runtime."""
-    v = _embed_batch(encoder, ["__probe__"])
+    with span("rag.embed_probe"):
+        v = _embed_batch(encoder, ["__probe__"])
     return int(v.shape[1])
 
 
+# ===== Registro de dimensões (uma sonda por modelo, por processo) =====
+_DIMS: Dict[str, int] = {}
+_DIMS_LOCK = threading.Lock()
+
+
+def _encoder_key(encoder) -> str:
+    """Identifica o modelo do encoder (EmbeddingsLocal.model_name / EmbeddingsCloud.model)."""
+    for attr in ("model_name", "model"):
+        v = getattr(encoder, attr, None)
+        if isinstance(v, str) and v:
+            return f"{type(encoder).__name__}:{v}"
+    return type(encoder).__name__
+
+
+def _remember_dim(encoder, dim: int) -> None:
+    with _DIMS_LOCK:
+        _DIMS[_encoder_key(encoder)] = int(dim)
+
+
+def embedding_dim(encoder) -> int:
+    """Dimensão do embedding do encoder; só sonda o modelo na primeira vez."""
+    key = _encoder_key(encoder)
+    with _DIMS_LOCK:
+        dim = _DIMS.get(key)
+    if dim is None:
+        dim = _probe_dim(encoder)
+        _remember_dim(encoder, dim)
+    return dim
+
+
+def collection_for(encoder, base_name: str) -> str:
+    """Nomeia coleção conforme modo + dimensão dos embeddings (evita 3072×384) + codificação."""
+    from .llm_router import EmbeddingsCloud
+
+    mode_tag = "cloud" if isinstance(encoder, EmbeddingsCloud) else "local"
+    try:
+        dim = embedding_dim(encoder)  # sonda só na primeira vez por modelo
+    except Exception:
+        dim = 0
+    enc_tag = current_encoding().tag  # ex.: f16, i8t256 — índices incompatíveis não se misturam
+    return f"{base_name}_{mode_tag}_{dim}d" + (f"_{enc_tag}" if enc_tag else "")
+
+
+@dataclass
+class IngestReport:
+    """Resumo de uma ingestão incremental."""
+    chunks: int = 0            # trechos inseridos
+    docs_added: int = 0
+    docs_skipped: int = 0      # idênticos ao já indexado
+    docs_replaced: int = 0     # já indexados, mas com conteúdo diferente
+    pages_added: int = 0
+    pages_skipped: int = 0
+    pages_replaced: int = 0
+    pages_removed: int = 0     # existiam na versão anterior do documento
+    docs_resumed: int = 0      # ingestão anterior interrompida no meio (checkpoint)
+    # tempo por etapa (s): extração+limpeza das páginas, embeddings, gravação nos índices
+    extract_s: float = 0.0
+    embed_s: float = 0.0
+    insert_s: float = 0.0
+
+    @property
+    def pages_extracted(self) -> int:
+        return self.pages_added + self.pages_skipped + self.pages_replaced
+
+
+def _quote(value: str) -> str:
+    """Literal de string para expressões de filtro do Milvus."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+# (texto, fonte, pagina) de um trecho; ou um marcador (objeto sentinela, comparado com `is`,
+# para nenhum trecho de PDF ser confundido com ele):
+# (_DOC_START, fonte, (sha256, {pagina: sha256} anterior)) no início de cada documento,
+# (_PAGE_DONE, fonte, (pagina, sha256)) depois dos trechos de cada página (checkpoint),
+# (_DOC_DONE, fonte, (sha256, {pagina: sha256})) no fim, para gravar no manifesto
+_DOC_START = object()
+_PAGE_DONE = object()
+_DOC_DONE = object()
+
+ProgressFn = Callable[[int, int, int], None]  # (arquivos concluídos, total de arquivos, trechos inseridos)
+
+
+def _delete(col, lexical, sentences, expr: str) -> None:
+    """Remove das indexações vetorial e léxica e desconta do índice de frases (DF)."""
+    sentences.remove_chunks(lexical.texts(expr))
+    delete_records(col, expr)
+    lexical.delete(expr)
+
+
+def _page_chunks(texto_pagina: str) -> Iterator[str]:
+    # quebra a página em pedaços menores (CHUNKER)
+    for trecho in chunk_page(texto_pagina):
+        texto = (trecho or "").strip()
+        if texto:
+            # corte de segurança para caber no VARCHAR
+            yield texto[:MAX_CHARS]
+
+
+def _add_lexical(lexical, texto_pagina: str, fonte: str, pagina: int, tipo_licenca: str, tipo_empreendimento: str) -> None:
+    """Página já no armazenamento vetorial, mas indexada antes de o índice BM25 existir."""
+    texts = list(_page_chunks(texto_pagina))
+    n = len(texts)
+    lexical.add(texts, [fonte] * n, [pagina] * n, [tipo_licenca] * n, [tipo_empreendimento] * n)
+
+
+def _iter_chunks(
+    col,
+    files: Iterable[Tuple[str, bytes]],
+    tipo_licenca: str,
+    tipo_empreendimento: str,
+    collection_name: str,
+    report: IngestReport,
+) -> Iterator[Tuple[object, str, object]]:
+    """Extrai → compara com o manifesto → quebra em trechos, um documento por vez."""
+    manifest = get_manifest()
+    lexical = get_bm25_index(collection_name)
+    sentences = get_sentence_index(collection_name)
+    seen: Dict[str, str] = {}  # fonte → sha256 já processado nesta execução
+    # trocar o chunker muda as impressões digitais: os documentos são reprocessados
+    salt = chunker_signature()
+
+    for fname, fbytes in files:
+        fonte = f"{tipo_licenca}_{tipo_empreendimento}_{fname}"
+        doc_hash = fingerprint(fbytes, salt)
+        prev = manifest.document(collection_name, fonte)
+        if seen.get(fonte) == doc_hash or (prev is not None and prev.sha256 == doc_hash):
+            report.docs_skipped += 1
+            if seen.get(fonte) != doc_hash and not lexical.has_source(fonte):
+                t0 = time.perf_counter()
+                pages = document_pages(fbytes, fonte)
+                report.extract_s += time.perf_counter() - t0
+                for texto_pagina, pagina in pages:
+                    _add_lexical(lexical, texto_pagina, fonte, pagina, tipo_licenca, tipo_empreendimento)
+            yield _DOC_DONE, fonte, None
+            continue
+        seen[fonte] = doc_hash
+        resumed = prev is not None and prev.partial
+        # o manifesto é local (DATA_DIR); a coleção remota pode ter sobrevivido a ele (ex.: disco
+        # efêmero do Streamlit Cloud): sem ele, não dá para saber quais páginas valem — refaz todas
+        orphan = prev is None and has_rows(col, f"fonte == {_quote(fonte)}")
+        if orphan:
+            _delete(col, lexical, sentences, f"fonte == {_quote(fonte)}")
+        if resumed:
+            report.docs_resumed += 1
+        elif prev is None and not orphan:
+            report.docs_added += 1
+        else:
+            report.docs_replaced += 1
+        prev_pages = prev.pages if prev is not None else {}
+        backfill = bool(prev_pages) and not lexical.has_source(fonte)
+        yield _DOC_START, fonte, (doc_hash, dict(prev_pages))
+
+        # páginas já sem cabeçalho/rodapé repetido (precisa do documento inteiro)
+        t0 = time.perf_counter()
+        pages = document_pages(fbytes, fonte)
+        report.extract_s += time.perf_counter() - t0
+
+        page_hashes: Dict[int, str] = {}
+        for texto_pagina, pagina in pages:
+            page_hashes[pagina] = fingerprint(texto_pagina, salt)
+            old = prev_pages.get(pagina)
+            if old == page_hashes[pagina]:
+                report.pages_skipped += 1
+                if backfill:
+                    _add_lexical(lexical, texto_pagina, fonte, pagina, tipo_licenca, tipo_empreendimento)
+                continue
+            if old is None:
+                report.pages_added += 1
+                if resumed:
+                    # pode ter entrado pela metade antes da interrupção
+                    _delete(col, lexical, sentences, f"fonte == {_quote(fonte)} && pagina == {pagina}")
+            else:
+                report.pages_replaced += 1
+                # as páginas substituídas saem antes de o trecho novo entrar
+                _delete(col, lexical, sentences, f"fonte == {_quote(fonte)} && pagina == {pagina}")
+
+            for texto in _page_chunks(texto_pagina):
+                yield texto, fonte, pagina
+            yield _PAGE_DONE, fonte, (pagina, page_hashes[pagina])
+
+        removed = sorted(p for p in prev_pages if p not in page_hashes)
+        if removed:
+            report.pages_removed += len(removed)
+            _delete(col, lexical, sentences, f"fonte == {_quote(fonte)} && pagina in {removed}")
+        yield _DOC_DONE, fonte, (doc_hash, page_hashes)
+
+
 def ingest_pdfs(
     encoder,
     files: Iterable[Tuple[str, bytes]],
     tipo_licenca: str,
     tipo_empreendimento: str,
     collection_name: str,
-) -> int:
+    progress: ProgressFn | None = None,
+) -> IngestReport:
     """
-    Lê PDFs, quebra em páginas/trechos, gera embeddings e grava no Milvus.
-    Retorna o número de trechos inseridos.
+    Lê PDFs, quebra em páginas/trechos, gera embeddings e grava no armazenamento
+    vetorial (Milvus ou local, conforme VECTOR_BACKEND) e no índice BM25 da coleção.
+    Pipeline em fluxo (extrai → quebra → embeddings em lotes de `encoder.batch_size` →
+    insere em colunas NumPy): a memória fica limitada a um lote, e `files`
+    pode ser um gerador que lê um upload por vez. O flush é feito só no fim.
+
+    Incremental: documentos já indexados sem mudança são pulados e, nos
+    alterados, só as páginas novas/modificadas são (re)inseridas — as antigas
+    saem por delete-por-expressão. A cada lote gravado, o manifesto recebe um
+    checkpoint das páginas completas de cada documento em andamento: uma
+    ingestão interrompida recomeça dali (as páginas sem checkpoint são apagadas
+    e refeitas). Retorna as contagens e o tempo por etapa em um IngestReport.
     """
-    dim = _probe_dim(encoder)
+    dim = embedding_dim(encoder)
     col = get_or_create_collection(collection_name, dim=dim)
+    manifest = get_manifest()
+    lexical = get_bm25_index(collection_name)
+    if not has_rows(col):
+        # coleção recriada/vazia: o manifesto e o índice léxico anteriores não valem mais
+        manifest.forget_collection(collection_name)
+        lexical.clear()
 
-    # Colete todos os trechos primeiro (para batch de embeddings)
-    pending: List[Tuple[str, str, int, str, str]] = []
-    #            (texto, fonte, pagina, tipo_licenca, tipo_empreendimento)
+    report = IngestReport()
+    batch_size = int(getattr(encoder, "batch_size", BATCH_SIZE) or BATCH_SIZE)
+    files_total = len(files) if isinstance(files, Sized) else 0
+    files_done = 0
+    batch: List[Tuple[str, str, int]] = []
+    done_docs: List[Tuple[str, object]] = []  # documentos cujo último trecho já está no lote
+    done_pages: List[Tuple[str, int, str]] = []  # idem, páginas (fonte, pagina, sha256)
+    in_progress: Dict[str, Tuple[str, Dict[int, str]]] = {}  # fonte → (sha256, páginas completas)
 
-    for fname, fbytes in files:
-        fonte = f"{tipo_licenca}_{tipo_empreendimento}_{fname}"
-        # extract_text_pages deve render (texto_pagina, pagina, fonte)
-        for texto_pagina, pagina, _fonte in extract_text_pages(fbytes, fonte=fonte):
-            # quebra a página em pedaços menores
-            for trecho in chunk_text(texto_pagina):
-                texto = (trecho or "").strip()
-                if not texto:
-                    continue
-                # corte de segurança para caber no VARCHAR
-                texto = texto[:MAX_CHARS]
-                pending.append((texto, fonte, int(pagina), tipo_licenca, tipo_empreendimento))
-
-    if not pending:
-        return 0
-
-    # Embeddings em lote e inserção
-    registros: List[Dict] = []
-    total = 0
-    for i in range(0, len(pending), BATCH_SIZE):
-        batch = pending[i : i + BATCH_SIZE]
-        texts = [t[0] for t in batch]
-        vecs = _embed_batch(encoder, texts)
-        for j, (texto, fonte, pagina, tlic, temp) in enumerate(batch):
-            emb_j = vecs[j].tolist()
-            registros.append(
-                {
-                    "embedding": emb_j,
-                    "text": texto,
-                    "fonte": fonte,
-                    "pagina": int(pagina),
-                    "tipo_licenca": tlic,
-                    "tipo_empreendimento": temp,
-                }
+    def _commit() -> None:
+        nonlocal batch, done_docs, done_pages, files_done
+        if batch:
+            t0 = time.perf_counter()
+            with span("ingest.embed", chunks=len(batch)):
+                vecs = _embed_batch(encoder, [t for t, _, _ in batch])
+            t1 = time.perf_counter()
+            report.embed_s += t1 - t0
+            # frases/termos para o modo extrativo (antes da inserção: se falhar, nada fica pela metade)
+            get_sentence_index(collection_name).add_chunks([t for t, _, _ in batch])
+            insert_records(
+                col,
+                vecs,
+                [t for t, _, _ in batch],
+                [f for _, f, _ in batch],
+                [p for _, _, p in batch],
+                [tipo_licenca] * len(batch),
+                [tipo_empreendimento] * len(batch),
+                flush=False,
+            )
+            lexical.add(
+                [t for t, _, _ in batch],
+                [f for _, f, _ in batch],
+                [p for _, _, p in batch],
+                [tipo_licenca] * len(batch),
+                [tipo_empreendimento] * len(batch),
             )
-            total += 1
+            report.insert_s += time.perf_counter() - t1
+            report.chunks += len(batch)
+            batch = []
+        # só depois de gravado: registra o que passou a estar indexado
+        touched = set()
+        for fonte, pagina, page_hash in done_pages:
+            if fonte in in_progress:
+                in_progress[fonte][1][pagina] = page_hash
+                touched.add(fonte)
+        done_pages = []
+        for fonte, state in done_docs:
+            in_progress.pop(fonte, None)
+            if state is not None:
+                doc_hash, page_hashes = state  # type: ignore[misc]
+                manifest.save_document(collection_name, fonte, doc_hash, page_hashes)
+            files_done += 1
+        done_docs = []
+        for fonte in touched & in_progress.keys():
+            doc_hash, pages = in_progress[fonte]
+            manifest.save_checkpoint(collection_name, fonte, doc_hash, pages)
+        if progress is not None:
+            progress(files_done, files_total, report.chunks)
+
+    try:
+        for texto, fonte, extra in _iter_chunks(
+            col, files, tipo_licenca, tipo_empreendimento, collection_name, report
+        ):
+            if texto is _DOC_START:
+                doc_hash, prev_pages = extra  # type: ignore[misc]
+                in_progress[fonte] = (doc_hash, prev_pages)
+                continue
+            if texto is _PAGE_DONE:
+                done_pages.append((fonte, *extra))  # type: ignore[arg-type]
+                continue
+            if texto is _DOC_DONE:
+                done_docs.append((fonte, extra))
+                if not batch:
+                    _commit()
+                continue
+            batch.append((str(texto), fonte, int(extra)))  # type: ignore[arg-type]
+            if len(batch) >= batch_size:
+                _commit()
+        _commit()
+
+        if report.chunks:
+            col.flush()
+        lexical.optimize()
+    finally:
+        # mesmo se falhar no meio, o que já entrou muda as respostas
+        invalidate_collection(collection_name)
+    return report
+
+
+def _hit_dict(h, vectors: bool = False) -> Dict | None:
+    # h.distance e h.entity[...] (PyMilvus Hit)
+    entity = getattr(h, "entity", None)
+    if entity is None:  # fallback defensivo
+        return None
+    hit = {
+        "score": float(getattr(h, "distance", 0.0)),
+        "text": entity.get("text"),
+        "fonte": entity.get("fonte"),
+        "pagina": int(entity.get("pagina")),
+        "tipo_licenca": entity.get("tipo_licenca"),
+        "tipo_empreendimento": entity.get("tipo_empreendimento"),
+    }
+    if vectors:  # só no caminho do MMR; saem antes de devolver ao app
+        hit["id"] = getattr(h, "id", None)
+        hit["vector"] = entity.get("embedding")
+    return hit
+
+
+def _hit_key(hit: Dict) -> Tuple[str, int, str]:
+    return hit["fonte"], hit["pagina"], text_hash(hit["text"] or "")
+
+
+def rrf_fuse(rankings: List[List[Dict]], top_k: int, k: int = RRF_K) -> List[Dict]:
+    """Reciprocal rank fusion: soma 1/(k + posição) de cada lista; `score` vira o escore fundido."""
+    fused: Dict[Tuple[str, int, str], Dict] = {}
+    for hits in rankings:
+        for rank, hit in enumerate(hits, start=1):
+            key = _hit_key(hit)
+            if key not in fused:
+                fused[key] = dict(hit, score=0.0)
+            fused[key]["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda h: -h["score"])[:top_k]
+
+
+# ===== Perguntas concorrentes em micro-lotes (src/batcher.py) =====
+def _embed_queries(_key, items: List[Tuple[object, str]]) -> List[np.ndarray]:
+    # mesma chave = mesmo objeto encoder
+    q = _embed_batch(items[0][0], [text for _, text in items])
+    _remember_dim(items[0][0], q.shape[1])
+    return list(q)
+
+
+def _search_queries(key, items: List[Tuple[object, np.ndarray, int]]) -> List[List]:
+    # mesma coleção, filtro e campos: uma busca multivetor com o maior top_k, recortada por pergunta
+    _name, expr, vectors = key
+    col = items[0][0]
+    k = max(top_k for _, _, top_k in items)
+    results = search_many(col, [q for _, q, _ in items], top_k=k, expr=expr, vectors=vectors)
+    return [list(r)[:top_k] for r, (_, _, top_k) in zip(results, items)]
+
+
+QUERY_EMBEDDER = MicroBatcher(_embed_queries)
+QUERY_SEARCHER = MicroBatcher(_search_queries)
+
+
+def embed_query(encoder, query: str) -> np.ndarray:
+    """Embedding (1D) da pergunta; também registra a dimensão do modelo."""
+    # o próprio embedding da pergunta informa a dimensão (sem sonda extra);
+    # perguntas simultâneas com o mesmo encoder saem numa chamada só
+    with span("rag.embed_query", chars=len(query)):
+        return QUERY_EMBEDDER(id(encoder), (encoder, query))
+
+
+def _query_vector(encoder, query: str, qvec: np.ndarray | None) -> np.ndarray:
+    q = embed_query(encoder, query) if qvec is None else np.asarray(qvec, dtype=np.float32)
+    return q.reshape(-1)
+
+
+def _vector_hits(
+    encoder, query: str, collection_name: str, top_k: int, expr: str | None, qvec: np.ndarray | None,
+    vectors: bool = False,
+) -> List[Dict]:
+    q = _query_vector(encoder, query, qvec)
+    col = get_or_create_collection(collection_name, dim=int(q.shape[-1]))
 
-    if registros:
-        insert_records(col, registros)
+    with span("rag.search_vector") as s:
+        result = QUERY_SEARCHER((collection_name, expr, vectors), (col, q.tolist(), int(top_k)))
+        s.add("hits", len(result))
+    return [d for d in (_hit_dict(h, vectors) for h in result) if d is not None]
 
-    return total
+
+def _lexical_hits(lexical, query: str, top_k: int, expr: str | None) -> List[Dict]:
+    with span("rag.search_bm25") as s:
+        hits = lexical.search(query, top_k=top_k, expr=expr)
+        s.add("hits", len(hits))
+    return hits
+
+
+# ===== Diversificação (MMR) e junção de trechos vizinhos =====
+def mmr_order(qvec: np.ndarray, vecs: np.ndarray, k: int, lam: float) -> List[int]:
+    """
+    Maximal Marginal Relevance: escolhe um a um o candidato com maior
+    lam·sim(pergunta) − (1 − lam)·max sim(já escolhidos). A maior semelhança de
+    cada candidato com os escolhidos é mantida num vetor e atualizada a cada
+    escolha (uma multiplicação matriz × vetor por passo).
+    """
+    v = np.asarray(vecs, dtype=np.float32)
+    if not len(v):
+        return []
+    v = v / np.clip(np.linalg.norm(v, axis=1, keepdims=True), 1e-12, None)
+    q = np.asarray(qvec, dtype=np.float32).reshape(-1)
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+    rel = v @ q
+    redundancy = np.zeros(len(v), dtype=np.float32)
+    free = np.ones(len(v), dtype=bool)
+    order: List[int] = []
+    for _ in range(min(int(k), len(v))):
+        score = np.where(free, lam * rel - (1.0 - lam) * redundancy, -np.inf)
+        i = int(np.argmax(score))
+        order.append(i)
+        free[i] = False
+        redundancy = np.maximum(redundancy, v @ v[i])
+    return order
+
+
+def _touches(a: Dict, b: Dict) -> bool:
+    """Trechos vizinhos: ids seguidos (mesma inserção) ou a sobreposição do chunk_text."""
+    if a.get("id") is not None and b.get("id") is not None and abs(int(a["id"]) - int(b["id"])) == 1:
+        return True
+    ta, tb = a["text"] or "", b["text"] or ""
+    return max(suffix_prefix_overlap(ta, tb), suffix_prefix_overlap(tb, ta)) >= MIN_OVERLAP_CHARS
+
+
+def _join_group(group: List[Dict]) -> Dict:
+    if len(group) == 1:
+        return group[0]
+    if all(h.get("id") is not None for h in group):
+        group = sorted(group, key=lambda h: int(h["id"]))  # ordem do documento
+    text = group[0]["text"] or ""
+    for h in group[1:]:
+        t = h["text"] or ""
+        k = suffix_prefix_overlap(text, t)
+        if k >= MIN_OVERLAP_CHARS:  # text … | sobreposição | … t
+            text += t[k:]
+            continue
+        k = suffix_prefix_overlap(t, text)
+        text = t + text[k:] if k >= MIN_OVERLAP_CHARS else text + "\n" + t
+    best = max(group, key=lambda h: h["score"])
+    return dict(best, text=text)
+
+
+def merge_adjacent(hits: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Percorre os hits na ordem dada; um trecho vizinho de outro já escolhido da
+    mesma fonte/página é colado nele (não ocupa vaga) — e, se ligar dois grupos,
+    os dois viram um. Para em `top_k` grupos.
+    """
+    groups: List[List[Dict]] = []
+    for hit in hits:
+        page = (hit["fonte"], hit["pagina"])
+        linked = [
+            g for g in groups if (g[0]["fonte"], g[0]["pagina"]) == page and any(_touches(o, hit) for o in g)
+        ]
+        if linked:
+            head = linked[0]
+            head.append(hit)
+            for g in linked[1:]:
+                head.extend(g)
+                groups.remove(g)
+        elif len(groups) < top_k:
+            groups.append([hit])
+        else:
+            break
+    return [_join_group(g) for g in groups]
+
+
+def _mmr_hits(
+    encoder, query: str, collection_name: str, top_k: int, expr: str | None, qvec: np.ndarray | None
+) -> List[Dict]:
+    q = _query_vector(encoder, query, qvec)
+    cands = _vector_hits(encoder, query, collection_name, max(top_k * MMR_FETCH, top_k), expr, q, vectors=True)
+    if not cands:
+        return []
+    with span("rag.mmr", candidates=len(cands)):
+        missing = [i for i, h in enumerate(cands) if h["vector"] is None]
+        if missing:
+            # backend sem os vetores (ex.: Milvus com VECTOR_ENCODING): recalcula pelo cache de embeddings
+            for i, v in zip(missing, _embed_batch(encoder, [cands[i]["text"] or "" for i in missing])):
+                cands[i]["vector"] = v
+        vecs = np.stack([np.asarray(h["vector"], dtype=np.float32) for h in cands])
+        order = mmr_order(q, vecs, len(cands), SETTINGS.mmr_lambda)
+        hits = merge_adjacent([cands[i] for i in order], top_k)
+    for h in hits:
+        h.pop("vector", None)
+        h.pop("id", None)
+    return hits
 
 
 def retrieve_top_k(
@@ -100,29 +577,33 @@ def retrieve_top_k(
     collection_name: str,
     top_k: int = 5,
     expr: str | None = None,
+    mode: str | None = None,
+    qvec: np.ndarray | None = None,
 ):
-    """Faz a busca vetorial (com filtro opcional) e retorna hits em dicts simples."""
-    dim = _probe_dim(encoder)
-    col = get_or_create_collection(collection_name, dim=dim)
-
-    qvec = _embed_batch(encoder, [query])[0].tolist()
-    result = search(col, qvec, top_k=top_k, expr=expr)
+    """
+    Busca com filtro opcional e retorna hits em dicts simples. `mode` (padrão
+    SETTINGS.retrieval_mode): "vector" (só embeddings), "lexical" (só BM25) ou
+    "hybrid" (as duas listas fundidas por RRF — acha códigos e nomes exatos) ou
+    "mmr" (vetorial com MMR_FETCH×top_k candidatos diversificados por MMR_LAMBDA;
+    trechos vizinhos da mesma fonte/página saem juntos num hit só).
+    `qvec` reaproveita um embedding da pergunta já calculado (embed_query).
+    """
+    mode = (mode or SETTINGS.retrieval_mode or "vector").strip().lower()
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo de busca inválido: {mode!r} (use {', '.join(RETRIEVAL_MODES)}).")
+    with span(f"rag.retrieve_{mode}"):
+        if mode == "vector":
+            return _vector_hits(encoder, query, collection_name, top_k, expr, qvec)
+        if mode == "mmr":
+            return _mmr_hits(encoder, query, collection_name, top_k, expr, qvec)
+        lexical = get_bm25_index(collection_name)
+        if mode == "lexical":
+            return _lexical_hits(lexical, query, top_k, expr)
 
-    out = []
-    for h in result:
-        # h.distance e h.entity[...] (PyMilvus Hit)
-        score = float(getattr(h, "distance", 0.0))
-        entity = getattr(h, "entity", None)
-        if entity is None:  # fallback defensivo
-            continue
-        out.append(
-            {
-                "score": score,
-                "text": entity.get("text"),
-                "fonte": entity.get("fonte"),
-                "pagina": int(entity.get("pagina")),
-                "tipo_licenca": entity.get("tipo_licenca"),
-                "tipo_empreendimento": entity.get("tipo_empreendimento"),
-            }
-        )
-    return out
+        fetch = max(top_k * HYBRID_FETCH, top_k)
+        dense = _vector_hits(encoder, query, collection_name, fetch, expr, qvec)
+        sparse = _lexical_hits(lexical, query, fetch, expr)
+        if not sparse:
+            return dense[:top_k]
+        with span("rag.fuse"):
+            return rrf_fuse([dense, sparse], top_k)
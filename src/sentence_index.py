@@ -0,0 +1,224 @@
+# src/sentence_index.py
+"""
+Índice de frases para a resposta extrativa (LiteLocal), montado na ingestão,
+um por coleção (como o BM25), em DATA_DIR/sentences/<coleção>.sqlite.
+
+Para cada trecho indexado (chave = hash do texto normalizado) guarda as frases
+já separadas e a contagem de termos de cada uma (unigramas + bigramas, mesma
+tokenização do TfidfVectorizer padrão). Guarda também a frequência de documento
+(DF) de cada termo na coleção, de onde sai o IDF na hora da pergunta. Cada
+trecho conta quantas vezes está na coleção: remove_chunks() (páginas
+substituídas ou apagadas) desconta o DF quando a última cópia sai.
+
+Na pergunta, o escore de cada frase é um produto escalar esparso TF-IDF com
+normalização L2 — sem re-split por regex nem ajuste de vetorizador.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from .embed_cache import text_hash
+from .settings import SETTINGS
+
+_TOKEN = re.compile(r"(?u)\b\w\w+\b")
+
+# frases por trecho consideradas na resposta (evita explosão de candidatos)
+MAX_SENTENCES_PER_CONTEXT = 20
+
+Sentence = Tuple[str, Dict[str, int]]  # (frase, {termo: tf})
+
+
+def split_sentences(text: str) -> List[str]:
+    # split simples e robusto, evitando quebrar demais
+    text = re.sub(r"\s+", " ", text).strip()
+    sents = re.split(r"(?<=[.!?])\s+(?=[A-ZÁÂÃÀÉÊÍÓÔÕÚÜÇ])", text)
+    # fallback se vier muito curto
+    if len(sents) <= 1:
+        sents = re.split(r"[.;:\n]+", text)
+    return [s.strip() for s in sents if s.strip()]
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Unigramas + bigramas em minúsculas (como ngram_range=(1, 2) do sklearn)."""
+    toks = _TOKEN.findall(text.lower())
+    terms = toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]
+    return dict(Counter(terms))
+
+
+def analyze(text: str) -> List[Sentence]:
+    return [(s, term_counts(s)) for s in split_sentences(text)]
+
+
+def idf(n_docs: int, df: int) -> float:
+    # IDF suavizado do sklearn: ln((1 + n) / (1 + df)) + 1
+    return math.log((1 + n_docs) / (1 + df)) + 1.0
+
+
+def cosine_scores(question: Dict[str, int], sentences: Sequence[Dict[str, int]], idf_of) -> List[float]:
+    """Cosseno TF-IDF (L2) entre a pergunta e cada frase, por produto esparso."""
+    qw = {t: tf * idf_of(t) for t, tf in question.items()}
+    qn = math.sqrt(sum(w * w for w in qw.values())) or 1.0
+    out = []
+    for terms in sentences:
+        dot, norm = 0.0, 0.0
+        for t, tf in terms.items():
+            w = tf * idf_of(t)
+            norm += w * w
+            qv = qw.get(t)
+            if qv is not None:
+                dot += qv * w
+        out.append(dot / (qn * (math.sqrt(norm) or 1.0)))
+    return out
+
+
+class SentenceIndex:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (h TEXT PRIMARY KEY, sentences TEXT, refs INTEGER DEFAULT 1);
+            CREATE TABLE IF NOT EXISTS df (term TEXT PRIMARY KEY, n INTEGER);
+            CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER);
+            """
+        )
+        self._db.commit()
+
+    def add_chunks(self, texts: Iterable[str]) -> int:
+        """Separa e indexa os trechos novos (os já indexados ganham +1 cópia); retorna quantos eram novos."""
+        items: Dict[str, str] = {}
+        counts: Counter = Counter()
+        for t in texts:
+            if t:
+                h = text_hash(t)
+                items[h] = t
+                counts[h] += 1
+        if not counts:
+            return 0
+        with self._lock:
+            known = self._known(list(counts))
+            self._db.executemany("UPDATE chunks SET refs = refs + ? WHERE h = ?", [(counts[h], h) for h in known])
+            new = [(h, analyze(items[h])) for h in counts if h not in known]
+            if new:
+                self._db.executemany(
+                    "INSERT INTO chunks VALUES (?, ?, ?)",
+                    [(h, json.dumps(sents, ensure_ascii=False), counts[h]) for h, sents in new],
+                )
+                self._update_df([sents for _, sents in new], +1)
+            self._db.commit()
+            return len(new)
+
+    def remove_chunks(self, texts: Iterable[str]) -> int:
+        """Desconta uma cópia de cada trecho; os que saem de vez deixam o DF. Retorna quantos saíram."""
+        counts = Counter(text_hash(t) for t in texts if t)
+        if not counts:
+            return 0
+        with self._lock:
+            self._db.executemany("UPDATE chunks SET refs = refs - ? WHERE h = ?", [(n, h) for h, n in counts.items()])
+            gone: List[List[Sentence]] = []
+            hashes = list(counts)
+            for i in range(0, len(hashes), 500):
+                part = hashes[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(f"SELECT sentences FROM chunks WHERE refs <= 0 AND h IN ({marks})", part)
+                gone.extend(json.loads(raw) for (raw,) in rows)
+                self._db.execute(f"DELETE FROM chunks WHERE refs <= 0 AND h IN ({marks})", part)
+            if gone:
+                self._update_df(gone, -1)
+            self._db.commit()
+            return len(gone)
+
+    def _known(self, hashes: Sequence[str]) -> set:
+        known = set()
+        for i in range(0, len(hashes), 500):
+            part = list(hashes[i : i + 500])
+            marks = ",".join("?" * len(part))
+            known.update(h for (h,) in self._db.execute(f"SELECT h FROM chunks WHERE h IN ({marks})", part))
+        return known
+
+    def _update_df(self, chunks: Sequence[Sequence[Sentence]], sign: int) -> None:
+        df: Counter = Counter()
+        n_sents = 0
+        for sents in chunks:
+            n_sents += len(sents)
+            for _, terms in sents:
+                df.update(terms.keys())  # DF por frase (cada frase é um "documento")
+        self._db.executemany(
+            "INSERT INTO df VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET n = n + excluded.n",
+            [(t, sign * n) for t, n in df.items()],
+        )
+        if sign < 0:
+            self._db.executemany("DELETE FROM df WHERE term = ? AND n <= 0", [(t,) for t in df])
+        self._db.execute(
+            "INSERT INTO stats VALUES ('n_sentences', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (sign * n_sents,),
+        )
+
+    def lookup(self, texts: Sequence[str]) -> Dict[int, List[Sentence]]:
+        """{índice do trecho: frases analisadas} para os trechos já indexados."""
+        if not texts:
+            return {}
+        hashes = [text_hash(t) for t in texts]
+        found: Dict[str, List[Sentence]] = {}
+        with self._lock:
+            uniq = list(dict.fromkeys(hashes))
+            for i in range(0, len(uniq), 500):
+                part = uniq[i : i + 500]
+                marks = ",".join("?" * len(part))
+                for h, raw in self._db.execute(f"SELECT h, sentences FROM chunks WHERE h IN ({marks})", part):
+                    found[h] = [(s, terms) for s, terms in json.loads(raw)]
+        return {i: found[h] for i, h in enumerate(hashes) if h in found}
+
+    def document_frequencies(self, terms: Iterable[str]) -> Tuple[int, Dict[str, int]]:
+        terms = list(set(terms))
+        out: Dict[str, int] = {}
+        with self._lock:
+            row = self._db.execute("SELECT value FROM stats WHERE key = 'n_sentences'").fetchone()
+            for i in range(0, len(terms), 500):
+                part = terms[i : i + 500]
+                marks = ",".join("?" * len(part))
+                out.update(self._db.execute(f"SELECT term, n FROM df WHERE term IN ({marks})", part))
+        return (int(row[0]) if row else 0), out
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_INDEXES: Dict[str, SentenceIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def _path(collection_name: str) -> str:
+    safe = re.sub(r"[^\w.-]", "_", collection_name)
+    return os.path.join(SETTINGS.data_dir, "sentences", f"{safe}.sqlite")
+
+
+def get_sentence_index(collection_name: str) -> SentenceIndex:
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(collection_name)
+        if idx is None:
+            idx = _INDEXES[collection_name] = SentenceIndex(_path(collection_name))
+        return idx
+
+
+def drop_sentence_index(collection_name: str) -> None:
+    with _INDEXES_LOCK:
+        idx = _INDEXES.pop(collection_name, None)
+        if idx is not None:
+            idx.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(_path(collection_name) + suffix)
+            except FileNotFoundError:
+                pass
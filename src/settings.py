@@ -1,22 +1,40 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict
+
 from dotenv import load_dotenv
 
 # Carrega .env local (não atrapalha secrets do Streamlit Cloud)
 load_dotenv()
 
-# Tenta ler também do st.secrets quando estiver no Streamlit Cloud
-try:
-    import streamlit as st  # type: ignore
-    _SECRETS = dict(st.secrets)
-except Exception:
-    _SECRETS = {}
+_SECRETS: Dict[str, Any] | None = None
+_SECRETS_FILES = (os.path.join(".streamlit", "secrets.toml"), os.path.expanduser("~/.streamlit/secrets.toml"))
+
+
+def _secrets() -> Dict[str, Any]:
+    """
+    st.secrets, lido na primeira configuração pedida (nunca no import).
+    Só consulta o Streamlit se o app já o carregou ou se houver um
+    secrets.toml: a linha de comando e os benchmarks não pagam o import dele.
+    """
+    global _SECRETS
+    if _SECRETS is None:
+        _SECRETS = {}
+        if "streamlit" in sys.modules or any(os.path.isfile(f) for f in _SECRETS_FILES):
+            try:
+                import streamlit as st  # type: ignore
+                _SECRETS = dict(st.secrets)
+            except Exception:
+                pass
+    return _SECRETS
 
 def _get(name: str, default: str = "") -> str:
     """Busca primeiro em st.secrets, depois em variáveis de ambiente."""
-    v = _SECRETS.get(name)
+    v = _secrets().get(name)
     if v is not None and str(v).strip():
         return str(v)
     v = os.getenv(name)
@@ -24,23 +42,152 @@ def _get(name: str, default: str = "") -> str:
         return str(v)
     return default
 
+
+def _setting(name: str, default: str = "", cast: Callable[[str], Any] = str):
+    """Campo resolvido quando o Settings é criado (primeiro acesso ao SETTINGS)."""
+    return field(default_factory=lambda: cast(_get(name, default)))
+
+
+def _flag(v: str) -> bool:
+    return v.strip().lower() not in ("0", "false", "no", "off")
+
+
 @dataclass
 class Settings:
     # OpenAI
-    openai_api_key: str = _get("OPENAI_API_KEY", "")
+    openai_api_key: str = _setting("OPENAI_API_KEY", "")
+
+    # Embeddings OpenAI: requisições em paralelo, limites por requisição, novas tentativas
+    openai_embed_concurrency: int = _setting("OPENAI_EMBED_CONCURRENCY", "4", int)
+    openai_embed_max_inputs: int = _setting("OPENAI_EMBED_MAX_INPUTS", "128", int)
+    openai_embed_max_tokens: int = _setting("OPENAI_EMBED_MAX_TOKENS", "40000", int)
+    openai_max_retries: int = _setting("OPENAI_MAX_RETRIES", "6", int)
+
+    # Armazenamento vetorial: milvus | local | auto (Milvus se MILVUS_URI definido)
+    vector_backend: str = _setting("VECTOR_BACKEND", "auto")
+
+    # Busca: listas visitadas (Milvus e IVF local)
+    search_nprobe: int = _setting("SEARCH_NPROBE", "32", int)
+
+    # Índice aproximado do backend local: ivf | none; treina a partir de ANN_MIN_ROWS
+    local_ann: str = _setting("LOCAL_ANN", "ivf", lambda v: v.strip().lower())
+    ann_min_rows: int = _setting("ANN_MIN_ROWS", "50000", int)
+    ann_nlist: int = _setting("ANN_NLIST", "0", int)   # 0 = automático (~4·√n)
+
+    # Codificação dos vetores: float32 | float16 | int8 | binary (+ truncamento Matryoshka, 0 = não);
+    # no backend local, os RESCORE_FACTOR×top_k melhores são reavaliados em float32
+    vector_encoding: str = _setting("VECTOR_ENCODING", "float32")
+    vector_truncate_dim: int = _setting("VECTOR_TRUNCATE_DIM", "0", int)
+    rescore_factor: int = _setting("RESCORE_FACTOR", "4", int)
+
+    # Busca: vector | hybrid (vetorial + BM25, fusão por RRF) | lexical (só BM25)
+    # | mmr (vetorial diversificada: Maximal Marginal Relevance + junção de trechos vizinhos)
+    retrieval_mode: str = _setting("RETRIEVAL_MODE", "vector")
+    # MMR: peso da relevância frente à diversidade (1 = só relevância, 0 = só diversidade)
+    mmr_lambda: float = _setting("MMR_LAMBDA", "0.7", float)
+
+    # Perguntas concorrentes: embeddings e buscas juntados em lotes (espera em ms; 0 desativa)
+    query_batch_window_ms: float = _setting("QUERY_BATCH_WINDOW_MS", "5", float)
+    query_batch_max: int = _setting("QUERY_BATCH_MAX", "32", int)
+
+    # Cache semântico de respostas: cosseno mínimo entre perguntas, validade (s), entradas (0 desativa)
+    answer_cache_threshold: float = _setting("ANSWER_CACHE_THRESHOLD", "0.95", float)
+    answer_cache_ttl: float = _setting("ANSWER_CACHE_TTL", "86400", float)
+    answer_cache_max_entries: int = _setting("ANSWER_CACHE_MAX_ENTRIES", "1000", int)
+
+    # Orçamento de tokens do contexto enviado ao LLMCloud (trechos sem sobreposição, por escore).
+    # Todos os *_TOKENS contam com tiktoken (requirements.txt); sem ele, são estimativas de
+    # ~3 caracteres/token (src/tokens.py) e podem errar para mais ou para menos.
+    context_max_tokens: int = _setting("CONTEXT_MAX_TOKENS", "3000", int)
+
+    # Memória da conversa: mensagens mostradas na tela, mensagens literais no prompt/reescrita,
+    # tamanho do resumo acumulado (tokens) e reescrita das perguntas de continuação (1/0)
+    conversation_window: int = _setting("CONVERSATION_WINDOW", "20", int)
+    conversation_recent: int = _setting("CONVERSATION_RECENT", "4", int)
+    conversation_summary_tokens: int = _setting("CONVERSATION_SUMMARY_TOKENS", "300", int)
+    conversation_rewrite: bool = _setting("CONVERSATION_REWRITE", "1", _flag)
+    # dias sem mensagem nova até a conversa ser apagada do servidor (0 = guarda para sempre)
+    conversation_retention_days: float = _setting("CONVERSATION_RETENTION_DAYS", "30", float)
 
     # Zilliz/Milvus (Serverless)
-    milvus_uri: str = _get("MILVUS_URI", "")         # ex.: https://in03-...cloud.zilliz.com (SEM :19530)
-    milvus_token: str = _get("MILVUS_TOKEN", "")     # API Key (token) copiado em API Keys → View
-    milvus_collection: str = _get("MILVUS_COLLECTION", "docs_nupetr")
+    milvus_uri: str = _setting("MILVUS_URI", "")         # ex.: https://in03-...cloud.zilliz.com (SEM :19530)
+    milvus_token: str = _setting("MILVUS_TOKEN", "")     # API Key (token) copiado em API Keys → View
+    milvus_collection: str = _setting("MILVUS_COLLECTION", "docs_nupetr")
 
     # Campos legados (não usados em Serverless; apenas p/ dedicated)
-    milvus_user: str = _get("MILVUS_USER", "")
-    milvus_password: str = _get("MILVUS_PASSWORD", "")
-    milvus_db: str = _get("MILVUS_DB", "default")
+    milvus_user: str = _setting("MILVUS_USER", "")
+    milvus_password: str = _setting("MILVUS_PASSWORD", "")
+    milvus_db: str = _setting("MILVUS_DB", "default")
+
+    # Pool de encoders/clientes compartilhado entre sessões (entradas LRU)
+    pool_max_size: int = _setting("POOL_MAX_SIZE", "8", int)
+
+    # Diretório para caches/índices locais
+    data_dir: str = _setting("DATA_DIR", ".cache/nupetr")
+
+    # Extração de PDF em paralelo (processos; 0/1 = serial) e limite por página (s)
+    pdf_workers: int = _setting("PDF_WORKERS", "0", int)
+    pdf_page_timeout: float = _setting("PDF_PAGE_TIMEOUT", "30", float)
+
+    # Ingestões em segundo plano ao mesmo tempo (fila de jobs do app)
+    ingest_max_concurrent: int = _setting("INGEST_MAX_CONCURRENT", "1", int)
+
+    # Latência por etapa (src/tracing.py): 0 desliga; durações recentes guardadas por etapa
+    tracing: bool = _setting("TRACING", "1", _flag)
+    tracing_window: int = _setting("TRACING_WINDOW", "512", int)
+
+    # Quebra dos textos: structured (parágrafos/frases até CHUNK_MAX_TOKENS, sem cabeçalho/rodapé
+    # repetido) | chars (antigo: 1200 caracteres com 200 de sobreposição)
+    chunker: str = _setting("CHUNKER", "structured")
+    chunk_max_tokens: int = _setting("CHUNK_MAX_TOKENS", "400", int)
+
+    # Embeddings locais: torch (SentenceTransformer) | onnx (int8, onnxruntime) | auto (onnx se instalado);
+    # threads do onnxruntime (0 = padrão), lote, pasta dos modelos exportados e cosseno mínimo na conferência
+    local_embeddings: str = _setting("LOCAL_EMBEDDINGS", "auto", lambda v: v.strip().lower())
+    onnx_threads: int = _setting("ONNX_THREADS", "0", int)
+    onnx_batch_size: int = _setting("ONNX_BATCH_SIZE", "32", int)
+    onnx_model_dir: str = _setting("ONNX_MODEL_DIR", "")   # vazio = DATA_DIR/onnx
+    onnx_min_cosine: float = _setting("ONNX_MIN_COSINE", "0.99", float)
+
+    # Cache de embeddings em disco (linhas por modelo; 0 desativa)
+    embed_cache_max_rows: int = _setting("EMBED_CACHE_MAX_ROWS", "200000", int)
+    embed_cache_dtype: str = _setting("EMBED_CACHE_DTYPE", "float16")   # float16 | float32
 
     # (opcional) modo local
-    ollama_host: str = _get("OLLAMA_HOST", "http://localhost:11434")
-    ollama_model: str = _get("OLLAMA_MODEL", "llama3.1:8b")
+    ollama_host: str = _setting("OLLAMA_HOST", "http://localhost:11434")
+    ollama_model: str = _setting("OLLAMA_MODEL", "llama3.1:8b")
+
+
+_RESOLVED: Settings | None = None
+_RESOLVE_LOCK = threading.Lock()
+
+
+def _resolved() -> Settings:
+    global _RESOLVED
+    if _RESOLVED is None:
+        with _RESOLVE_LOCK:
+            if _RESOLVED is None:
+                _RESOLVED = Settings()
+    return _RESOLVED
+
+
+class _LazySettings:
+    """
+    Mesmo uso de um Settings (leitura e atribuição de campos), mas os valores
+    (st.secrets, ambiente) só são lidos no primeiro acesso — importar os
+    módulos do projeto não tem efeito colateral.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_resolved(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(_resolved(), name, value)
+
+    def __repr__(self) -> str:
+        return repr(_resolved())
+
 
-SETTINGS = Settings()
+SETTINGS: Settings = _LazySettings()  # type: ignore[assignment]
@@ -0,0 +1,40 @@
+# src/tokens.py
+"""
+Contagem e corte por tokens: tiktoken (cl100k_base, em requirements.txt) ou, se
+ele faltar, estimativa de ~3 chars/token — aí os orçamentos *_TOKENS são aproximados.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+# caracteres por token na estimativa sem tiktoken
+CHARS_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=1)
+def _tiktoken_encoding():
+    try:
+        import tiktoken  # opcional
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens do texto (tiktoken se instalado; senão estimativa ~3 chars/token)."""
+    enc = _tiktoken_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Primeiros `max_tokens` tokens do texto."""
+    if max_tokens <= 0:
+        return ""
+    enc = _tiktoken_encoding()
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+    return text[: max(0, max_tokens - 1) * CHARS_PER_TOKEN]
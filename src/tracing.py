@@ -0,0 +1,205 @@
+# src/tracing.py
+"""
+Latência por etapa, agregada no processo (embeddings, buscas, LLM, PDF…).
+
+    with span("search.vector", queries=1) as s:
+        ...
+        s.add("hits", len(hits))
+
+- cronômetro monotônico (perf_counter) por bloco; contadores livres
+  (tokens, bytes, itens) somados por etapa;
+- por etapa: histograma de buckets fixos (para o Prometheus) e uma janela
+  das últimas TRACING_WINDOW durações (p50/p95 recentes do painel);
+- exportação em JSON (snapshot/to_json) e no formato texto do Prometheus
+  (to_prometheus);
+- TRACING=0 desliga: span() devolve sempre o mesmo objeto vazio, sem
+  relógio nem lock.
+"""
+from __future__ import annotations
+
+import bisect
+import functools
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List
+
+import numpy as np
+
+from .settings import SETTINGS
+
+# limites superiores dos buckets (s), como os padrões dos clientes Prometheus
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "nupetr_stage"
+
+
+class _Stage:
+    __slots__ = ("count", "errors", "total", "buckets", "recent", "counters")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # o último é o +Inf
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.counters: Dict[str, float] = {}
+
+    def observe(self, seconds: float, counters: Dict[str, float], error: bool) -> None:
+        self.count += 1
+        self.errors += int(error)
+        self.total += seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+        for k, v in counters.items():
+            self.counters[k] = self.counters.get(k, 0.0) + v
+
+
+class Tracer:
+    def __init__(self, enabled: bool | None = None, window: int | None = None):
+        # None → TRACING / TRACING_WINDOW, lidos no primeiro uso
+        self._enabled = enabled
+        self._window = window
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self.started = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = bool(SETTINGS.tracing)
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self._enabled = bool(value)
+
+    @property
+    def window(self) -> int:
+        return int(SETTINGS.tracing_window if self._window is None else self._window)
+
+    def record(self, name: str, seconds: float, error: bool = False, **counters: float) -> None:
+        """Registra uma duração medida por fora (ex.: TTFT de um fluxo)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = _Stage(self.window)
+            stage.observe(float(seconds), counters, error)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Por etapa: contagem, erros, soma, p50/p95 recentes (ms), contadores e buckets."""
+        with self._lock:
+            stages = {
+                name: (s.count, s.errors, s.total, list(s.recent), dict(s.counters), list(s.buckets))
+                for name, s in self._stages.items()
+            }
+        out: Dict[str, Dict] = {}
+        for name, (count, errors, total, recent, counters, buckets) in sorted(stages.items()):
+            p50, p95 = np.percentile(recent, [50, 95]) if recent else (0.0, 0.0)
+            out[name] = {
+                "count": count,
+                "errors": errors,
+                "sum_s": round(total, 6),
+                "p50_ms": round(float(p50) * 1000, 3),
+                "p95_ms": round(float(p95) * 1000, 3),
+                "counters": counters,
+                "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], buckets)),
+            }
+        return out
+
+    def to_json(self) -> str:
+        return json.dumps({"since": self.started, "stages": self.snapshot()}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines: List[str] = [
+            f"# HELP {METRIC_PREFIX}_seconds Duração por etapa.",
+            f"# TYPE {METRIC_PREFIX}_seconds histogram",
+        ]
+        for name, s in snap.items():
+            acc = 0
+            for le, n in s["buckets"].items():
+                acc += n
+                lines.append(f'{METRIC_PREFIX}_seconds_bucket{{stage="{name}",le="{le}"}} {acc}')
+            lines.append(f'{METRIC_PREFIX}_seconds_sum{{stage="{name}"}} {s["sum_s"]}')
+            lines.append(f'{METRIC_PREFIX}_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_errors_total counter")
+        for name, s in snap.items():
+            lines.append(f'{METRIC_PREFIX}_errors_total{{stage="{name}"}} {s["errors"]}')
+        counters = sorted({k for s in snap.values() for k in s["counters"]})
+        for k in counters:
+            lines.append(f"# TYPE {METRIC_PREFIX}_{k}_total counter")
+            for name, s in snap.items():
+                if k in s["counters"]:
+                    lines.append(f'{METRIC_PREFIX}_{k}_total{{stage="{name}"}} {s["counters"][k]:g}')
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    __slots__ = ("_tracer", "name", "counters", "_t0")
+
+    def __init__(self, tracer: Tracer, name: str, counters: Dict[str, float]):
+        self._tracer = tracer
+        self.name = name
+        self.counters = counters
+
+    def add(self, key: str, value: float = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def __enter__(self) -> "Span":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._tracer.record(self.name, time.perf_counter() - self._t0, exc_type is not None, **self.counters)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def add(self, key: str, value: float = 1) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+TRACER = Tracer()
+
+
+def span(name: str, **counters: float):
+    """Context manager que cronometra o bloco na etapa `name`."""
+    if not TRACER.enabled:
+        return _NOOP
+    return Span(TRACER, name, counters)
+
+
+def traced(name: str) -> Callable:
+    """Decorador: a função inteira vira uma etapa."""
+
+    def wrap(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            with Span(TRACER, name, {}):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+def record(name: str, seconds: float, **counters: float) -> None:
+    TRACER.record(name, seconds, **counters)
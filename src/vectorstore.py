@@ -0,0 +1,88 @@
+# src/vectorstore.py
+"""
+Interface única de armazenamento vetorial usada pelo RAG.
+
+Todo backend expõe as mesmas funções, com a semântica de milvus_utils:
+    get_or_create_collection(name, dim) → coleção
+    drop_collection(name)
+    insert_records(col, <lista de dicts | 6 colunas>, flush=True)
+    delete_records(col, expr)
+    has_rows(col, expr=None) → há linha viva que satisfaz a expressão (consulta o próprio armazenamento)
+    search(col, qvec, top_k=5, expr=None, vectors=False) → hits com .distance e .entity.get(...)
+    search_many(col, qvecs, top_k=5, expr=None, vectors=False) → uma lista de hits por vetor
+    (vectors=True: .entity.get("embedding") quando o backend consegue devolvê-lo)
+
+O backend vem de SETTINGS.vector_backend: "milvus", "local" ou "auto"
+(Milvus se MILVUS_URI estiver definido; senão o armazenamento local em DATA_DIR).
+O drop_collection daqui também apaga os índices BM25 e de frases da coleção
+(src/bm25.py, src/sentence_index.py) e invalida as respostas em cache dela
+(src/answer_cache.py).
+"""
+from __future__ import annotations
+
+from types import ModuleType
+
+from .answer_cache import invalidate_collection
+from .bm25 import drop_bm25_index
+from .sentence_index import drop_sentence_index
+from .settings import SETTINGS
+
+
+def backend_name() -> str:
+    name = (SETTINGS.vector_backend or "auto").strip().lower()
+    if name == "auto":
+        return "milvus" if SETTINGS.milvus_uri else "local"
+    if name not in ("milvus", "local"):
+        raise ValueError(f"VECTOR_BACKEND inválido: {name!r} (use milvus, local ou auto).")
+    return name
+
+
+def _backend() -> ModuleType:
+    if backend_name() == "local":
+        from . import local_store
+
+        return local_store
+    from . import milvus_utils
+
+    return milvus_utils
+
+
+def _backend_of(col) -> ModuleType:
+    from . import local_store
+
+    if isinstance(col, local_store.LocalCollection):
+        return local_store
+    from . import milvus_utils
+
+    return milvus_utils
+
+
+def get_or_create_collection(name: str, dim: int):
+    return _backend().get_or_create_collection(name, dim)
+
+
+def drop_collection(name: str) -> None:
+    _backend().drop_collection(name)
+    drop_bm25_index(name)
+    drop_sentence_index(name)
+    invalidate_collection(name)
+
+
+def insert_records(col, *args, flush: bool = True) -> None:
+    _backend_of(col).insert_records(col, *args, flush=flush)
+
+
+def delete_records(col, expr: str) -> None:
+    _backend_of(col).delete_records(col, expr)
+
+
+def has_rows(col, expr: str | None = None) -> bool:
+    return _backend_of(col).has_rows(col, expr)
+
+
+def search(col, qvec, top_k: int = 5, expr: str | None = None, vectors: bool = False):
+    return _backend_of(col).search(col, qvec, top_k=top_k, expr=expr, vectors=vectors)
+
+
+def search_many(col, qvecs, top_k: int = 5, expr: str | None = None, vectors: bool = False):
+    return _backend_of(col).search_many(col, qvecs, top_k=top_k, expr=expr, vectors=vectors)